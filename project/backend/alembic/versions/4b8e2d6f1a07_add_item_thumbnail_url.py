@@ -0,0 +1,28 @@
+"""add items.thumbnail_url
+
+Revision ID: 4b8e2d6f1a07
+Revises: 2c7f5a9d3e14
+Create Date: 2026-10-18 20:03:51.218664
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b8e2d6f1a07'
+down_revision: Union[str, Sequence[str], None] = '2c7f5a9d3e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('items', sa.Column('thumbnail_url', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('items', 'thumbnail_url')
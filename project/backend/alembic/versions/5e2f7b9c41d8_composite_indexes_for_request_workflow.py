@@ -0,0 +1,79 @@
+"""composite indexes for request workflow
+
+Revision ID: 5e2f7b9c41d8
+Revises: c3d8a1f09e6b
+Create Date: 2026-10-18 13:05:47.904113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2f7b9c41d8'
+down_revision: Union[str, Sequence[str], None] = 'c3d8a1f09e6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Indexes are built and dropped CONCURRENTLY so the tables stay writable;
+# that can't happen inside a transaction, hence the autocommit blocks.
+
+# single-column indexes that duplicate the primary key, are never filtered on,
+# or are covered by the composites below
+DROPPED = [
+    'ix_users_id',
+    'ix_items_id',
+    'ix_items_name',
+    'ix_items_serial_number',
+    'ix_items_photo_url',
+    'ix_items_type',
+    'ix_items_status',
+    'ix_items_location',
+    'ix_items_condition',
+    'ix_requests_id',
+    'ix_requests_status',
+]
+
+CREATED = {
+    'ix_items_type_id': 'items (type, id)',
+    'ix_items_status_id': 'items (status, id)',
+    'ix_items_location_id': 'items (location, id)',
+    'ix_items_condition_id': 'items (condition, id)',
+    'ix_requests_user_id_requested_at': 'requests (user_id, requested_at DESC)',
+    'ix_requests_item_id_status': 'requests (item_id, status)',
+    'ix_requests_status_requested_at': 'requests (status, requested_at)',
+}
+
+RESTORED = {
+    'ix_users_id': 'users (id)',
+    'ix_items_id': 'items (id)',
+    'ix_items_name': 'items (name)',
+    'ix_items_serial_number': 'items (serial_number)',
+    'ix_items_photo_url': 'items (photo_url)',
+    'ix_items_type': 'items (type)',
+    'ix_items_status': 'items (status)',
+    'ix_items_location': 'items (location)',
+    'ix_items_condition': 'items (condition)',
+    'ix_requests_id': 'requests (id)',
+    'ix_requests_status': 'requests (status)',
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, target in CREATED.items():
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}')
+        for name in DROPPED:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, target in RESTORED.items():
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}')
+        for name in CREATED:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
@@ -0,0 +1,46 @@
+"""add stat_counters
+
+Revision ID: 7a3c9e214b6f
+Revises: 5e2f7b9c41d8
+Create Date: 2026-10-18 14:02:19.318650
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3c9e214b6f'
+down_revision: Union[str, Sequence[str], None] = '5e2f7b9c41d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stat_counters',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name', 'key')
+    )
+    # initial counts; from here on the application keeps them current
+    op.execute("INSERT INTO stat_counters (name, key, count) SELECT 'users', '', count(*) FROM users")
+    op.execute("INSERT INTO stat_counters (name, key, count) SELECT 'items', '', count(*) FROM items")
+    op.execute("INSERT INTO stat_counters (name, key, count) SELECT 'requests', '', count(*) FROM requests")
+    for name, table, column in (
+        ('items.status', 'items', 'status'),
+        ('items.location', 'items', 'location'),
+        ('requests.status', 'requests', 'status'),
+    ):
+        op.execute(
+            f"INSERT INTO stat_counters (name, key, count) "
+            f"SELECT '{name}', coalesce({column}, ''), count(*) FROM {table} GROUP BY coalesce({column}, '')"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('stat_counters')
@@ -0,0 +1,48 @@
+"""add item_events ledger
+
+Revision ID: 8d4e1f6a2b93
+Revises: 7a3c9e214b6f
+Create Date: 2026-10-18 16:41:07.512203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4e1f6a2b93'
+down_revision: Union[str, Sequence[str], None] = '7a3c9e214b6f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('item_events',
+    sa.Column('id', sa.BigInteger(), sa.Identity(), nullable=False),
+    sa.Column('occurred_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('previous_status', sa.String(), nullable=True),
+    sa.Column('location', sa.String(), nullable=True),
+    sa.Column('request_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id', 'occurred_at'),
+    postgresql_partition_by='RANGE (occurred_at)',
+    )
+    op.create_index('ix_item_events_item_id_occurred_at', 'item_events', ['item_id', sa.text('occurred_at DESC'), sa.text('id DESC')], unique=False)
+    op.create_index('ix_item_events_occurred_at', 'item_events', ['occurred_at'], unique=False, postgresql_using='brin')
+    # monthly partitions are added by ledger.ensure_partitions() at startup and by the retention job
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE TABLE item_events_default PARTITION OF item_events DEFAULT')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_item_events_occurred_at', table_name='item_events', postgresql_using='brin')
+    op.drop_index('ix_item_events_item_id_occurred_at', table_name='item_events')
+    # partitions go with their parent
+    op.drop_table('item_events')
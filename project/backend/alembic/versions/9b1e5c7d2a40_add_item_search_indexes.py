@@ -0,0 +1,44 @@
+"""add item search indexes
+
+Revision ID: 9b1e5c7d2a40
+Revises: 6ca6675552f6
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1e5c7d2a40'
+down_revision: Union[str, Sequence[str], None] = '6ca6675552f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        ALTER TABLE items ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('simple',
+                coalesce(name, '') || ' ' || coalesce(type, '') || ' ' ||
+                coalesce(serial_number, '') || ' ' || coalesce(location, ''))
+        ) STORED
+        """
+    )
+    op.create_index('ix_items_search_vector', 'items', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index(
+        'ix_items_serial_number_prefix', 'items', ['serial_number'], unique=False,
+        postgresql_ops={'serial_number': 'text_pattern_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_items_serial_number_prefix', table_name='items')
+    op.drop_index('ix_items_search_vector', table_name='items')
+    op.drop_column('items', 'search_vector')
@@ -0,0 +1,50 @@
+"""add report jobs
+
+Revision ID: b7e4c2a9d157
+Revises: f3b9d2a6c815
+Create Date: 2026-10-18 16:02:41.915204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4c2a9d157'
+down_revision: Union[str, Sequence[str], None] = 'f3b9d2a6c815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('report_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('params', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('requested_by', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('worker', sa.String(), nullable=True),
+    sa.Column('rows', sa.Integer(), nullable=True),
+    sa.Column('file_name', sa.String(), nullable=True),
+    sa.Column('file_bytes', sa.BigInteger(), nullable=True),
+    sa.Column('summary', sa.String(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_report_jobs_queued', 'report_jobs', ['id'], unique=False, postgresql_where=sa.text("status = 'queued'"))
+    op.create_index('ix_report_jobs_status_heartbeat_at', 'report_jobs', ['status', 'heartbeat_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_report_jobs_status_heartbeat_at', table_name='report_jobs')
+    op.drop_index('ix_report_jobs_queued', table_name='report_jobs', postgresql_where=sa.text("status = 'queued'"))
+    op.drop_table('report_jobs')
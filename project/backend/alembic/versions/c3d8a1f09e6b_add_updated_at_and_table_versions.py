@@ -0,0 +1,42 @@
+"""add updated_at and table_versions
+
+Revision ID: c3d8a1f09e6b
+Revises: 9b1e5c7d2a40
+Create Date: 2026-10-18 10:41:05.532817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d8a1f09e6b'
+down_revision: Union[str, Sequence[str], None] = '9b1e5c7d2a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('users', 'items', 'requests'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    table_versions = op.create_table('table_versions',
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_versions, [
+        {'table_name': 'users', 'version': 0},
+        {'table_name': 'items', 'version': 0},
+        {'table_name': 'requests', 'version': 0},
+    ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('table_versions')
+    for table in ('requests', 'items', 'users'):
+        op.drop_column(table, 'updated_at')
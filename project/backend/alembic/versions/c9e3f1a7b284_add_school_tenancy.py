@@ -0,0 +1,151 @@
+"""add school tenancy
+
+Revision ID: c9e3f1a7b284
+Revises: b7e4c2a9d157
+Create Date: 2026-10-18 21:37:52.604318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9e3f1a7b284'
+down_revision: Union[str, Sequence[str], None] = 'b7e4c2a9d157'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every tenant table gets school_id, and every existing row belongs to the
+# default school (id 1). PostgreSQL only; the tables stay writable:
+#
+#   1. the column is added with a constant default, which is stored in the
+#      catalog, so nothing is rewritten
+#   2. foreign keys are added NOT VALID and validated afterwards, which scans
+#      the table without blocking writes
+#   3. the school_id-led indexes are built CONCURRENTLY (item_events is
+#      partitioned: the parent index is created ON ONLY, each partition's
+#      CONCURRENTLY, then attached), and only then the indexes they replace
+#      are dropped
+#
+# table_versions and stat_counters hold a few dozen rows; their primary keys
+# are swapped in place. The downgrade only succeeds while every row still
+# belongs to the default school.
+
+DEFAULT_SCHOOL_ID = 1
+
+# table -> has a foreign key to schools (item_events has none, like its other ids)
+TENANT_TABLES = {
+    'users': True,
+    'items': True,
+    'requests': True,
+    'item_events': False,
+    'table_versions': True,
+    'tombstones': True,
+    'stat_counters': True,
+    'report_jobs': True,
+}
+
+NEW_INDEXES = {
+    'ix_users_school_id_username': 'UNIQUE INDEX {name} ON users (school_id, username)',
+    'ix_users_school_id_email': 'UNIQUE INDEX {name} ON users (school_id, email)',
+    'ix_users_school_id_version_id': 'INDEX {name} ON users (school_id, version, id)',
+    'ix_items_school_id_id': 'INDEX {name} ON items (school_id, id)',
+    'ix_items_school_id_type_id': 'INDEX {name} ON items (school_id, type_id, id)',
+    'ix_items_school_id_status_id': 'INDEX {name} ON items (school_id, status, id)',
+    'ix_items_school_id_location_id': 'INDEX {name} ON items (school_id, location_id, id)',
+    'ix_items_school_id_condition_id': 'INDEX {name} ON items (school_id, condition, id)',
+    'ix_items_school_id_version_id': 'INDEX {name} ON items (school_id, version, id)',
+    'ix_requests_school_id_requested_at': 'INDEX {name} ON requests (school_id, requested_at DESC, id DESC)',
+    'ix_requests_school_id_status_requested_at': 'INDEX {name} ON requests (school_id, status, requested_at)',
+    'ix_requests_school_id_version_id': 'INDEX {name} ON requests (school_id, version, id)',
+    'ix_tombstones_school_id_table_name_version': 'INDEX {name} ON tombstones (school_id, table_name, version, row_id)',
+}
+
+OLD_INDEXES = {
+    'ix_users_username': 'UNIQUE INDEX {name} ON users (username)',
+    'ix_users_email': 'UNIQUE INDEX {name} ON users (email)',
+    'ix_users_version_id': 'INDEX {name} ON users (version, id)',
+    'ix_items_type_id': 'INDEX {name} ON items (type_id, id)',
+    'ix_items_status_id': 'INDEX {name} ON items (status, id)',
+    'ix_items_location_id': 'INDEX {name} ON items (location_id, id)',
+    'ix_items_condition_id': 'INDEX {name} ON items (condition, id)',
+    'ix_items_version_id': 'INDEX {name} ON items (version, id)',
+    'ix_requests_status_requested_at': 'INDEX {name} ON requests (status, requested_at)',
+    'ix_requests_version_id': 'INDEX {name} ON requests (version, id)',
+    'ix_tombstones_table_name_version': 'INDEX {name} ON tombstones (table_name, version, row_id)',
+}
+
+EVENTS_INDEX = 'ix_item_events_school_id_occurred_at'
+EVENTS_COLUMNS = '(school_id, occurred_at DESC, id DESC)'
+
+PRIMARY_KEYS = {
+    'table_versions': (['table_name'], ['school_id', 'table_name']),
+    'stat_counters': (['name', 'key'], ['school_id', 'name', 'key']),
+}
+
+
+def _partitions() -> list[str]:
+    return list(op.get_bind().execute(sa.text(
+        "SELECT child.relname FROM pg_inherits"
+        " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+        " JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+        " WHERE parent.relname = 'item_events'"
+    )).scalars())
+
+
+def _swap_primary_key(table: str, columns: list[str]) -> None:
+    op.drop_constraint(f'{table}_pkey', table, type_='primary')
+    op.create_primary_key(f'{table}_pkey', table, columns)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('schools',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.execute(f"INSERT INTO schools (id, name) VALUES ({DEFAULT_SCHOOL_ID}, 'Default school')")
+    op.execute("SELECT setval(pg_get_serial_sequence('schools', 'id'), (SELECT max(id) FROM schools))")
+    for table, foreign_key in TENANT_TABLES.items():
+        op.add_column(table, sa.Column('school_id', sa.Integer(), server_default=str(DEFAULT_SCHOOL_ID), nullable=False))
+        if foreign_key:
+            op.create_foreign_key(f'{table}_school_id_fkey', table, 'schools', ['school_id'], ['id'], postgresql_not_valid=True)
+    for table, (_, columns) in PRIMARY_KEYS.items():
+        _swap_primary_key(table, columns)
+    op.execute(f'CREATE INDEX IF NOT EXISTS {EVENTS_INDEX} ON ONLY item_events {EVENTS_COLUMNS}')
+
+    with op.get_context().autocommit_block():
+        for table, foreign_key in TENANT_TABLES.items():
+            if foreign_key:
+                op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {table}_school_id_fkey')
+        for name, definition in NEW_INDEXES.items():
+            op.execute('CREATE ' + definition.format(name=name).replace('INDEX', 'INDEX CONCURRENTLY IF NOT EXISTS', 1))
+        for partition in _partitions():
+            index = f'{partition}_school_id_occurred_at_idx'
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {partition} {EVENTS_COLUMNS}')
+            op.execute(f'ALTER INDEX {EVENTS_INDEX} ATTACH PARTITION {index}')
+        for name in OLD_INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, definition in OLD_INDEXES.items():
+            op.execute('CREATE ' + definition.format(name=name).replace('INDEX', 'INDEX CONCURRENTLY IF NOT EXISTS', 1))
+        for name in NEW_INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+    # the partitions' indexes go with their parent
+    op.execute(f'DROP INDEX IF EXISTS {EVENTS_INDEX}')
+    for table, (columns, _) in PRIMARY_KEYS.items():
+        _swap_primary_key(table, columns)
+    for table, foreign_key in TENANT_TABLES.items():
+        if foreign_key:
+            op.drop_constraint(f'{table}_school_id_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'school_id')
+    op.drop_table('schools')
@@ -0,0 +1,298 @@
+"""native enums for status/condition, lookup tables for type/location
+
+Revision ID: e5a1c7b3d920
+Revises: 4b8e2d6f1a07
+Create Date: 2026-10-18 21:37:12.640518
+
+"""
+from itertools import chain
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1c7b3d920'
+down_revision: Union[str, Sequence[str], None] = '4b8e2d6f1a07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# items.status/condition and requests.status become native enums, items.type
+# and items.location smallint ids into item_types/locations (see lookups.py).
+# PostgreSQL only; the tables stay writable by the running app throughout:
+#
+#   1. new columns are added next to the old ones, and a trigger fills them
+#      from the old columns on every insert and update
+#   2. existing rows are backfilled BATCH_SIZE ids at a time, one short
+#      transaction each, by touching them so the trigger runs
+#   3. the indexes on the new columns are built CONCURRENTLY
+#   4. one short transaction drops the old columns and renames the new ones;
+#      only this step takes exclusive locks, and it scans nothing
+#
+# Existing values are matched to the labels ignoring case and surrounding
+# blanks, plus the ALIASES below; "" becomes NULL. Anything else aborts the
+# migration before it changes anything, listing the values to fix first.
+#
+# The downgrade restores the string columns in place, holding the locks.
+
+BATCH_SIZE = 10000
+LOCK_TIMEOUT = '5s'
+
+STATUS_LABELS = ['Available', 'Checked Out', 'Under Repair', 'Retired', 'Lost']
+CONDITION_LABELS = ['New', 'Good', 'Fair', 'Poor', 'Broken']
+REQUEST_STATUS_LABELS = ['Pending', 'Approved', 'Denied']
+
+ALIASES = {
+    'item_status': {
+        'checked_out': 'Checked Out',
+        'checked-out': 'Checked Out',
+        'in maintenance': 'Under Repair',
+        'maintenance': 'Under Repair',
+        'under_repair': 'Under Repair',
+        'missing': 'Lost',
+    },
+    'item_condition': {},
+    'request_status': {},
+}
+
+# (table, old column, staging column, enum type, labels)
+ENUM_COLUMNS = [
+    ('items', 'status', 'status_new', 'item_status', STATUS_LABELS),
+    ('items', 'condition', 'condition_new', 'item_condition', CONDITION_LABELS),
+    ('requests', 'status', 'status_new', 'request_status', REQUEST_STATUS_LABELS),
+]
+# (old column, id column, lookup table)
+LOOKUP_COLUMNS = [
+    ('type', 'type_id', 'item_types'),
+    ('location', 'location_id', 'locations'),
+]
+
+# built on the staging columns before the swap; renamed to these names by it
+ITEMS_INDEXES = {
+    'ix_items_type_id': '(type_id, id)',
+    'ix_items_status_id': '(status_new, id)',
+    'ix_items_location_id': '(location_id, id)',
+    'ix_items_condition_id': '(condition_new, id)',
+    'ix_items_search_vector': 'USING gin (search_vector_new)',
+}
+REQUESTS_INDEXES = {
+    'ix_requests_item_id_status': '(item_id, status_new)',
+    'ix_requests_status_requested_at': '(status_new, requested_at)',
+}
+
+SEARCH_TEXT = (
+    "to_tsvector('simple', coalesce({p}name, '') || ' ' || coalesce({p}type, '') || ' ' || "
+    "coalesce({p}serial_number, '') || ' ' || coalesce({p}location, ''))"
+)
+
+# kept in step with search.PG_SEARCH_VECTOR_FUNCTION
+SEARCH_VECTOR_FUNCTION = """
+    CREATE OR REPLACE FUNCTION items_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('simple',
+            coalesce(NEW.name, '') || ' ' ||
+            coalesce((SELECT name FROM item_types WHERE id = NEW.type_id), '') || ' ' ||
+            coalesce(NEW.serial_number, '') || ' ' ||
+            coalesce((SELECT name FROM locations WHERE id = NEW.location_id), ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def label_for(enum_name: str, labels: list[str], value: str) -> Union[str, None]:
+    wanted = value.strip().lower()
+    if not wanted:
+        return None
+    mapping = {label.lower(): label for label in labels}
+    mapping.update(ALIASES[enum_name])
+    if wanted not in mapping:
+        raise KeyError(value)
+    return mapping[wanted]
+
+
+def label_sql(enum_name: str, labels: list[str], column: str) -> str:
+    # the same mapping as label_for, in SQL; other values fail the enum cast
+    mapping = {label.lower(): label for label in labels}
+    mapping.update(ALIASES[enum_name])
+    whens = ' '.join(
+        f"WHEN {sa.literal(old).compile(compile_kwargs={'literal_binds': True})} "
+        f"THEN '{label}'::{enum_name}"
+        for old, label in mapping.items()
+    )
+    return f"CASE lower(btrim({column})) WHEN '' THEN NULL {whens} ELSE {column}::{enum_name} END"
+
+
+def check_values(conn) -> None:
+    unmapped = []
+    for table, column, _, enum_name, labels in ENUM_COLUMNS:
+        values = conn.execute(sa.text(f'SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL')).scalars()
+        for value in values:
+            try:
+                label = label_for(enum_name, labels, value)
+            except KeyError:
+                unmapped.append(f'{table}.{column} = {value!r}')
+                continue
+            if label is None and table == 'requests':
+                unmapped.append(f'{table}.{column} = {value!r}')
+    if unmapped:
+        raise RuntimeError(
+            'Cannot convert these values, update or map them (ALIASES) first: ' + ', '.join(sorted(unmapped))
+        )
+
+
+def sync_function(table: str) -> str:
+    lines = []
+    for t, column, staging, enum_name, labels in ENUM_COLUMNS:
+        if t == table:
+            lines.append(f'NEW.{staging} := {label_sql(enum_name, labels, f"NEW.{column}")};')
+    if table == 'items':
+        for column, id_column, lookup in LOOKUP_COLUMNS:
+            lines.append(
+                f"""
+                IF NEW.{column} IS NULL THEN
+                    NEW.{id_column} := NULL;
+                ELSE
+                    SELECT id INTO NEW.{id_column} FROM {lookup} WHERE name = NEW.{column};
+                    IF NEW.{id_column} IS NULL THEN
+                        INSERT INTO {lookup} (name) VALUES (NEW.{column}) ON CONFLICT (name) DO NOTHING;
+                        SELECT id INTO NEW.{id_column} FROM {lookup} WHERE name = NEW.{column};
+                    END IF;
+                END IF;"""
+            )
+        lines.append(f"NEW.search_vector_new := {SEARCH_TEXT.format(p='NEW.')};")
+    body = '\n        '.join(lines)
+    return f"""
+    CREATE FUNCTION {table}_migrate_e5a1() RETURNS trigger AS $$
+    BEGIN
+        {body}
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """
+
+
+def backfill(conn, table: str, touch: str) -> None:
+    low, high = conn.execute(sa.text(f'SELECT min(id), max(id) FROM {table}')).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        conn.execute(
+            sa.text(f'UPDATE {table} SET {touch} = {touch} WHERE id >= :start AND id < :end'),
+            {'start': start, 'end': start + BATCH_SIZE},
+        )
+
+
+def merge_counters(conn, name: str, enum_name: str, labels: list[str]) -> None:
+    # stat_counters keys are the stored strings; fold old spellings into their label
+    rows = conn.execute(
+        sa.text('SELECT key, count FROM stat_counters WHERE name = :name FOR UPDATE'), {'name': name}
+    ).all()
+    for key, count in rows:
+        label = label_for(enum_name, labels, key) if key else None
+        label = label or ''
+        if label == key:
+            continue
+        conn.execute(sa.text('DELETE FROM stat_counters WHERE name = :name AND key = :key'), {'name': name, 'key': key})
+        conn.execute(
+            sa.text(
+                'INSERT INTO stat_counters (name, key, count) VALUES (:name, :key, :count) '
+                'ON CONFLICT (name, key) DO UPDATE SET count = stat_counters.count + excluded.count'
+            ),
+            {'name': name, 'key': label, 'count': count},
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        raise RuntimeError('e5a1c7b3d920 supports PostgreSQL only; recreate SQLite databases with reset_db.py')
+    check_values(conn)
+
+    # 1. staging columns and sync triggers
+    for enum_name, labels in (('item_status', STATUS_LABELS), ('item_condition', CONDITION_LABELS), ('request_status', REQUEST_STATUS_LABELS)):
+        sa.Enum(*labels, name=enum_name).create(conn)
+    for _, _, lookup in LOOKUP_COLUMNS:
+        op.create_table(lookup,
+        sa.Column('id', sa.SmallInteger(), sa.Identity(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+        )
+    for column, _, lookup in LOOKUP_COLUMNS:
+        op.execute(f'INSERT INTO {lookup} (name) SELECT DISTINCT {column} FROM items WHERE {column} IS NOT NULL')
+    for column, id_column, _ in LOOKUP_COLUMNS:
+        op.add_column('items', sa.Column(id_column, sa.SmallInteger(), nullable=True))
+    for table, _, staging, enum_name, _ in ENUM_COLUMNS:
+        op.execute(f'ALTER TABLE {table} ADD COLUMN {staging} {enum_name}')
+    op.add_column('items', sa.Column('search_vector_new', postgresql.TSVECTOR(), nullable=True))
+    for table in ('items', 'requests'):
+        op.execute(sync_function(table))
+        op.execute(
+            f'CREATE TRIGGER {table}_migrate_e5a1 BEFORE INSERT OR UPDATE ON {table} '
+            f'FOR EACH ROW EXECUTE FUNCTION {table}_migrate_e5a1()'
+        )
+
+    with op.get_context().autocommit_block():
+        # 2. backfill; each batch commits on its own
+        backfill(conn, 'items', 'name')
+        backfill(conn, 'requests', 'status')
+        # 3. indexes, under temporary names
+        for name, target in ITEMS_INDEXES.items():
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}_e5a1 ON items {target}')
+        for name, target in REQUESTS_INDEXES.items():
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}_e5a1 ON requests {target}')
+        # requests.status is NOT NULL; a validated check lets SET NOT NULL skip its scan
+        op.execute('ALTER TABLE requests ADD CONSTRAINT requests_status_new_not_null CHECK (status_new IS NOT NULL) NOT VALID')
+        op.execute('ALTER TABLE requests VALIDATE CONSTRAINT requests_status_new_not_null')
+        for column, id_column, lookup in LOOKUP_COLUMNS:
+            op.execute(f'ALTER TABLE items ADD CONSTRAINT items_{id_column}_fkey FOREIGN KEY ({id_column}) REFERENCES {lookup} (id) NOT VALID')
+            op.execute(f'ALTER TABLE items VALIDATE CONSTRAINT items_{id_column}_fkey')
+
+    # 4. swap, in the migration's transaction once the block above ends; give
+    # up rather than queue the app's queries behind a lock we cannot get
+    op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+    op.execute('LOCK TABLE items, requests IN ACCESS EXCLUSIVE MODE')
+    for table in ('items', 'requests'):
+        op.execute(f'DROP TRIGGER {table}_migrate_e5a1 ON {table}')
+        op.execute(f'DROP FUNCTION {table}_migrate_e5a1()')
+    # the old generated vector and the old indexes go with the columns
+    op.execute('ALTER TABLE items DROP COLUMN search_vector, DROP COLUMN type, DROP COLUMN location, DROP COLUMN status, DROP COLUMN condition')
+    op.execute('ALTER TABLE requests DROP COLUMN status')
+    for table, column, staging, _, _ in ENUM_COLUMNS:
+        op.execute(f'ALTER TABLE {table} RENAME COLUMN {staging} TO {column}')
+    op.execute('ALTER TABLE items RENAME COLUMN search_vector_new TO search_vector')
+    op.execute('ALTER TABLE requests ALTER COLUMN status SET NOT NULL')
+    op.execute('ALTER TABLE requests DROP CONSTRAINT requests_status_new_not_null')
+    for name in chain(ITEMS_INDEXES, REQUESTS_INDEXES):
+        op.execute(f'ALTER INDEX {name}_e5a1 RENAME TO {name}')
+    op.execute(SEARCH_VECTOR_FUNCTION)
+    op.execute(
+        'CREATE TRIGGER items_search_vector BEFORE INSERT OR UPDATE OF name, type_id, serial_number, location_id '
+        'ON items FOR EACH ROW EXECUTE FUNCTION items_search_vector()'
+    )
+    merge_counters(conn, 'items.status', 'item_status', STATUS_LABELS)
+    merge_counters(conn, 'requests.status', 'request_status', REQUEST_STATUS_LABELS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER IF EXISTS items_search_vector ON items')
+    op.execute('DROP FUNCTION IF EXISTS items_search_vector()')
+    op.execute('ALTER TABLE items DROP COLUMN search_vector')
+    for table, column, _, _, _ in ENUM_COLUMNS:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE varchar USING {column}::text')
+    for column, id_column, lookup in LOOKUP_COLUMNS:
+        op.add_column('items', sa.Column(column, sa.String(), nullable=True))
+        op.execute(f'UPDATE items SET {column} = {lookup}.name FROM {lookup} WHERE {lookup}.id = items.{id_column}')
+        op.drop_column('items', id_column)  # with its index and foreign key
+        op.drop_table(lookup)
+    for enum_name in ('item_status', 'item_condition', 'request_status'):
+        op.execute(f'DROP TYPE {enum_name}')
+    op.execute(f'ALTER TABLE items ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({SEARCH_TEXT.format(p="")}) STORED')
+    op.create_index('ix_items_search_vector', 'items', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_items_type_id', 'items', ['type', 'id'], unique=False)
+    op.create_index('ix_items_location_id', 'items', ['location', 'id'], unique=False)
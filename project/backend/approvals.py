@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import Item, Request, RequestStatus, StatusOptions
+
+# Request approval engine.
+#
+# Reviews run in a single transaction. Pending requests are locked with
+# SELECT ... FOR UPDATE SKIP LOCKED so two admins reviewing the same request
+# don't both act on it, and the items being checked out are locked the same
+# way before their status is read. An item is only flipped to Checked Out if
+# it is still Available once its row lock is held, which rules out double
+# checkouts under concurrent approvals. Rows another transaction holds are
+# skipped and reported rather than waited on.
+
+# accepted spellings for the decision, mapped onto RequestStatus
+DECISIONS = {
+    "approve": RequestStatus.approved,
+    "approved": RequestStatus.approved,
+    "deny": RequestStatus.denied,
+    "denied": RequestStatus.denied,
+    "decline": RequestStatus.denied,
+    "declined": RequestStatus.denied,
+    "reject": RequestStatus.denied,
+    "rejected": RequestStatus.denied,
+}
+
+def parse_decision(value: str) -> Optional[RequestStatus]:
+    return DECISIONS.get(str(value).strip().lower())
+
+def review_requests(db: Session, request_ids: list[int], decision: RequestStatus) -> dict:
+    """
+    Approve or deny the given requests. Does not commit; the caller owns the
+    transaction. Returns the ids that were reviewed and, for every other id,
+    the reason it was skipped.
+    """
+    ids = sorted(set(request_ids))
+    pending = db.execute(
+        select(Request)
+        .where(Request.id.in_(ids), Request.status == RequestStatus.pending.value)
+        .order_by(Request.id)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+
+    locked_ids = {req.id for req in pending}
+    skipped = [{"id": request_id, "reason": "not found, not pending or being reviewed"} for request_id in ids if request_id not in locked_ids]
+    reviewed = []
+    now = datetime.now(timezone.utc)
+
+    items = {}
+    if decision == RequestStatus.approved and pending:
+        item_ids = sorted({req.item_id for req in pending})
+        items = {
+            item.id: item
+            for item in db.execute(
+                select(Item).where(Item.id.in_(item_ids)).order_by(Item.id).with_for_update(skip_locked=True)
+            ).scalars()
+        }
+
+    for req in pending:
+        if decision == RequestStatus.approved:
+            item = items.get(req.item_id)
+            if item is None:
+                skipped.append({"id": req.id, "reason": "item is locked by another review or missing"})
+                continue
+            if (item.status or StatusOptions.available.value) != StatusOptions.available.value:
+                skipped.append({"id": req.id, "reason": f"item is {item.status}"})
+                continue
+            item.status = StatusOptions.checked_out.value
+        req.status = decision.value
+        req.reviewed_at = now
+        reviewed.append(req.id)
+
+    db.flush()
+    return {"status": decision.value, "reviewed": reviewed, "skipped": sorted(skipped, key=lambda entry: entry["id"])}
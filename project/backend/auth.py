@@ -1,11 +1,32 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from jose import jwt
+from jose import JWTError, jwt
+from sqlalchemy.orm import Session
+from database import get_db
+from models import DEFAULT_SCHOOL_ID, User
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # bcrypt cost factor
+# bcrypt is CPU bound; run it in its own processes so it can't starve the
+# event loop or the threadpool that serves every other route
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE", str(HASH_WORKERS * 8)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 SECRET_KEY = "secret"  # 🔒 replace with env var in production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -13,9 +34,116 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def create_access_token(data: dict, expires_delta: int = ACCESS_TOKEN_EXPIRE_MINUTES):
+def verify_and_update(plain_password, stored_password):
+    """
+    Check a password against the stored value and return (valid, new_hash).
+    new_hash is set when the stored value should be replaced: it is a legacy
+    plaintext password or was hashed with a different cost factor.
+    """
+    if pwd_context.identify(stored_password) is None:
+        valid = hmac.compare_digest(plain_password.encode(), stored_password.encode())
+        return valid, get_password_hash(plain_password) if valid else None
+    return pwd_context.verify_and_update(plain_password, stored_password)
+
+_hash_pool = None
+_hash_slots = None
+
+def _pool():
+    global _hash_pool, _hash_slots
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        _hash_slots = asyncio.Semaphore(HASH_QUEUE_LIMIT)
+    return _hash_pool, _hash_slots
+
+async def _run_in_pool(fn, *args):
+    pool, slots = _pool()
+    # bound the backlog so a login flood queues here instead of piling up in the pool
+    async with slots:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+async def get_password_hash_async(password):
+    return await _run_in_pool(get_password_hash, password)
+
+async def verify_and_update_async(plain_password, stored_password):
+    return await _run_in_pool(verify_and_update, plain_password, stored_password)
+
+def shutdown_hash_pool():
+    global _hash_pool, _hash_slots
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = _hash_slots = None
+
+def create_access_token(data: dict, expires_delta: int = ACCESS_TOKEN_EXPIRE_MINUTES, school_id: int = DEFAULT_SCHOOL_ID):
+    # school_id is the tenant every request made with this token is scoped to (see tenancy.py)
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=expires_delta)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "school_id": school_id})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+# Verified claims per token, keyed by a hash of the token so raw tokens are
+# not kept in memory. Entries are dropped once the token's exp has passed.
+_claims_cache: OrderedDict[str, dict] = OrderedDict()
+_claims_lock = threading.Lock()
+
+def decode_access_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).hexdigest()
+    now = time.time()
+    with _claims_lock:
+        claims = _claims_cache.get(key)
+        if claims is not None:
+            if claims["exp"] > now:
+                _claims_cache.move_to_end(key)
+                return claims
+            del _claims_cache[key]
+
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if "exp" not in claims or "user_id" not in claims:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    with _claims_lock:
+        _claims_cache[key] = claims
+        _claims_cache.move_to_end(key)
+        while len(_claims_cache) > TOKEN_CACHE_SIZE:
+            _claims_cache.popitem(last=False)
+    return claims
+
+class CurrentUser:
+    """Verified token claims; the User row is only loaded if `.user` is used."""
+
+    def __init__(self, claims: dict, db: Session):
+        self.claims = claims
+        self.id = claims["user_id"]
+        self.username = claims.get("sub")
+        self.role = claims.get("role")
+        # tokens issued before multi-school tenancy carry no school: they belong to the default one
+        self.school_id = claims.get("school_id", DEFAULT_SCHOOL_ID)
+        self._db = db
+        self._user = None
+
+    @property
+    def user(self) -> User:
+        if self._user is None:
+            self._user = self._db.get(User, self.id)
+            if self._user is None:
+                raise HTTPException(status_code=401, detail="User no longer exists")
+        return self._user
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    db: Session = Depends(get_db),
+) -> CurrentUser:
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return CurrentUser(decode_access_token(credentials.credentials), db)
+
+def require_admin(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return current_user
+
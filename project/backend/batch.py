@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from auth import CurrentUser
+from models import IdempotencyKey, Item, Request, RequestStatus
+from projection import schema_fields
+from schemas import BatchOperation, ItemCreate, ItemOut, RequestCreate, RequestOut
+from tenancy import OtherSchoolReference
+
+# POST /batch: replaying queued writes from offline clients.
+#
+# Operations run in order in one transaction, each inside its own savepoint,
+# so a failing operation is rolled back and reported while the others still
+# commit. Every operation carries a client-chosen idempotency key. The key is
+# claimed (inserted into idempotency_keys) before the operation runs and its
+# outcome stored with it, all in the same transaction: a batch that is sent
+# again after a lost response gets the stored results back instead of
+# applying anything twice, and a concurrent duplicate waits on the key row
+# and then replays too. Database errors are not an operation's outcome (the
+# next attempt may well succeed): their key is released instead of stored,
+# so a retry runs the operation again. Keys are scoped to the user and kept
+# for IDEMPOTENCY_TTL; expired ones are purged now and then by later batches.
+
+IDEMPOTENCY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_TTL_HOURS", "48")))
+PURGE_INTERVAL = 300  # seconds between purges of expired keys, per process
+MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "200"))
+
+ITEM_FIELDS = {"name", "type", "serial_number", "location", "condition", "status"}
+REQUEST_FIELDS = {"item_id"}  # requests are always made for the calling user
+
+_purge_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def _as_dict(obj, schema) -> dict:
+    return jsonable_encoder({name: getattr(obj, name) for name in schema_fields(schema)})
+
+
+def _validated(schema, data: dict):
+    try:
+        return schema(**data)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors()))
+
+
+def create_item(db: Session, user: CurrentUser, op: BatchOperation) -> tuple[int, dict]:
+    item = _validated(ItemCreate, op.data)
+    db_item = Item(**{field: getattr(item, field) for field in ITEM_FIELDS})
+    db.add(db_item)
+    db.flush()
+    return 201, _as_dict(db_item, ItemOut)
+
+
+def update_item(db: Session, user: CurrentUser, op: BatchOperation) -> tuple[int, dict]:
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    db_item = db.get(Item, op.id) if op.id is not None else None
+    if db_item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    changes = {key: value for key, value in op.data.items() if key in ITEM_FIELDS}
+    if not changes:
+        raise HTTPException(status_code=400, detail="No updatable fields provided")
+    for key, value in changes.items():
+        try:
+            setattr(db_item, key, value)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"{key} {e}")
+    db.flush()
+    return 200, _as_dict(db_item, ItemOut)
+
+
+def create_request(db: Session, user: CurrentUser, op: BatchOperation) -> tuple[int, dict]:
+    fields = {key: value for key, value in op.data.items() if key in REQUEST_FIELDS}
+    req = _validated(RequestCreate, {**fields, "user_id": user.id})
+    db_req = Request(user_id=req.user_id, item_id=req.item_id, status=RequestStatus.pending.value)
+    db.add(db_req)
+    db.flush()
+    return 201, _as_dict(db_req, RequestOut)
+
+
+def delete_request(db: Session, user: CurrentUser, op: BatchOperation) -> tuple[int, dict]:
+    db_req = db.get(Request, op.id) if op.id is not None else None
+    if db_req is None:
+        raise HTTPException(status_code=404, detail="Request not found")
+    db.delete(db_req)
+    db.flush()
+    return 200, {"detail": "Request deleted"}
+
+
+OPERATIONS = {
+    # name -> handler
+    "create_item": create_item,
+    "update_item": update_item,
+    "create_request": create_request,
+    "delete_request": delete_request,
+}
+
+
+def fingerprint(op: BatchOperation) -> str:
+    payload = json.dumps({"op": op.op, "id": op.id, "data": op.data}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _claim(db: Session, user_id: int, op: BatchOperation, digest: str, now: datetime) -> Optional[IdempotencyKey]:
+    """
+    Take the key for this operation. Returns None when it is ours to run,
+    otherwise the row holding the earlier outcome.
+    """
+    keys = IdempotencyKey.__table__
+    values = {"user_id": user_id, "key": op.key, "fingerprint": digest, "expires_at": now + IDEMPOTENCY_TTL}
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        # a concurrent holder of the key makes this wait until it commits or rolls back
+        claimed = db.execute(dialect_insert(keys).values(**values).on_conflict_do_nothing().returning(keys.c.key)).first()
+        if claimed is not None:
+            return None
+    elif db.get(IdempotencyKey, (user_id, op.key)) is None:
+        db.execute(keys.insert().values(**values))
+        return None
+    existing = db.execute(
+        select(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == op.key)
+        .execution_options(populate_existing=True)
+    ).scalar_one()
+    if existing.expires_at.replace(tzinfo=existing.expires_at.tzinfo or timezone.utc) <= now:
+        # expired but not purged yet: treat as new
+        db.execute(update(keys).where(keys.c.user_id == user_id, keys.c.key == op.key).values(status_code=None, response=None, **values))
+        return None
+    return existing
+
+
+def _store(db: Session, user_id: int, key: str, status: int, body) -> None:
+    keys = IdempotencyKey.__table__
+    db.execute(
+        update(keys).where(keys.c.user_id == user_id, keys.c.key == key).values(status_code=status, response=json.dumps(body))
+    )
+
+
+def _release(db: Session, user_id: int, key: str) -> None:
+    keys = IdempotencyKey.__table__
+    db.execute(delete(keys).where(keys.c.user_id == user_id, keys.c.key == key))
+
+
+def purge_expired(db: Session, now: datetime) -> int:
+    global _last_purge
+    with _purge_lock:
+        if time.monotonic() - _last_purge < PURGE_INTERVAL:
+            return 0
+        _last_purge = time.monotonic()
+    return db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now)).rowcount
+
+
+def run_batch(db: Session, user: CurrentUser, operations: list[BatchOperation]) -> list[dict]:
+    """
+    Apply `operations` in order. Does not commit; the caller owns the
+    transaction. Returns one result per operation.
+    """
+    now = datetime.now(timezone.utc)
+    purge_expired(db, now)
+    results = []
+    for op in operations:
+        handler = OPERATIONS.get(op.op)
+        if handler is None:
+            results.append({"key": op.key, "op": op.op, "status": 400, "body": {"detail": f"Unknown operation {op.op!r}"}})
+            continue
+        digest = fingerprint(op)
+        existing = _claim(db, user.id, op, digest, now)
+        if existing is not None:
+            if existing.fingerprint != digest:
+                results.append({"key": op.key, "op": op.op, "status": 422, "body": {"detail": "Idempotency key was used for a different operation"}})
+            else:
+                body = json.loads(existing.response) if existing.response is not None else None
+                results.append({"key": op.key, "op": op.op, "status": existing.status_code, "body": body, "replayed": True})
+            continue
+
+        try:
+            with db.begin_nested():
+                status, body = handler(db, user, op)
+        except HTTPException as e:
+            status, body = e.status_code, {"detail": e.detail}
+        except OtherSchoolReference as e:
+            status, body = 404, {"detail": str(e)}
+        except SQLAlchemyError as e:
+            _release(db, user.id, op.key)
+            # a constraint the row breaks (e.g. a missing item) or a transient failure
+            status = 409 if isinstance(e, IntegrityError) else 503
+            results.append({"key": op.key, "op": op.op, "status": status, "body": {"detail": "Could not apply operation, retry later"}})
+            continue
+        _store(db, user.id, op.key, status, body)
+        results.append({"key": op.key, "op": op.op, "status": status, "body": body})
+    return results
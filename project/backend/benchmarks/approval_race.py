@@ -0,0 +1,83 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from benchmarks.common import dump
+from approvals import review_requests
+from database import SessionLocal
+from models import Item, Request, RequestStatus, StatusOptions, User
+
+# Concurrency check for the approval engine.
+#
+# Creates one available item and many pending requests for it, then approves
+# every request at the same moment from separate threads/connections (and
+# optionally in overlapping batches). Exactly one request may end up
+# approved; the script exits non-zero if the item was checked out twice.
+# Run against PostgreSQL; the rows it creates are removed afterwards.
+
+
+def seed(requests: int) -> tuple[int, int, list[int]]:
+    db = SessionLocal()
+    try:
+        user = User(username=f"race-{time.time_ns()}", email=f"race-{time.time_ns()}@example.com", password="-")
+        item = Item(name="race item", type="Bench", status=StatusOptions.available.value)
+        db.add_all([user, item])
+        db.flush()
+        reqs = [Request(user_id=user.id, item_id=item.id, status=RequestStatus.pending.value) for _ in range(requests)]
+        db.add_all(reqs)
+        db.commit()
+        return user.id, item.id, [req.id for req in reqs]
+    finally:
+        db.close()
+
+
+def approve(ids: list[int], barrier: Barrier) -> list[int]:
+    db = SessionLocal()
+    try:
+        barrier.wait()
+        result = review_requests(db, ids, RequestStatus.approved)
+        db.commit()
+        return result["reviewed"]
+    finally:
+        db.close()
+
+
+def cleanup(user_id: int, item_id: int) -> None:
+    db = SessionLocal()
+    try:
+        db.query(Request).filter(Request.item_id == item_id).delete()
+        db.query(Item).filter(Item.id == item_id).delete()
+        db.query(User).filter(User.id == user_id).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def main(args) -> int:
+    user_id, item_id, request_ids = seed(args.requests)
+    try:
+        # each worker approves its own request plus the next `batch - 1`, so batches overlap
+        batches = [request_ids[i:i + args.batch] for i in range(len(request_ids))]
+        barrier = Barrier(len(batches))
+        with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+            reviewed = [request_id for ids in pool.map(lambda ids: approve(ids, barrier), batches) for request_id in ids]
+
+        db = SessionLocal()
+        try:
+            approved = db.query(Request).filter(Request.item_id == item_id, Request.status == RequestStatus.approved.value).count()
+            item_status = db.get(Item, item_id).status
+        finally:
+            db.close()
+    finally:
+        cleanup(user_id, item_id)
+
+    ok = approved == 1 and len(reviewed) == 1 and item_status == StatusOptions.checked_out.value
+    dump({"requests": args.requests, "batch": args.batch, "approved": approved, "reported_reviewed": reviewed, "item_status": item_status, "ok": ok})
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that parallel approvals never double check out an item")
+    parser.add_argument("--requests", type=int, default=50, help="pending requests (and concurrent approvers)")
+    parser.add_argument("--batch", type=int, default=5, help="request ids per approval call")
+    raise SystemExit(main(parser.parse_args()))
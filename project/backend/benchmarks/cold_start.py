@@ -0,0 +1,92 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.common import BACKEND_DIR, dump, git_revision
+
+# Cold start of the production entry point, median of --runs fresh processes:
+#
+#   import_s     - `import app` in a new interpreter
+#   bootstrap_s  - bootstrap.run() against an already set up database, the
+#                  cost every restart pays
+#   first_200_s  - from launching serve.py to the first 200 from GET /
+#
+#     python -m benchmarks.cold_start --workers 4
+#     python -m benchmarks.cold_start --workers 4 --no-preload   # compare
+
+# serve.py refuses several workers with the in-process change feed
+os.environ.setdefault("EVENTS_BACKEND", "postgres")
+
+
+def python(code: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def import_seconds() -> float:
+    return python("import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)")
+
+
+def bootstrap_seconds() -> float:
+    return python("import bootstrap; print(bootstrap.run())")
+
+
+def serve_seconds(workers: int, preload: bool, timeout: float) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "app.sock")
+        command = [sys.executable, "serve.py", "--bind", f"unix:{path}", "--workers", str(workers), "--log-level", "warning"]
+        if not preload:
+            command.append("--no-preload")
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=BACKEND_DIR)
+        try:
+            with httpx.Client(transport=httpx.HTTPTransport(uds=path), base_url="http://bench") as client:
+                while True:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"serve.py exited with code {process.returncode}")
+                    if time.perf_counter() - started > timeout:
+                        raise RuntimeError("server did not start in time")
+                    try:
+                        if client.get("/").status_code == 200:
+                            return time.perf_counter() - started
+                    except httpx.TransportError:
+                        pass
+                    time.sleep(0.02)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def main(args) -> None:
+    subprocess.run([sys.executable, "-c", "import bootstrap; bootstrap.run()"], cwd=BACKEND_DIR, check=True)
+    samples = {"import_s": [], "bootstrap_s": [], "first_200_s": []}
+    for _ in range(args.runs):
+        samples["import_s"].append(import_seconds())
+        samples["bootstrap_s"].append(bootstrap_seconds())
+        samples["first_200_s"].append(serve_seconds(args.workers, args.preload, args.timeout))
+    dump({
+        "revision": git_revision(),
+        "workers": args.workers,
+        "preload": args.preload,
+        "runs": args.runs,
+        **{name: round(statistics.median(values), 3) for name, values in samples.items()},
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how long the server takes to come up")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-preload", dest="preload", action="store_false")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for the server")
+    main(parser.parse_args())
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+import httpx
+
+# Shared helpers for the benchmark scripts. Run them from project/backend so
+# the flat app modules (app, database, models, ...) are importable, e.g.
+#
+#     python -m benchmarks.login_load --help
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# load from one address would mostly measure 429s; set RATE_LIMIT_BACKEND to
+# include the limiter (servers started by local_server() inherit this)
+os.environ.setdefault("RATE_LIMIT_BACKEND", "off")
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+@asynccontextmanager
+async def asgi_client(app):
+    """httpx client calling the app in-process, with startup/shutdown run."""
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            yield client
+
+
+@asynccontextmanager
+async def http_client(base_url: str = "http://bench", uds: str = None, connections: int = 100):
+    """httpx client talking to a real server over TCP or a unix socket."""
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    transport = httpx.AsyncHTTPTransport(uds=uds, limits=limits) if uds else None
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=60) as client:
+        yield client
+
+
+@asynccontextmanager
+async def local_server(workers: int = 1, startup_timeout: float = 60.0):
+    """
+    Run the app under uvicorn on a unix socket in a temporary directory and
+    yield the socket path once GET / answers. The server is stopped on exit.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "app.sock")
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--uds", path, "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+        )
+        try:
+            deadline = time.perf_counter() + startup_timeout
+            async with http_client(uds=path, connections=1) as client:
+                while True:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+                    try:
+                        if (await client.get("/")).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    if time.perf_counter() > deadline:
+                        raise RuntimeError("uvicorn did not start in time")
+                    await asyncio.sleep(0.1)
+            yield path
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                # open streaming responses (/events) keep uvicorn's graceful shutdown waiting
+                process.kill()
+                process.wait()
+
+
+async def run_for(duration: float, worker, concurrency: int) -> None:
+    """Run `concurrency` copies of `worker(deadline)` until the deadline passes."""
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(worker(deadline) for _ in range(concurrency)))
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def dump(report: dict) -> None:
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+from sqlalchemy import event, text
+from benchmarks.common import asgi_client, dump
+from benchmarks.seed import fill
+
+# Query-plan regression check.
+#
+# Drives the routes in-process, records every SQL statement they send to
+# PostgreSQL, then EXPLAINs each one. A sequential scan over one of the big
+# tables (or item_events partitions) whose filter the planner expects to keep
+# only a small share of the rows means an index is missing or no longer
+# usable, and fails the run.
+# Unfiltered scans (unbounded listings, exports) and unselective filters read
+# most of the table anyway and are allowed.
+#
+#     python -m benchmarks.explain_plans --seed 200000
+#
+# --seed tops the database up with benchmarks.seed rows first and refreshes
+# planner statistics.
+
+BIG_TABLES = {"users", "items", "requests"}
+EXPLAINED_VERBS = ("SELECT", "UPDATE", "DELETE", "WITH")
+SELECTIVE = 0.05  # a filter expected to keep less than this share of rows should use an index
+
+
+async def top_up(engine, rows: int) -> None:
+    """Seed until at least `rows` items exist, then refresh planner statistics."""
+    with engine.connect() as conn:
+        missing = rows - conn.execute(text("SELECT count(*) FROM items")).scalar()
+    if missing > 0:
+        await fill(users=max(missing // 20, 1), items=missing, requests=missing)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # also flushes the GIN pending list so plans reflect a settled table
+        conn.execute(text("VACUUM ANALYZE"))
+
+
+async def exercise(client) -> None:
+    """One call per query shape the routes issue."""
+    token = (await client.post("/login/", json={"username": "admin", "password": "admin"})).json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+    page = await client.get("/items/", params={"limit": 50})
+    cursor = page.headers.get("X-Next-Cursor", "0")
+    for params in (
+        {"limit": 50, "cursor": cursor},
+        {"status": "Available", "limit": 50},
+        {"type": "Laptop", "cursor": cursor, "limit": 50},
+        {"location": "Room 7", "limit": 50},
+        {"condition": "Fair", "limit": 50},
+    ):
+        await client.get("/items/", params=params)
+    await client.get("/items/search", params={"q": "laptop"})
+    await client.get("/items/search", params={"q": "SN-0000012"})
+    await client.get("/requests/", params={"user_id": 2})
+    await client.get("/requests/", params={"item_id": 3, "expand": "item,user"})
+    await client.get("/requests/", params={"status": "Pending", "user_id": 2})
+    await client.get("/requests/1/")
+    await client.get("/items/3/history")
+    await client.get("/item-events/")
+    await client.get("/item-events/", params={"kind": "denied", "since": "2025-01-01T00:00:00Z", "until": "2025-02-01T00:00:00Z"})
+    await client.post("/requests/approve", json={"request_ids": [1, 2, 3], "decision": "deny"}, headers=auth)
+
+
+def table_sizes(engine) -> dict[str, float]:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            # item_events is scanned partition by partition, each is sized on its own
+            text("SELECT relname, reltuples FROM pg_class WHERE relname = ANY(:names) OR relname LIKE 'item\\_events\\_%'"),
+            {"names": list(BIG_TABLES)},
+        )
+        return {name: max(tuples, 1.0) for name, tuples in rows}
+
+
+def offending_nodes(plan: dict, sizes: dict[str, float]) -> list[str]:
+    found = []
+    table = plan.get("Relation Name")
+    if plan.get("Node Type") == "Seq Scan" and table in sizes and "Filter" in plan:
+        if plan["Plan Rows"] < sizes.get(table, 1.0) * SELECTIVE:
+            found.append(f"Seq Scan on {table} (filter: {plan['Filter']}, ~{plan['Plan Rows']} rows)")
+    for child in plan.get("Plans", []):
+        found.extend(offending_nodes(child, sizes))
+    return found
+
+
+async def main(args) -> int:
+    import bootstrap
+    import database
+    from app import app
+
+    bootstrap.run()
+    if args.seed:
+        await top_up(database.engine, args.seed)
+
+    captured = []
+    recording = True
+
+    def record(engine):
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if recording and statement.lstrip().upper().startswith(EXPLAINED_VERBS):
+                captured.append((engine, statement, parameters))
+        return before_cursor_execute
+
+    event.listen(database.engine, "before_cursor_execute", record(database.engine))
+    event.listen(database.async_engine.sync_engine, "before_cursor_execute", record(database.async_engine))
+
+    async with asgi_client(app) as client:
+        await exercise(client)
+    recording = False
+
+    sizes = table_sizes(database.engine)
+    seen = set()
+    results = []
+    failures = 0
+    for engine, statement, parameters in captured:
+        # same statement with other parameters can plan differently, keep both
+        shape = (statement, repr(parameters))
+        if shape in seen:
+            continue
+        seen.add(shape)
+        explain = "EXPLAIN (FORMAT JSON) " + statement
+        if engine is database.async_engine:
+            async with engine.connect() as conn:
+                plan = (await conn.exec_driver_sql(explain, parameters)).scalar()
+        else:
+            with engine.connect() as conn:
+                plan = conn.exec_driver_sql(explain, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        problems = offending_nodes(plan[0]["Plan"], sizes)
+        failures += bool(problems)
+        results.append({"sql": " ".join(statement.split())[:200], "problems": problems})
+
+    dump({"statements": len(results), "failures": failures, "plans": [r for r in results if r["problems"] or args.verbose]})
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if any route query falls back to a filtered sequential scan")
+    parser.add_argument("--seed", type=int, default=0, help="make sure at least this many items (and requests) exist")
+    parser.add_argument("--verbose", action="store_true", help="list every statement, not just failing ones")
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from sqlalchemy import text
+from benchmarks.common import asgi_client, dump, git_revision, http_client, local_server, percentiles, run_for
+from benchmarks.seed import BENCH_PASSWORD, CATALOGUE, EMAIL_DOMAIN
+
+# Scenario-driven load runner.
+#
+# Closed-loop clients repeatedly pick a scenario by weight and replay it:
+#
+#   browse   list items (following the cursor, sometimes filtered) and a user's requests
+#   search   item search by model word or serial prefix
+#   request  file a request and read it back; now and then a user logs in
+#   approve  an admin reviews a few pending requests
+#
+# Targets: in-process over ASGI (default), a uvicorn started here on a unix
+# socket (--target socket), or an already running server (--url). Ids to
+# work with are sampled from the database in DATABASE_URL, so seed it first
+# with benchmarks.seed. The JSON report has throughput, error counts and
+# p50/p95/p99 per route; save it with --output and pass it to --compare on a
+# later commit to get the differences.
+#
+#     python -m benchmarks.load --duration 30 --concurrency 32 --output before.json
+#     python -m benchmarks.load --duration 30 --concurrency 32 --compare before.json
+
+DEFAULT_MIX = {"browse": 60, "search": 20, "request": 15, "approve": 5}
+SEARCH_TERMS = sorted({word.lower() for models in CATALOGUE.values() for model in models for word in model.split()})
+SAMPLE_SIZE = 2000
+
+
+class Run:
+    """State shared by the clients of one run: sampled ids, tokens and samples."""
+
+    def __init__(self, client, pools: dict, admin_token: str, measure_from: float):
+        self.client = client
+        self.rng = random.Random()
+        self.user_ids = pools["user_ids"]
+        self.usernames = pools["usernames"]
+        self.item_ids = pools["item_ids"]
+        self.pending = pools["pending"]
+        self.admin = {"Authorization": f"Bearer {admin_token}"}
+        self.measure_from = measure_from
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, route: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        if started >= self.measure_from:
+            self.latencies[route].append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                self.errors[route] += 1
+        return response
+
+
+async def browse(run: Run) -> None:
+    params = {"limit": 20}
+    if run.rng.random() < 0.3:
+        params["type"] = run.rng.choice(list(CATALOGUE))
+    for _ in range(run.rng.randint(1, 3)):
+        response = await run.call("GET /items/", "GET", "/items/", params=params)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        params["cursor"] = cursor
+    await run.call("GET /requests/?user_id", "GET", "/requests/", params={"user_id": run.rng.choice(run.user_ids), "expand": "item"})
+
+
+async def search(run: Run) -> None:
+    if run.rng.random() < 0.2:
+        q = f"SN-{run.rng.choice(run.item_ids):08d}"[:-2]
+    else:
+        q = run.rng.choice(SEARCH_TERMS)[: run.rng.randint(3, 6)]
+    await run.call("GET /items/search", "GET", "/items/search", params={"q": q, "limit": 20})
+
+
+async def request(run: Run) -> None:
+    if run.usernames and run.rng.random() < 0.1:
+        await run.call("POST /login/", "POST", "/login/", json={"username": run.rng.choice(run.usernames), "password": BENCH_PASSWORD})
+    body = {"user_id": run.rng.choice(run.user_ids), "item_id": run.rng.choice(run.item_ids)}
+    response = await run.call("POST /requests/", "POST", "/requests/", json=body)
+    if response.status_code == 200:
+        request_id = response.json()["id"]
+        run.pending.append(request_id)
+        await run.call("GET /requests/{id}/", "GET", f"/requests/{request_id}/")
+
+
+async def approve(run: Run) -> None:
+    batch = [run.pending.pop(run.rng.randrange(len(run.pending))) for _ in range(min(len(run.pending), run.rng.randint(1, 5)))]
+    if not batch:
+        return
+    decision = "approve" if run.rng.random() < 0.7 else "deny"
+    await run.call("POST /requests/approve", "POST", "/requests/approve", json={"request_ids": batch, "decision": decision}, headers=run.admin)
+
+
+SCENARIOS = {"browse": browse, "search": search, "request": request, "approve": approve}
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def sample_pools(size: int) -> dict:
+    from database import engine
+
+    with engine.connect() as conn:
+        users = conn.execute(
+            text("SELECT id, username, email FROM users WHERE role = 'user' ORDER BY random() LIMIT :n"), {"n": size}
+        ).all()
+        return {
+            "user_ids": [user_id for user_id, _, _ in users],
+            # only seeded users know BENCH_PASSWORD
+            "usernames": [name for _, name, email in users if email.endswith(f"@{EMAIL_DOMAIN}")],
+            "item_ids": list(conn.execute(text("SELECT id FROM items ORDER BY random() LIMIT :n"), {"n": size}).scalars()),
+            "pending": list(
+                conn.execute(
+                    text("SELECT id FROM requests WHERE status = 'Pending' ORDER BY random() LIMIT :n"), {"n": size}
+                ).scalars()
+            ),
+        }
+
+
+@asynccontextmanager
+async def open_client(args):
+    if args.url:
+        async with http_client(args.url, connections=args.concurrency) as client:
+            yield client
+    elif args.target == "socket":
+        async with local_server(workers=args.workers) as path:
+            async with http_client(uds=path, connections=args.concurrency) as client:
+                yield client
+    else:
+        from app import app
+
+        async with asgi_client(app) as client:
+            yield client
+
+
+def summarize(run: Run, duration: float) -> dict:
+    routes = {}
+    for route in sorted(run.latencies):
+        samples = run.latencies[route]
+        routes[route] = {"rps": round(len(samples) / duration, 1), "errors": run.errors[route], **percentiles(samples)}
+    total = sum(len(samples) for samples in run.latencies.values())
+    return {
+        "total": {"requests": total, "rps": round(total / duration, 1), "errors": sum(run.errors.values())},
+        "routes": routes,
+    }
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """Per-route change against an earlier report, as percentages."""
+
+    def change(new, old):
+        return None if not old or new is None else round((new - old) / old * 100, 1)
+
+    delta = {"baseline_revision": baseline.get("revision"), "routes": {}}
+    for route, stats in current["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if before:
+            delta["routes"][route] = {
+                f"{metric}_pct": change(stats.get(metric), before.get(metric))
+                for metric in ("rps", "p50_ms", "p95_ms", "p99_ms")
+            }
+    delta["total_rps_pct"] = change(current["total"]["rps"], baseline.get("total", {}).get("rps"))
+    return delta
+
+
+async def main(args) -> None:
+    pools = sample_pools(args.sample)
+    if not (pools["user_ids"] and pools["item_ids"]):
+        raise SystemExit("no users or items to work with, run benchmarks.seed first")
+
+    async with open_client(args) as client:
+        login = await client.post("/login/", json={"username": args.admin_username, "password": args.admin_password})
+        login.raise_for_status()
+        mix = args.mix or DEFAULT_MIX
+        run = Run(client, pools, login.json()["access_token"], time.perf_counter() + args.warmup)
+
+        async def worker(deadline):
+            names, weights = list(mix), list(mix.values())
+            while time.perf_counter() < deadline:
+                await SCENARIOS[run.rng.choices(names, weights)[0]](run)
+
+        await run_for(args.warmup + args.duration, worker, args.concurrency)
+
+    report = {
+        "revision": git_revision(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target": args.url or args.target,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "mix": mix,
+        **summarize(run, args.duration),
+    }
+    if args.compare:
+        with open(args.compare) as baseline:
+            report["compare"] = compare(report, json.load(baseline))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(report, out, indent=2)
+    dump(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay mixed traffic and report per-route throughput and latency")
+    parser.add_argument("--target", choices=["asgi", "socket"], default="asgi", help="in-process or uvicorn on a unix socket")
+    parser.add_argument("--url", help="benchmark an already running server instead, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --target socket")
+    parser.add_argument("--mix", type=parse_mix, help="scenario weights, e.g. browse=60,search=20,request=15,approve=5")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of traffic before measuring")
+    parser.add_argument("--sample", type=int, default=SAMPLE_SIZE, help="user, item and pending request ids to sample")
+    parser.add_argument("--admin-username", default="admin")
+    parser.add_argument("--admin-password", default="admin")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import time
+from benchmarks.common import asgi_client, dump, percentiles, run_for
+
+# Does bcrypt login traffic hurt everyone else?
+#
+# Measures GET /items/ latency on its own, then again while login clients
+# hammer POST /login/. With hashing offloaded to the process pool the p99 of
+# the read route should stay roughly flat. Needs a database with the default
+# admin user (created on startup).
+
+
+async def measure(client, readers: int, logins: int, duration: float, username: str, password: str) -> dict:
+    read_latencies = []
+    login_latencies = []
+
+    async def reader(deadline):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/items/", params={"limit": 20})
+            response.raise_for_status()
+            read_latencies.append(time.perf_counter() - started)
+
+    async def login(deadline):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.post("/login/", json={"username": username, "password": password})
+            response.raise_for_status()
+            login_latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(run_for(duration, reader, readers), run_for(duration, login, logins))
+    return {
+        "items": percentiles(read_latencies),
+        "items_rps": round(len(read_latencies) / duration, 1),
+        "login": percentiles(login_latencies),
+        "login_rps": round(len(login_latencies) / duration, 1),
+    }
+
+
+async def main(args) -> None:
+    from app import app
+
+    async with asgi_client(app) as client:
+        baseline = await measure(client, args.readers, 0, args.duration, args.username, args.password)
+        loaded = await measure(client, args.readers, args.logins, args.duration, args.username, args.password)
+    dump({"readers": args.readers, "logins": args.logins, "baseline": baseline, "with_logins": loaded})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-route latency with and without concurrent logins")
+    parser.add_argument("--readers", type=int, default=16, help="concurrent GET /items/ clients")
+    parser.add_argument("--logins", type=int, default=8, help="concurrent POST /login/ clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import tempfile
+import time
+from benchmarks.common import dump
+
+# Photo pipeline cost and payoff, in-process against the app.
+#
+#     python -m benchmarks.photos --photos 20 --width 4000 --height 3000
+#
+# Uploads --photos distinct synthetic JPEGs to one item each (into a
+# temporary MEDIA_DIR), then fetches every thumbnail, which waits for the
+# background variant job where it has not finished yet. Reported: upload
+# latency, time until the first thumbnail of a photo can be served, variant
+# throughput of the pool, and bytes a catalogue card loads with the
+# thumbnail against the original. Needs Pillow.
+
+
+def synthetic_jpeg(width: int, height: int, seed: int) -> bytes:
+    from PIL import Image
+
+    # a fractal crop differs per seed and compresses like a real photo, not like a flat image
+    x = -2 + (seed % 10) * 0.05
+    image = Image.effect_mandelbrot((width, height), (x, -1.2, x + 2.6, 1.2), 60 + seed % 40).convert("RGB")
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+async def main(args) -> None:
+    import bootstrap
+    from app import app
+    from benchmarks.common import asgi_client
+    from database import async_engine
+
+    bootstrap.run()
+    photos = [synthetic_jpeg(args.width, args.height, n) for n in range(args.photos)]
+    uploads, first_thumbnail, thumbnail_bytes = [], [], []
+    async with asgi_client(app) as client:
+        token = (await client.post("/login/", json={"username": "admin", "password": "admin"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "image/jpeg"}
+        item = {"name": "Bench camera", "type": "Camera", "serial_number": "0", "condition": "New", "status": "Available", "location": "Bench"}
+        urls = []
+        started = time.perf_counter()
+        for body in photos:
+            item_id = (await client.post("/items/", json=item)).json()["id"]
+            t = time.perf_counter()
+            response = await client.post(f"/items/{item_id}/photo", content=body, headers=headers)
+            response.raise_for_status()
+            uploads.append(time.perf_counter() - t)
+            urls.append((t, response.json()["thumbnail_url"]))
+        for uploaded_at, url in urls:
+            response = await client.get(url)
+            response.raise_for_status()
+            first_thumbnail.append(time.perf_counter() - uploaded_at)
+            thumbnail_bytes.append(len(response.content))
+        elapsed = time.perf_counter() - started
+    await async_engine.dispose()
+
+    dump({
+        "photos": args.photos,
+        "dimensions": f"{args.width}x{args.height}",
+        "upload_ms_median": round(statistics.median(uploads) * 1000, 1),
+        "thumbnail_ready_ms_median": round(statistics.median(first_thumbnail) * 1000, 1),
+        "photos_per_second": round(args.photos / elapsed, 2),
+        "original_kb_median": round(statistics.median(map(len, photos)) / 1024, 1),
+        "thumbnail_kb_median": round(statistics.median(thumbnail_bytes) / 1024, 1),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure photo upload and thumbnail generation")
+    parser.add_argument("--photos", type=int, default=20)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as media:
+        os.environ["MEDIA_DIR"] = media  # read when photos is imported
+        asyncio.run(main(args))
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import time
+from benchmarks.common import dump
+
+# Per-request cost of RateLimitMiddleware, measured in-process against a
+# downstream app that does nothing, so only the limiter's own work is timed.
+#
+#     python -m benchmarks.ratelimit_overhead
+#     python -m benchmarks.ratelimit_overhead --backend redis   # needs RATE_LIMIT_URL
+#
+# Cases: a route without a limit (the path every other request takes), a
+# limited route from many anonymous addresses, the same with a bearer token
+# (claims come from the auth cache after the first request) and a client
+# already over its limit, which gets the 429. Exits non-zero when any case
+# costs more than --budget microseconds on average.
+
+BUDGET_US = 50.0
+
+
+async def noop_app(scope, receive, send):
+    pass
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+def scope(method: str, path: str, ip: str, token: str = None) -> dict:
+    headers = [(b"host", b"bench"), (b"user-agent", b"bench")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return {"type": "http", "method": method, "path": path, "headers": headers, "client": (ip, 50000)}
+
+
+async def per_request_us(app, scopes: list[dict], iterations: int) -> float:
+    started = time.perf_counter()
+    for n in range(iterations):
+        await app(scopes[n % len(scopes)], receive, send)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main(args) -> int:
+    from auth import create_access_token
+    from ratelimit import Limit, MemoryBuckets, RateLimitMiddleware, RedisBuckets
+
+    backend = RedisBuckets() if args.backend == "redis" else MemoryBuckets()
+    plenty = Limit(10**9, 1)
+    middleware = RateLimitMiddleware(
+        noop_app, limits={"POST /login/": plenty, "POST /requests/": plenty}, backend=backend, address_limits={"POST /login/": plenty}
+    )
+    strict = RateLimitMiddleware(noop_app, limits={"POST /login/": Limit(1, 86400)}, backend=backend)
+    token = create_access_token({"sub": "bench", "role": "user", "user_id": 1})
+    addresses = [f"10.0.{n // 256}.{n % 256}" for n in range(args.clients)]
+
+    cases = {
+        "unlimited_route": (middleware, [scope("GET", "/items/", ip) for ip in addresses]),
+        "limited_anonymous": (middleware, [scope("POST", "/login/", ip) for ip in addresses]),
+        "limited_bearer": (middleware, [scope("POST", "/requests/", ip, token) for ip in addresses]),
+        "rejected": (strict, [scope("POST", "/login/", "10.9.9.9")]),
+    }
+    baseline = await per_request_us(noop_app, cases["unlimited_route"][1], args.iterations)
+    report = {"backend": backend.name, "iterations": args.iterations, "budget_us": args.budget, "cases": {}}
+    over = False
+    for name, (app, scopes) in cases.items():
+        await per_request_us(app, scopes, min(args.iterations, 10000))  # warm the buckets and the claims cache
+        cost = await per_request_us(app, scopes, args.iterations) - baseline
+        report["cases"][name] = {"overhead_us": round(cost, 2)}
+        over = over or cost > args.budget
+    dump(report)
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the rate limiter's own cost per request")
+    parser.add_argument("--backend", choices=["memory", "redis"], default="memory")
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--clients", type=int, default=10000, help="distinct client addresses")
+    parser.add_argument("--budget", type=float, default=BUDGET_US, help="allowed microseconds per request")
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
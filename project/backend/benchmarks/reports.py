@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.common import dump
+
+# Report jobs end to end: queue each report, run it in a worker process the
+# way the pool does, and report wall time, rows, compressed size and the
+# worker's peak memory.
+#
+#     python -m benchmarks.reports --items 100000 --requests 300000
+#
+# The tables are topped up with benchmarks.seed rows when they hold fewer
+# than asked for. Peak memory should stay about the same as the tables grow
+# (try --chunk), since rows are read and written a chunk at a time.
+
+
+def run_one() -> dict:
+    import reports
+
+    started = time.perf_counter()
+    reports.work_once()
+    return {
+        "seconds": round(time.perf_counter() - started, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+async def main(args) -> None:
+    os.environ["REPORT_CHUNK_ROWS"] = str(args.chunk)
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import Session
+    import bootstrap
+    import database
+    import reports
+    from benchmarks.seed import fill
+    from models import Item, ReportJob, Request
+
+    bootstrap.run()
+    with Session(database.engine) as db:
+        items = db.scalar(select(func.count()).select_from(Item))
+        requests = db.scalar(select(func.count()).select_from(Request))
+    if items < args.items or requests < args.requests:
+        await fill(
+            users=0 if requests else max(args.requests // 20, 1),
+            items=max(0, args.items - items),
+            requests=max(0, args.requests - requests),
+        )
+    database.engine.dispose()
+
+    report = {"chunk_rows": args.chunk}
+    for kind in reports.REPORTS:
+        with Session(database.engine) as db:
+            job = reports.enqueue(db, kind, {"benchmark": time.time()}, None)
+            db.commit()
+            job_id = job.id
+        # a fresh process per report, so peak memory is that report's alone
+        with ProcessPoolExecutor(max_workers=1, initializer=reports._init_process) as pool:
+            timing = pool.submit(run_one).result()
+        with Session(database.engine) as db:
+            job = db.get(ReportJob, job_id)
+            report[kind] = {"status": job.status, "rows": job.rows, "kb": (job.file_bytes or 0) // 1024, **timing}
+    with Session(database.engine) as db:
+        report["items"] = db.scalar(select(func.count()).select_from(Item))
+        report["requests"] = db.scalar(select(func.count()).select_from(Request))
+    dump(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the report jobs and measure worker memory")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=300000)
+    parser.add_argument("--chunk", type=int, default=5000, help="REPORT_CHUNK_ROWS for the workers")
+    asyncio.run(main(parser.parse_args()))
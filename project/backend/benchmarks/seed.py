@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, insert, select, text
+from benchmarks.common import dump
+
+# Fill users, items and requests with synthetic but plausible rows.
+#
+#     python -m benchmarks.seed --users 100000 --items 1000000 --requests 3000000
+#
+# Rows are appended, so the tool can top up an existing database. Every seeded
+# user shares BENCH_PASSWORD (one bcrypt hash, computing millions would take
+# hours), so the load runner can log in as any of them. On PostgreSQL with
+# asyncpg rows go in through COPY; elsewhere through executemany inserts.
+# On PostgreSQL reviewed requests also get their item_events history.
+# Rows go to the default school, or to --school (which must exist, see
+# tenancy.py); requests only ever name users and items of their own school.
+# Output is deterministic for a given --seed.
+
+BENCH_PASSWORD = "bench-password"
+EMAIL_DOMAIN = "school.example"  # marks seeded users
+
+FIRST_NAMES = [
+    "Ada", "Alan", "Amara", "Ben", "Chen", "Chloe", "Dev", "Elena", "Farah", "Grace", "Hugo", "Ines",
+    "Jamal", "Kai", "Lena", "Liam", "Maya", "Noah", "Olu", "Priya", "Quinn", "Rosa", "Sam", "Tariq",
+    "Uma", "Vera", "Wei", "Yusuf", "Zoe",
+]
+LAST_NAMES = [
+    "Adams", "Baker", "Costa", "Dubois", "Evans", "Fischer", "Garcia", "Haddad", "Ito", "Jensen", "Khan",
+    "Lopez", "Moreau", "Nguyen", "Okafor", "Patel", "Rossi", "Schmidt", "Tanaka", "Usman", "Varga",
+    "Walsh", "Yilmaz", "Zhang",
+]
+# type -> models; weights roughly follow a school equipment inventory
+CATALOGUE = {
+    "Laptop": ["Dell Latitude 5420", "Lenovo ThinkPad T14", "HP ProBook 450", "MacBook Air M1", "Acer TravelMate P2"],
+    "Tablet": ["iPad 9th Gen", "Samsung Galaxy Tab A8", "Lenovo Tab M10"],
+    "Chromebook": ["Acer Chromebook 314", "HP Chromebook 11", "Lenovo 300e"],
+    "Projector": ["Epson EB-W51", "BenQ MW560", "Optoma W400"],
+    "Camera": ["Canon EOS 250D", "Nikon D3500", "GoPro Hero 9"],
+    "Microscope": ["Swift SW380T", "AmScope M150C"],
+    "Calculator": ["TI-84 Plus CE", "Casio fx-991EX"],
+    "Headphones": ["Sony WH-CH520", "JBL Tune 510BT"],
+}
+TYPE_WEIGHTS = {"Laptop": 30, "Tablet": 15, "Chromebook": 20, "Projector": 5, "Camera": 4, "Microscope": 3, "Calculator": 15, "Headphones": 8}
+CONDITIONS = {"New": 15, "Good": 50, "Fair": 25, "Poor": 10}
+ITEM_STATUSES = {"Available": 70, "Checked Out": 22, "Under Repair": 5, "Retired": 3}
+REQUEST_STATUSES = {"Pending": 10, "Approved": 70, "Denied": 20}
+LOCATIONS = ["Library", "Gym", "Main Office", "Science Lab 1", "Science Lab 2", "Art Room", "Music Room"] + [
+    f"Room {n}" for n in range(1, 41)
+]
+HISTORY = timedelta(days=730)  # requests are spread over the last two years
+
+
+def weighted(rng: random.Random, weights: dict[str, int], k: int) -> list[str]:
+    return rng.choices(list(weights), weights=list(weights.values()), k=k)
+
+
+def user_rows(rng: random.Random, start: int, count: int, password_hash: str):
+    for n in range(start, start + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f"{first.lower()}.{last.lower()}{n}"
+        yield {
+            "username": username,
+            "email": f"{username}@{EMAIL_DOMAIN}",
+            "password": password_hash,
+            # roughly one admin per 500 users
+            "role": "admin" if rng.random() < 0.002 else "user",
+        }
+
+
+def item_rows(rng: random.Random, start: int, count: int):
+    types = weighted(rng, TYPE_WEIGHTS, count)
+    conditions = weighted(rng, CONDITIONS, count)
+    statuses = weighted(rng, ITEM_STATUSES, count)
+    for offset, n in enumerate(range(start, start + count)):
+        item_type = types[offset]
+        yield {
+            "name": f"{rng.choice(CATALOGUE[item_type])} #{n}",
+            "type": item_type,
+            "serial_number": f"SN-{n:08d}",
+            "condition": conditions[offset],
+            "status": statuses[offset],
+            "location": rng.choice(LOCATIONS),
+        }
+
+
+def skewed(rng: random.Random, values: list[int], prime: int) -> int:
+    # cubing a uniform draw puts most picks on a small set of ranks; the prime
+    # stride scatters those ranks so the popular rows aren't the oldest ones
+    rank = int(len(values) * rng.random() ** 3)
+    return values[rank * prime % len(values)]
+
+
+def request_rows(rng: random.Random, user_ids: list[int], item_ids: list[int], count: int):
+    now = datetime.now(timezone.utc)
+    statuses = weighted(rng, REQUEST_STATUSES, count)
+    for status in statuses:
+        # a few heavy borrowers and popular items, as in real usage
+        user_id = skewed(rng, user_ids, 7919)
+        item_id = skewed(rng, item_ids, 104729)
+        requested_at = now - HISTORY * rng.random() ** 2
+        yield {
+            "user_id": user_id,
+            "item_id": item_id,
+            "status": status,
+            "requested_at": requested_at,
+            "reviewed_at": None if status == "Pending" else requested_at + timedelta(hours=rng.uniform(0.1, 72)),
+        }
+
+
+def stamped(rows, version: int, school: int):
+    for row in rows:
+        yield {**row, "version": version, "school_id": school}
+
+
+async def copy_rows(conn, table, rows, chunk: int) -> int:
+    """Insert dict rows `chunk` at a time; returns the number inserted."""
+    import lookups
+
+    inserted = 0
+    batch = []
+
+    async def flush():
+        nonlocal inserted
+        if not batch:
+            return
+        if conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg":
+            raw = await conn.get_raw_connection()
+            records = [lookups.copy_values(table, row) for row in batch]
+            await raw.driver_connection.copy_records_to_table(
+                table.name, records=[tuple(record.values()) for record in records], columns=list(records[0])
+            )
+        else:
+            await conn.execute(insert(table), batch)
+        inserted += len(batch)
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk:
+            await flush()
+    await flush()
+    return inserted
+
+
+async def all_ids(conn, table, school: int) -> list[int]:
+    result = await conn.execute(select(table.c.id).where(table.c.school_id == school).order_by(table.c.id))
+    return list(result.scalars())
+
+
+async def max_id(conn, table) -> int:
+    return (await conn.execute(select(func.coalesce(func.max(table.c.id), 0)))).scalar()
+
+
+async def fill(users: int, items: int, requests: int, seed: int = 42, chunk: int = 10000, school: int = 1) -> dict:
+    """Append the given number of rows to each table and return timings."""
+    import bootstrap
+    import counters
+    import ledger
+    import lookups
+    import versioning
+    from auth import get_password_hash
+    from database import async_engine
+    from models import Item, Request, User
+
+    bootstrap.run()  # a fresh database gets its tables first
+    # before the transaction below: new names are committed on a connection of their own
+    lookups.ensure_rows(Item.__table__, [{"type": name, "location": None} for name in TYPE_WEIGHTS])
+    lookups.ensure_rows(Item.__table__, [{"type": None, "location": name} for name in LOCATIONS])
+    rng = random.Random(seed)
+    report = {}
+    started = time.perf_counter()
+
+    def lap() -> float:
+        nonlocal started
+        elapsed, started = time.perf_counter() - started, time.perf_counter()
+        return round(elapsed, 2)
+
+    async with async_engine.begin() as conn:
+        last_user, last_item = await max_id(conn, User.__table__), await max_id(conn, Item.__table__)
+        last_request = await max_id(conn, Request.__table__)
+        password_hash = get_password_hash(BENCH_PASSWORD)
+        # COPY bypasses the ORM flush hooks: bump the validators by hand, and
+        # first, so the new rows carry the version clients sync from
+        versions = await conn.run_sync(versioning.bump, ["users", "items", "requests"], school)
+        lap()
+
+        report["users"] = await copy_rows(conn, User.__table__, stamped(user_rows(rng, last_user + 1, users, password_hash), versions["users"], school), chunk)
+        report["users_seconds"] = lap()
+        report["items"] = await copy_rows(conn, Item.__table__, stamped(item_rows(rng, last_item + 1, items), versions["items"], school), chunk)
+        report["items_seconds"] = lap()
+
+        # new requests may also point at rows that existed before this run
+        user_ids = await all_ids(conn, User.__table__, school)
+        item_ids = await all_ids(conn, Item.__table__, school)
+        report["requests"] = 0
+        if requests and user_ids and item_ids:
+            report["requests"] = await copy_rows(conn, Request.__table__, stamped(request_rows(rng, user_ids, item_ids, requests), versions["requests"], school), chunk)
+        report["requests_seconds"] = lap()
+
+        if conn.dialect.name == "postgresql":
+            # checkout history of the new reviewed requests, in monthly partitions
+            await conn.run_sync(ledger.ensure_partitions, datetime.now(timezone.utc) - HISTORY)
+            result = await conn.execute(
+                text(
+                    "INSERT INTO item_events (occurred_at, item_id, kind, status, request_id, user_id, school_id)"
+                    " SELECT reviewed_at, item_id,"
+                    " CASE status WHEN 'Approved' THEN 'checked_out' ELSE 'denied' END,"
+                    " CASE status WHEN 'Approved' THEN 'Checked Out' END, id, user_id, school_id"
+                    " FROM requests WHERE id > :last AND school_id = :school AND reviewed_at IS NOT NULL"
+                ),
+                {"last": last_request, "school": school},
+            )
+            report["item_events"] = result.rowcount
+            report["item_events_seconds"] = lap()
+
+        # and recount the summary counters
+        await conn.run_sync(counters.rebuild)
+    return report
+
+
+async def main(args) -> None:
+    from database import async_engine
+
+    report = await fill(args.users, args.items, args.requests, seed=args.seed, chunk=args.chunk, school=args.school)
+    await async_engine.dispose()
+    dump({"seed": args.seed, **report})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append synthetic users, items and requests")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--requests", type=int, default=2000000)
+    parser.add_argument("--seed", type=int, default=42, help="random seed, same seed gives the same rows")
+    parser.add_argument("--chunk", type=int, default=10000, help="rows per COPY / insert batch")
+    parser.add_argument("--school", type=int, default=1, help="school the rows belong to")
+    asyncio.run(main(parser.parse_args()))
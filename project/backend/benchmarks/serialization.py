@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+from sqlalchemy import func, select
+from benchmarks.common import dump
+from benchmarks.seed import fill
+
+# List serialisation cost: ORM objects validated through the response schema
+# (how the list endpoints used to build their bodies) against Core rows
+# serialised as they are, with every column and with a ?fields= projection.
+#
+#     python -m benchmarks.serialization --rows 100000
+#
+# Each strategy reads the same `--rows` items and produces the JSON body.
+# Reported per strategy: best wall and CPU time over --repeat runs, peak
+# Python memory (tracemalloc, measured on a separate run since tracing slows
+# everything down) and body size. The items table is topped up with
+# benchmarks.seed rows when it holds fewer than --rows.
+
+
+def orm_and_schema(session, rows: int, fields) -> bytes:
+    from pydantic import TypeAdapter
+    from models import Item
+    from schemas import ItemOut
+
+    adapter = TypeAdapter(list[ItemOut])
+    items = session.execute(select(Item).order_by(Item.id).limit(rows)).scalars().all()
+    return adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+
+
+def core_rows(session, rows: int, fields) -> bytes:
+    from models import Item
+    from projection import dumps, rows_as_dicts, select_columns
+    from schemas import ItemOut
+
+    columns = select_columns(Item, ItemOut, fields)
+    result = session.execute(select(*columns).order_by(Item.id).limit(rows))
+    return dumps(rows_as_dicts(result, columns))
+
+
+STRATEGIES = {
+    "orm+schema": (orm_and_schema, None),
+    "rows": (core_rows, None),
+    "rows+fields": (core_rows, "name,status"),
+}
+
+
+def measure(build, rows: int, fields, repeat: int) -> dict:
+    from database import SessionLocal
+
+    best_wall = best_cpu = float("inf")
+    for _ in range(repeat):
+        with SessionLocal() as session:
+            gc.collect()
+            wall, cpu = time.perf_counter(), time.process_time()
+            body = build(session, rows, fields)
+            best_wall = min(best_wall, time.perf_counter() - wall)
+            best_cpu = min(best_cpu, time.process_time() - cpu)
+
+    with SessionLocal() as session:
+        gc.collect()
+        tracemalloc.start()
+        build(session, rows, fields)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "wall_ms": round(best_wall * 1000, 1),
+        "cpu_ms": round(best_cpu * 1000, 1),
+        "peak_mb": round(peak / 2**20, 1),
+        "body_kb": round(len(body) / 1024, 1),
+    }
+
+
+async def main(args) -> None:
+    import bootstrap
+    from database import SessionLocal, async_engine
+    from models import Item
+
+    bootstrap.run()
+    with SessionLocal() as session:
+        missing = args.rows - session.execute(select(func.count(Item.id))).scalar()
+    if missing > 0:
+        await fill(users=max(missing // 20, 1), items=missing, requests=0)
+    await async_engine.dispose()
+
+    try:
+        import orjson  # noqa: F401
+        serializer = "orjson"
+    except ImportError:
+        serializer = "json"
+    report = {"rows": args.rows, "serializer": serializer, "strategies": {}}
+    for name, (build, fields) in STRATEGIES.items():
+        report["strategies"][name] = measure(build, args.rows, fields, args.repeat)
+    baseline = report["strategies"]["orm+schema"]
+    for name, stats in report["strategies"].items():
+        if name != "orm+schema":
+            stats["cpu_vs_orm"] = round(stats["cpu_ms"] / baseline["cpu_ms"], 2)
+            stats["peak_vs_orm"] = round(stats["peak_mb"] / baseline["peak_mb"], 2)
+    dump(report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare list serialisation strategies on many items")
+    parser.add_argument("--rows", type=int, default=100000, help="items per list")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per strategy, the best is reported")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import time
+from benchmarks.common import dump
+
+# What a client transfers to keep its copy of the items current, in-process
+# against the app:
+#
+#     python -m benchmarks.sync --items 100000 --edits 50
+#
+# cold:  every item once, through GET /changes pages (what the frontend
+#        store does on first load) and through GET /items/ keyset pages
+#        (what the list views did on every visit)
+# warm:  after --edits updates and deletes, the /changes delta against
+#        reading the whole list again
+#
+# Reported: requests, bytes and wall time per strategy. The items table is
+# topped up with benchmarks.seed rows when it holds fewer than --items.
+
+
+async def changes(client, since=None, limit=None) -> tuple[int, int, str]:
+    requests = size = 0
+    more = True
+    while more:
+        params = {"entities": "items"}
+        if since:
+            params["since"] = since
+        if limit:
+            params["limit"] = limit
+        response = await client.get("/changes", params=params)
+        response.raise_for_status()
+        body = response.json()
+        requests, size = requests + 1, size + len(response.content)
+        since, more = body["cursor"], body["more"]
+    return requests, size, since
+
+
+async def item_pages(client, limit: int) -> tuple[int, int]:
+    requests = size = 0
+    cursor = None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/items/", params=params)
+        response.raise_for_status()
+        requests, size = requests + 1, size + len(response.content)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return requests, size
+
+
+async def main(args) -> None:
+    from sqlalchemy import func, select
+    import bootstrap
+    from app import app
+    from benchmarks.common import asgi_client
+    from benchmarks.seed import fill
+    from database import async_engine
+    from models import Item
+
+    bootstrap.run()
+    async with async_engine.connect() as conn:
+        existing = (await conn.execute(select(func.count()).select_from(Item))).scalar()
+    if existing < args.items:
+        await fill(0, args.items - existing, 0)
+
+    report = {}
+    async with asgi_client(app) as client:
+        started = time.perf_counter()
+        requests, size, cursor = await changes(client, limit=args.page)
+        report["cold_changes"] = {"requests": requests, "kb": size // 1024, "seconds": round(time.perf_counter() - started, 2)}
+        started = time.perf_counter()
+        requests, size = await item_pages(client, 1000)
+        report["cold_item_pages"] = {"requests": requests, "kb": size // 1024, "seconds": round(time.perf_counter() - started, 2)}
+
+        token = (await client.post("/login/", json={"username": "admin", "password": "admin"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        async with async_engine.connect() as conn:
+            ids = (await conn.execute(select(Item.id).order_by(Item.id.desc()).limit(args.edits))).scalars().all()
+        for n, item_id in enumerate(ids):
+            if n % 5 == 0:
+                await client.delete(f"/items/{item_id}/", headers=headers)
+            else:
+                await client.patch(f"/items/{item_id}/", json={"location": f"Bench room {n}"}, headers=headers)
+
+        started = time.perf_counter()
+        requests, size, _ = await changes(client, since=cursor)
+        report["warm_changes"] = {"requests": requests, "kb": round(size / 1024, 1), "seconds": round(time.perf_counter() - started, 3)}
+        started = time.perf_counter()
+        requests, size = await item_pages(client, 1000)
+        report["warm_item_pages"] = {"requests": requests, "kb": size // 1024, "seconds": round(time.perf_counter() - started, 2)}
+    await async_engine.dispose()
+
+    dump({"items": max(existing, args.items), "edits": len(ids), **report})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare incremental sync with refetching the item list")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--edits", type=int, default=50, help="items updated (4 in 5) or deleted before the warm sync")
+    parser.add_argument("--page", type=int, default=5000, help="limit per /changes request")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+import logging
+import os
+import time
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from auth import get_password_hash
+from database import Base, engine
+from models import DEFAULT_SCHOOL_ID, ItemType, Location, School, User
+import database
+import ledger
+import search  # noqa: F401  registers the search DDL that create_all runs
+import tenancy
+
+# One-time database setup: tables missing from the schema (Alembic remains
+# the way to change existing ones), the upcoming item_events partitions and
+# the default school and its admin account. Tenant shards (see database.py)
+# get the same tables plus a copy of the rows every school shares, and with
+# TENANT_RLS=1 the row-level security policies are (re)created.
+#
+# Everything runs in one transaction holding a PostgreSQL advisory lock, so
+# when several processes or hosts start together one does the work and the
+# others wait, then find nothing left to do. serve.py runs it once before
+# starting the workers and sets APP_BOOTSTRAPPED so they skip it; a plain
+# `uvicorn app:app` runs it from the startup hook in every worker instead.
+
+BOOTSTRAP_LOCK_ID = 7318220451  # arbitrary, shared by every process of this app
+BOOTSTRAPPED_ENV = "APP_BOOTSTRAPPED"
+
+logger = logging.getLogger(__name__)
+
+
+def create_default_school(conn: Connection) -> None:
+    if conn.scalar(select(School.id).where(School.id == DEFAULT_SCHOOL_ID)) is None:
+        conn.execute(School.__table__.insert().values(id=DEFAULT_SCHOOL_ID, name="Default school"))
+        if conn.dialect.name == "postgresql":
+            # the id was given, so move the sequence past it
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('schools', 'id'), (SELECT max(id) FROM schools))"))
+
+
+def create_default_admin(db: Session) -> None:
+    if db.query(User).filter_by(school_id=DEFAULT_SCHOOL_ID, username="admin").first() is None:
+        db.add(User(
+            school_id=DEFAULT_SCHOOL_ID,
+            username="admin",
+            email="admin@example.com",
+            password=get_password_hash("admin"),
+            role="admin",
+        ))
+        db.flush()
+
+
+def run() -> float:
+    """Bootstrap the database; returns the seconds it took, lock wait included."""
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # released when this transaction ends
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": BOOTSTRAP_LOCK_ID})
+        Base.metadata.create_all(bind=conn)
+        ledger.ensure_partitions(conn)
+        create_default_school(conn)
+        with Session(bind=conn) as db:
+            create_default_admin(db)
+        if tenancy.TENANT_RLS and conn.dialect.name == "postgresql":
+            tenancy.enable_rls(conn)
+        shared = [(model.__table__, conn.execute(select(model.__table__)).mappings().all()) for model in (School, ItemType, Location)]
+    for shard in database.shard_engines():
+        prepare_shard(shard, shared)
+    elapsed = time.perf_counter() - started
+    logger.info("database bootstrap done in %.2fs", elapsed)
+    return elapsed
+
+
+def prepare_shard(shard, shared: list) -> None:
+    """Schema, partitions and the shared (table, rows) of the main database, in a tenant shard."""
+    with shard.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": BOOTSTRAP_LOCK_ID})
+        Base.metadata.create_all(bind=conn)
+        ledger.ensure_partitions(conn)
+        for table, rows in shared:
+            if rows:
+                dialect_insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+                conn.execute(dialect_insert(table).on_conflict_do_nothing(), [dict(row) for row in rows])
+        if tenancy.TENANT_RLS and conn.dialect.name == "postgresql":
+            tenancy.enable_rls(conn)
+
+
+def already_done() -> bool:
+    return os.getenv(BOOTSTRAPPED_ENV) == "1"
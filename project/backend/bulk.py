@@ -0,0 +1,183 @@
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator, Optional
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from database import AsyncSessionLocal, async_engine_for
+from models import Item
+from schemas import ItemCreate
+import counters
+import events
+import ledger
+import lookups
+import tenancy
+import versioning
+
+# Bulk import/export of items as CSV or NDJSON.
+#
+# Imports are parsed line by line from the request stream, validated against
+# ItemCreate and inserted CHUNK_SIZE rows at a time (COPY on asyncpg, a single
+# executemany INSERT elsewhere), committing after every chunk together with
+# the items' "created" rows in the item_events ledger. Exports stream
+# rows through a server-side cursor so memory use doesn't grow with the table.
+# Both work on the current school's items only.
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+IMPORT_COLUMNS = ["name", "type", "serial_number", "condition", "status", "location"]
+EXPORT_COLUMNS = ["id"] + IMPORT_COLUMNS
+
+CSV_TYPES = {"text/csv", "application/csv"}
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def iter_csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[dict]:
+    header = None
+    record = ""
+    async for line in lines:
+        record = record + "\n" + line if record else line
+        # a quoted field may contain newlines; wait for its closing quote
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]), [])
+        record = ""
+        if not values or values == [""]:
+            continue
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        yield dict(zip(header, values))
+
+
+async def iter_ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[dict]:
+    async for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # surfaced as a per-row validation error
+            yield {"__invalid_json__": line}
+
+
+def validate_row(row) -> tuple[Optional[dict], list[str]]:
+    if not isinstance(row, dict) or "__invalid_json__" in row:
+        return None, ["row is not a JSON object"]
+    try:
+        item = ItemCreate(**row)
+    except ValidationError as e:
+        return None, [f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()]
+    return {column: getattr(item, column) for column in IMPORT_COLUMNS}, []
+
+
+async def insert_chunk(db: AsyncSession, rows: list[dict]) -> None:
+    # new type/location names get their lookup rows first, on a connection of their own
+    await run_in_threadpool(lookups.ensure_rows, Item.__table__, rows)
+    conn = await db.connection()
+    school = tenancy.current()
+    # bumped first so the rows carry their version (see sync.py)
+    versions = await conn.run_sync(versioning.bump, ["items"], school)
+    rows = [{**row, "school_id": school, "version": versions["items"]} for row in rows]
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        records = [lookups.copy_values(Item.__table__, row) for row in rows]
+        await raw.driver_connection.copy_records_to_table(
+            Item.__tablename__,
+            records=[tuple(record.values()) for record in records],
+            columns=list(records[0]),
+        )
+    else:
+        await db.execute(insert(Item), rows)
+    # COPY and executemany skip the flush hook that writes the ledger; this chunk's
+    # rows are the only ones of this school carrying the version bumped above
+    created = await conn.execute(
+        select(Item.id, Item.status, Item.location).where(Item.school_id == school, Item.version == versions["items"])
+    )
+    await conn.run_sync(ledger.write, [
+        {"school_id": school, "item_id": item_id, "kind": "created", "status": status, "location": location}
+        for item_id, status, location in created
+    ])
+    await conn.run_sync(counters.apply, counters.row_deltas("items", rows))
+    events.record_bulk(db.sync_session, "items", len(rows), versions, school)
+    await db.commit()
+
+
+async def import_items(db: AsyncSession, rows: AsyncIterator[dict]) -> dict:
+    """
+    Validate and insert rows in chunks. Returns counts plus per-row errors
+    (1-based data row numbers, the header line of a CSV is not counted).
+    """
+    inserted = 0
+    failed = 0
+    errors = []
+    chunk = []
+    chunk_start = 1
+
+    async def flush():
+        nonlocal inserted, failed
+        try:
+            await insert_chunk(db, chunk)
+            inserted += len(chunk)
+        except Exception as e:
+            await db.rollback()
+            failed += len(chunk)
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"rows": [chunk_start, chunk_start + len(chunk) - 1], "errors": [f"batch not inserted: {e.__class__.__name__}"]})
+
+    row_number = 0
+    async for row in rows:
+        row_number += 1
+        values, row_errors = validate_row(row)
+        if row_errors:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"row": row_number, "errors": row_errors})
+            continue
+        if not chunk:
+            chunk_start = row_number
+        chunk.append(values)
+        if len(chunk) >= CHUNK_SIZE:
+            await flush()
+            chunk = []
+    if chunk:
+        await flush()
+
+    return {"inserted": inserted, "failed": failed, "errors": errors}
+
+
+async def export_items(fmt: str) -> AsyncIterator[str]:
+    # own session: the response body is produced after the route has returned
+    async with AsyncSessionLocal(bind=async_engine_for(tenancy.current())) as db:
+        stmt = select(*(getattr(Item, column) for column in EXPORT_COLUMNS)).order_by(Item.id)
+        result = await db.stream(stmt.execution_options(yield_per=CHUNK_SIZE))
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            yield buffer.getvalue()
+        async for partition in result.partitions():
+            if fmt == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(partition)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in partition)
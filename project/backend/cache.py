@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from fastapi import Response
+from pydantic import TypeAdapter
+from projection import dumps
+from versioning import Validators
+
+# Read-through cache for serialised GET responses.
+#
+# Entries are keyed by the ETag of the response - the school and the
+# table_versions of every table it was built from, which the route has just
+# read for its conditional GET - e.g. 'W/"s1-requests.3-items.7"|expand=item'.
+# Every write bumps those versions in the database, whichever worker made
+# it, so stale entries are never read again and simply age out of the
+# backend. Nothing needs invalidating by hand.
+#
+# Backends:
+#   memory - in-process LRU with a TTL (default)
+#   redis  - any client speaking the Redis protocol (redis-py, fakeredis, ...),
+#            shared by every worker process
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))  # seconds
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "1024"))  # entries, memory backend only
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, ttl: int = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+
+class RedisBackend:
+    name = "redis"
+
+    def __init__(self, client=None, url: str = CACHE_URL, ttl: int = CACHE_TTL, prefix: str = "sims:cache:"):
+        if client is None:
+            import redis  # optional dependency, only needed for CACHE_BACKEND=redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._adapters: dict[Any, TypeAdapter] = {}
+
+    @staticmethod
+    def key(validators: Validators, suffix: str = "") -> str:
+        return f"{validators.etag}|{suffix}"
+
+    def get(self, key: str) -> Optional[Response]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        headers, _, body = value.partition(b"\n")
+        return Response(content=body, media_type="application/json", headers=json.loads(headers))
+
+    def store(self, key: str, schema, data, headers: Optional[dict] = None, exclude_unset: bool = False) -> Response:
+        """Serialise `data` (ORM objects or dicts) through `schema`, cache it and return the response."""
+        adapter = self._adapters.get(schema)
+        if adapter is None:
+            adapter = self._adapters[schema] = TypeAdapter(schema)
+        body = adapter.dump_json(adapter.validate_python(data, from_attributes=True), exclude_unset=exclude_unset)
+        return self._save(key, body, headers)
+
+    def store_rows(self, key: str, rows: list[dict], headers: Optional[dict] = None) -> Response:
+        """Like store() for plain rows read from the database; serialised as-is, without a schema pass."""
+        return self._save(key, dumps(rows), headers)
+
+    def _save(self, key: str, body: bytes, headers: Optional[dict]) -> Response:
+        headers = headers or {}
+        self.backend.set(key, json.dumps(headers).encode() + b"\n" + body)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def create_backend():
+    if CACHE_BACKEND == "redis":
+        return RedisBackend()
+    return MemoryBackend()
+
+
+response_cache = ResponseCache(create_backend())
@@ -0,0 +1,143 @@
+from collections import Counter
+from itertools import chain
+from typing import Iterable
+from sqlalchemy import delete, event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import DEFAULT_SCHOOL_ID, Item, Request, RequestStatus, StatCounter, StatusOptions, User
+
+# Materialised counts behind GET /stats/summary.
+#
+# stat_counters holds one row per (counter, value): "items" / "" is the item
+# total, "items.status" / "Available" the number of available items, and so
+# on. Every ORM flush turns its inserts, deletes and changed status/location
+# values into +1/-1 deltas and applies them in the same transaction, so the
+# summary is read from a handful of rows however large the tables get. Core
+# inserts that bypass the ORM (bulk import, the seeding tool) call apply()
+# or rebuild() themselves. Counts are kept per school.
+
+# table -> columns broken down by value
+COUNTED = {
+    Item: ("status", "location"),
+    Request: ("status",),
+    User: (),
+}
+_BY_TABLE = {model.__table__.name: columns for model, columns in COUNTED.items()}
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+# active_history loads the current value before an assignment replaces it, so
+# history.deleted holds the old value even when the attribute had expired
+for _model, _columns in COUNTED.items():
+    for _column in _columns:
+        event.listen(getattr(_model, _column), "set", _keep_old_value, active_history=True, retval=True)
+
+def _key(value) -> str:
+    return "" if value is None else str(value)
+
+def row_deltas(table: str, rows: Iterable[dict], sign: int = 1) -> Counter:
+    """Deltas for plain dict rows of `table`, e.g. a chunk of bulk-imported items."""
+    deltas = Counter()
+    for row in rows:
+        school = row.get("school_id", DEFAULT_SCHOOL_ID)
+        deltas[(school, table, "")] += sign
+        for column in _BY_TABLE[table]:
+            deltas[(school, f"{table}.{column}", _key(row.get(column)))] += sign
+    return deltas
+
+def _flush_deltas(session: Session) -> Counter:
+    deltas = Counter()
+    for obj in chain(session.new, session.deleted):
+        columns = COUNTED.get(type(obj))
+        if columns is None:
+            continue
+        table = obj.__table__.name
+        row = {column: getattr(obj, column) for column in columns}
+        row["school_id"] = obj.school_id
+        deltas.update(row_deltas(table, [row], 1 if obj in session.new else -1))
+    for obj in session.dirty:
+        for column in COUNTED.get(type(obj), ()):
+            history = inspect(obj).attrs[column].history
+            if history.has_changes():
+                name = f"{obj.__table__.name}.{column}"
+                for value in history.deleted:
+                    deltas[(obj.school_id, name, _key(value))] -= 1
+                for value in history.added:
+                    deltas[(obj.school_id, name, _key(value))] += 1
+    return deltas
+
+def apply(connection: Connection, deltas: Counter) -> None:
+    counters = StatCounter.__table__
+    # fixed order so concurrent writers lock the counter rows consistently
+    for (school, name, key), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        if connection.dialect.name in ("postgresql", "sqlite"):
+            dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+            stmt = dialect_insert(counters).values(school_id=school, name=name, key=key, count=delta)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=["school_id", "name", "key"], set_={"count": counters.c.count + delta}
+            ))
+            continue
+        result = connection.execute(
+            update(counters)
+            .where(counters.c.school_id == school, counters.c.name == name, counters.c.key == key)
+            .values(count=counters.c.count + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(counters.insert().values(school_id=school, name=name, key=key, count=delta))
+
+def rebuild(connection: Connection) -> None:
+    """Recount everything from the tables; a full scan, for bulk loads and repairs."""
+    connection.execute(delete(StatCounter.__table__))
+    deltas = Counter()
+    for model, columns in COUNTED.items():
+        table = model.__table__.name
+        for school, count in connection.execute(select(model.school_id, func.count()).group_by(model.school_id)):
+            deltas[(school, table, "")] = count
+        for column in columns:
+            attr = getattr(model, column)
+            for school, value, count in connection.execute(
+                select(model.school_id, attr, func.count()).group_by(model.school_id, attr)
+            ):
+                deltas[(school, f"{table}.{column}", _key(value))] = count
+    apply(connection, deltas)
+
+@event.listens_for(Session, "after_flush")
+def _count_flushed_rows(session: Session, flush_context) -> None:
+    deltas = _flush_deltas(session)
+    if any(deltas.values()):
+        apply(session.connection(), deltas)
+
+
+def _summary(rows) -> dict:
+    counts = {}
+    for name, key, count in rows:
+        counts.setdefault(name, {})[key] = count
+
+    def breakdown(name, known=()):
+        # every known status shows up, even at zero; empty groups are left out
+        values = {value: 0 for value in known}
+        values.update({key: count for key, count in counts.get(name, {}).items() if count})
+        return values
+
+    return {
+        "items": {
+            "total": counts.get("items", {}).get("", 0),
+            "by_status": breakdown("items.status", [status.value for status in StatusOptions]),
+            "by_location": breakdown("items.location"),
+        },
+        "requests": {
+            "total": counts.get("requests", {}).get("", 0),
+            "by_status": breakdown("requests.status", [status.value for status in RequestStatus]),
+        },
+        "users": {"total": counts.get("users", {}).get("", 0)},
+    }
+
+async def read_summary_async(db: AsyncSession) -> dict:
+    # the session's school filter narrows this to the current school
+    result = await db.execute(select(StatCounter.name, StatCounter.key, StatCounter.count))
+    return _summary(result.all())
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from models import Item, Request
+
+# Change feed behind GET /events.
+#
+# Every ORM flush records a compact change for each item and request it
+# inserted, updated or deleted: entity, id, op, the fields that changed and
+# the table version from versioning.py, which is what the ETags are built
+# from. Changes are only published once the transaction commits; a rollback
+# discards them. Each change names its school, and subscribers are kept per
+# school so a busy school's changes never queue up behind anyone else's.
+#
+# EVENTS_BACKEND=memory (default) hands them straight to the in-process hub,
+# which is enough for a single worker. EVENTS_BACKEND=postgres sends them
+# with pg_notify inside the committing transaction instead, and every worker
+# LISTENs on the channel and feeds its own hub, so clients see the same
+# changes whichever worker they are connected to.
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "app_events")
+SUBSCRIBER_QUEUE = int(os.getenv("EVENTS_QUEUE_SIZE", "512"))
+HEARTBEAT_SECONDS = 15  # comment lines keep idle streams from being cut by proxies
+
+PUBLISHED = {Item: "items", Request: "requests"}
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    """Fans change records out to the subscribers of this process."""
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE):
+        self.queue_size = queue_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers: dict[int, set[asyncio.Queue]] = {}
+
+    @asynccontextmanager
+    async def subscribe(self, school_id: int):
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(school_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self.subscribers.get(school_id, set())
+            queues.discard(queue)
+            if not queues:
+                self.subscribers.pop(school_id, None)
+
+    def publish(self, changes: list[dict]) -> None:
+        """Safe to call from any thread; sync routes commit in the threadpool."""
+        if self.loop is None or not self.subscribers or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._deliver, changes)
+
+    def _deliver(self, changes: list[dict]) -> None:
+        by_school = {}
+        for change in changes:
+            by_school.setdefault(change["school_id"], []).append(change)
+        for school_id, school_changes in by_school.items():
+            for queue in list(self.subscribers.get(school_id, ())):
+                for change in school_changes:
+                    try:
+                        queue.put_nowait(change)
+                    except asyncio.QueueFull:
+                        # a client this far behind is better off reloading than replaying
+                        while not queue.empty():
+                            queue.get_nowait()
+                        queue.put_nowait({"entity": "*", "op": "resync"})
+                        break
+
+
+hub = EventHub()
+
+
+def _fields(obj) -> dict:
+    # only loaded values; reading an expired attribute here would issue a query
+    loaded = inspect(obj).dict
+    return {column.key: loaded[column.key] for column in obj.__table__.columns if column.key in loaded}
+
+
+def _changed_fields(obj) -> dict:
+    state = inspect(obj)
+    return {
+        column.key: state.dict.get(column.key)
+        for column in obj.__table__.columns
+        if state.attrs[column.key].history.has_changes()
+    }
+
+
+def _current_transaction(session: Session):
+    # changes are tagged with the innermost transaction so a rolled back savepoint drops only its own
+    return session.get_nested_transaction() or session.get_transaction()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session: Session, flush_context) -> None:
+    pending = session.info.setdefault("pending_changes", [])
+    transaction = _current_transaction(session)
+    for obj in session.new:
+        if type(obj) in PUBLISHED:
+            pending.append((transaction, obj.school_id, PUBLISHED[type(obj)], obj.id, "created", _fields(obj)))
+    for obj in session.dirty:
+        if type(obj) in PUBLISHED and session.is_modified(obj, include_collections=False):
+            pending.append((transaction, obj.school_id, PUBLISHED[type(obj)], obj.id, "updated", _changed_fields(obj)))
+    for obj in session.deleted:
+        if type(obj) in PUBLISHED:
+            pending.append((transaction, obj.school_id, PUBLISHED[type(obj)], obj.id, "deleted", {}))
+
+
+def _changes(session: Session) -> list[dict]:
+    versions = session.info.get("table_versions", {})
+    return [
+        jsonable_encoder({
+            "entity": entity, "id": obj_id, "op": op, "fields": fields,
+            "version": versions.get(school, {}).get(entity), "school_id": school,
+        })
+        for _, school, entity, obj_id, op, fields in session.info.get("pending_changes", [])
+    ]
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_changes(session: Session) -> None:
+    if EVENTS_BACKEND != "postgres" or not session.info.get("pending_changes"):
+        return
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    connection = session.connection()
+    for change in _changes(session):
+        # NOTIFY is transactional: listeners only hear it if this commit succeeds
+        connection.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": EVENTS_CHANNEL, "payload": json.dumps(change)})
+    session.info.pop("pending_changes")
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session: Session) -> None:
+    if session.info.get("pending_changes"):
+        hub.publish(_changes(session))
+    _reset(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changes(session: Session, previous_transaction) -> None:
+    if not previous_transaction.nested:
+        _reset(session)
+        return
+
+    def inside(transaction):
+        while transaction is not None:
+            if transaction is previous_transaction:
+                return True
+            transaction = transaction.parent
+        return False
+
+    pending = session.info.get("pending_changes", [])
+    session.info["pending_changes"] = [change for change in pending if not inside(change[0])]
+
+
+def _reset(session: Session) -> None:
+    session.info.pop("pending_changes", None)
+    session.info.pop("table_versions", None)
+
+
+def record_bulk(session: Session, entity: str, count: int, versions: dict[str, int], school_id: int) -> None:
+    """
+    Core inserts bypass the flush hooks; queue one "bulk" change for them that
+    tells clients to reload, published with the rest when `session` commits.
+    """
+    session.info.setdefault("table_versions", {}).setdefault(school_id, {}).update(versions)
+    session.info.setdefault("pending_changes", []).append(
+        (_current_transaction(session), school_id, entity, None, "bulk", {"count": count})
+    )
+
+
+async def stream(entities: set[str], school_id: int):
+    """Server-sent events for one school's changes to `entities`, until the client goes away."""
+    async with hub.subscribe(school_id) as queue:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                change = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if change["entity"] in entities or change["entity"] == "*":
+                yield f"event: change\ndata: {json.dumps(change)}\n\n"
+
+
+_listener_task: Optional[asyncio.Task] = None
+
+
+async def _listen() -> None:
+    from database import async_engine
+
+    def on_notify(connection, pid, channel, payload):
+        hub._deliver([json.loads(payload)])
+
+    while True:
+        try:
+            async with async_engine.connect() as conn:
+                raw = (await conn.get_raw_connection()).driver_connection
+                await raw.add_listener(EVENTS_CHANNEL, on_notify)
+                try:
+                    # the connection stays checked out; poll it so a dropped one is noticed
+                    while not raw.is_closed():
+                        await asyncio.sleep(5)
+                        await raw.execute("SELECT 1")
+                finally:
+                    if not raw.is_closed():
+                        await raw.remove_listener(EVENTS_CHANNEL, on_notify)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("event listener lost its connection, reconnecting")
+            await asyncio.sleep(1)
+
+
+async def start() -> None:
+    global _listener_task
+    hub.loop = asyncio.get_running_loop()
+    if EVENTS_BACKEND == "postgres" and _listener_task is None:
+        _listener_task = asyncio.create_task(_listen())
+
+
+async def stop() -> None:
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
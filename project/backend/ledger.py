@@ -0,0 +1,208 @@
+import argparse
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import DDL, and_, delete, event, func, insert, inspect, or_, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from models import Item, ItemEvent, Request, RequestStatus
+
+# Append-only item history (item_events).
+#
+# Every ORM flush that creates, edits (status or location), checks out or
+# deletes an item, or denies a request for one, appends a row in the same
+# transaction, so the history survives the request or item being deleted.
+# Rows are never updated.
+#
+# On PostgreSQL the table is partitioned by month on occurred_at: time range
+# queries only touch the partitions they overlap, a BRIN index covers
+# occurred_at inside each partition, and per-item history uses the
+# (item_id, occurred_at) btree. Partitions are created ahead of time by
+# ensure_partitions() (at startup and by the retention job below); rows outside
+# them land in item_events_default. Expiring a month detaches and drops its
+# partition instead of deleting rows one by one.
+#
+#     python ledger.py --keep-months 24
+#
+# Elsewhere (SQLite) it is a plain table and the retention job deletes rows.
+
+RETENTION_MONTHS = int(os.getenv("LEDGER_RETENTION_MONTHS", "24"))
+PARTITIONS_AHEAD = int(os.getenv("LEDGER_PARTITIONS_AHEAD", "3"))  # months created in advance
+
+PARTITION_PREFIX = "item_events_y"
+
+event.listen(
+    ItemEvent.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS item_events_default PARTITION OF item_events DEFAULT").execute_if(dialect="postgresql"),
+)
+
+
+def _month(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month.year:04d}m{month.month:02d}"
+
+
+def _partitions(connection: Connection) -> list[str]:
+    return list(connection.execute(text(
+        "SELECT child.relname FROM pg_inherits"
+        " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+        " JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+        " WHERE parent.relname = 'item_events'"
+    )).scalars())
+
+
+def ensure_partitions(connection: Connection, since: Optional[datetime] = None, ahead: int = PARTITIONS_AHEAD) -> list[str]:
+    """Create the monthly partitions from `since` (default: this month) to `ahead` months from now."""
+    if connection.dialect.name != "postgresql":
+        return []
+    today = datetime.now(timezone.utc).date()
+    month = _month((since or datetime.now(timezone.utc)).date())
+    last = _month(today)
+    for _ in range(ahead):
+        last = _next_month(last)
+    existing = set(_partitions(connection))
+    created = []
+    while month <= last:
+        name = partition_name(month)
+        if name not in existing:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF item_events"
+                f" FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+            ))
+            created.append(name)
+        month = _next_month(month)
+    return created
+
+
+def drop_expired(connection: Connection, keep_months: int = RETENTION_MONTHS) -> list[str]:
+    """Remove history older than `keep_months` whole months; returns the dropped partitions."""
+    cutoff = _month(datetime.now(timezone.utc).date())
+    for _ in range(keep_months):
+        cutoff = _month(cutoff - timedelta(days=1))
+    if connection.dialect.name != "postgresql":
+        connection.execute(delete(ItemEvent).where(ItemEvent.occurred_at < cutoff))
+        return []
+
+    dropped = []
+    for name in sorted(_partitions(connection)):
+        if not name.startswith(PARTITION_PREFIX):
+            continue
+        year, month = int(name[len(PARTITION_PREFIX):][:4]), int(name[-2:])
+        if _next_month(date(year, month, 1)) <= cutoff:
+            # catalog-only work, however many rows the month holds
+            connection.execute(text(f"ALTER TABLE item_events DETACH PARTITION {name}"))
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    # stragglers that fell into the default partition
+    connection.execute(delete(ItemEvent).where(ItemEvent.occurred_at < cutoff))
+    return dropped
+
+
+def _event(kind: str, item_id: int, item: Optional[Item] = None, request: Optional[Request] = None, previous_status=None) -> dict:
+    return {
+        "school_id": (item if item is not None else request).school_id,
+        "item_id": item_id,
+        "kind": kind,
+        "status": item.status if item is not None else None,
+        "previous_status": previous_status,
+        "location": item.location if item is not None else None,
+        "request_id": request.id if request is not None else None,
+        "user_id": request.user_id if request is not None else None,
+    }
+
+
+def _flush_events(session: Session) -> list[dict]:
+    rows = []
+    approved = {}  # item_id -> request approved in this flush
+    for obj in session.dirty:
+        if isinstance(obj, Request) and inspect(obj).attrs.status.history.has_changes():
+            if obj.status == RequestStatus.approved.value:
+                approved[obj.item_id] = obj
+            elif obj.status == RequestStatus.denied.value:
+                rows.append(_event("denied", obj.item_id, request=obj))
+    for obj in session.new:
+        if isinstance(obj, Item):
+            rows.append(_event("created", obj.id, obj))
+    for obj in session.dirty:
+        if not isinstance(obj, Item):
+            continue
+        state = inspect(obj)
+        status = state.attrs.status.history
+        if not (status.has_changes() or state.attrs.location.history.has_changes()):
+            continue
+        previous = status.deleted[0] if status.deleted else None
+        request = approved.pop(obj.id, None)
+        rows.append(_event("checked_out" if request else "updated", obj.id, obj, request, previous))
+    for item_id, request in approved.items():
+        rows.append(_event("checked_out", item_id, request=request))
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            rows.append(_event("deleted", obj.id, obj))
+    return rows
+
+
+def write(connection: Connection, rows: list[dict]) -> None:
+    if connection.dialect.name == "postgresql":
+        connection.execute(insert(ItemEvent), rows)
+        return
+    # SQLite only autoincrements a single-column key, and this one includes occurred_at;
+    # the timestamp is set here so it is stored in the format range filters compare against
+    next_id = select(func.coalesce(func.max(ItemEvent.id), 0) + 1).scalar_subquery()
+    now = datetime.now(timezone.utc)
+    for row in rows:
+        connection.execute(insert(ItemEvent).values(id=next_id, occurred_at=now, **row))
+
+
+@event.listens_for(Session, "after_flush")
+def _record_item_events(session: Session, flush_context) -> None:
+    rows = _flush_events(session)
+    if rows:
+        write(session.connection(), rows)
+
+
+def history_query(columns, item_id=None, since=None, until=None, kind=None, before=None, limit=100):
+    """Newest first. `before` is the (occurred_at, id) of the last row of the previous page."""
+    stmt = select(*columns)
+    if item_id is not None:
+        stmt = stmt.where(ItemEvent.item_id == item_id)
+    if since is not None:
+        stmt = stmt.where(ItemEvent.occurred_at >= since)
+    if until is not None:
+        stmt = stmt.where(ItemEvent.occurred_at < until)
+    if kind is not None:
+        stmt = stmt.where(ItemEvent.kind == kind)
+    if before is not None:
+        occurred_at, event_id = before
+        # the plain bound lets the planner prune partitions, the OR breaks ties
+        stmt = stmt.where(ItemEvent.occurred_at <= occurred_at).where(
+            or_(ItemEvent.occurred_at < occurred_at, and_(ItemEvent.occurred_at == occurred_at, ItemEvent.id < event_id))
+        )
+    return stmt.order_by(ItemEvent.occurred_at.desc(), ItemEvent.id.desc()).limit(limit)
+
+
+def main(args) -> None:
+    import database
+
+    created, dropped = [], []
+    # the main database and every tenant shard keep their own history
+    for engine in [database.engine, *database.shard_engines()]:
+        with engine.begin() as conn:
+            created += ensure_partitions(conn, ahead=args.ahead)
+            dropped += drop_expired(conn, args.keep_months)
+    print(f"created {len(created)} partition(s) {' '.join(created)}".rstrip())
+    print(f"dropped {len(dropped)} partition(s) {' '.join(dropped)}".rstrip())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create upcoming item_events partitions and drop expired ones")
+    parser.add_argument("--keep-months", type=int, default=RETENTION_MONTHS, help="whole months of history to keep")
+    parser.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD, help="future months to create partitions for")
+    main(parser.parse_args())
@@ -0,0 +1,230 @@
+import threading
+import time
+from collections import defaultdict
+from itertools import chain
+from enum import Enum
+from typing import Iterable, Optional
+from sqlalchemy import SmallInteger, column, event, inspect, select, table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.util.concurrency import await_only, in_greenlet
+import database
+
+# Small vocabularies stored compactly while the API keeps using strings.
+#
+# items.type and items.location hold smallint ids into the item_types and
+# locations lookup tables. The LookupName column type converts between names
+# and ids on the way in and out, so Item.location reads and writes "Library",
+# Item.location == "Library" filters on the indexed id, and group-bys come
+# back as names. Ids are cached per process and loaded at startup; a name or
+# id this process has not seen (another worker added it) reloads the whole
+# table, which holds dozens of rows. Inside an AsyncSession that reload goes
+# through the async engine, so the event loop never waits on it.
+#
+# New names are inserted by ensure() on a connection of their own, committed
+# straight away, before the row that uses them is written: every ORM flush
+# does it for the rows it writes and Core inserts call it themselves.
+# Filtering on a name that does not exist matches nothing and adds nothing.
+# A lookup row may outlive a rolled back write that added it, which is
+# harmless. The tables are shared by every school; tenant shards (see
+# database.py) get a copy of each new row. SQLite allows a single writer,
+# so there the names are inserted in the caller's transaction instead and
+# forgotten if it rolls back.
+#
+# status and condition use native enums instead (see models.py); canonical()
+# maps any capitalisation of a label to the label.
+
+RELOAD_INTERVAL = 1.0  # seconds; bounds reloads caused by filtering on unknown names
+
+
+class LookupCache:
+    def __init__(self, name: str):
+        self.table = table(name, column("id"), column("name"))
+        self._ids: dict[str, int] = {}
+        self._names: dict[int, str] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def reload(self, force: bool = True) -> None:
+        query = select(self.table.c.id, self.table.c.name)
+        if in_greenlet():
+            # an AsyncSession on the event loop: no thread lock, another
+            # coroutine on this thread may hold it while it waits
+            if force or not self._fresh():
+                self._store(await_only(self._read_async(query)))
+            return
+        with self._lock:
+            if not force and self._fresh():
+                return
+            with database.engine.connect() as conn:
+                self._store(conn.execute(query).all())
+
+    @staticmethod
+    async def _read_async(query) -> list:
+        async with database.async_engine.connect() as conn:
+            return (await conn.execute(query)).all()
+
+    def _fresh(self) -> bool:
+        return time.monotonic() - self._loaded_at < RELOAD_INTERVAL
+
+    def _store(self, rows) -> None:
+        self._ids = {name: id for id, name in rows}
+        self._names = {id: name for id, name in rows}
+        self._loaded_at = time.monotonic()
+
+    def id_for(self, name: str) -> Optional[int]:
+        if name not in self._ids:
+            self.reload(force=False)
+        return self._ids.get(name)
+
+    def name_for(self, id: int) -> str:
+        if id not in self._names:
+            self.reload()
+        return self._names[id]
+
+    def ensure(self, names: Iterable[Optional[str]], connection: Optional[Connection] = None) -> bool:
+        """Add the names that have no id yet. Returns True if it wrote to `connection`."""
+        missing = {name for name in names if name is not None and name not in self._ids}
+        if not missing:
+            return False
+        self.reload()
+        missing -= self._ids.keys()
+        if not missing:
+            return False
+        if connection is not None and connection.dialect.name == "sqlite":
+            self._insert(connection, [{"name": name} for name in sorted(missing)])
+            rows = connection.execute(select(self.table.c.id, self.table.c.name).where(self.table.c.name.in_(missing))).all()
+            with self._lock:
+                self._ids.update({name: id for id, name in rows})
+                self._names.update({id: name for id, name in rows})
+            return True
+        with database.engine.begin() as conn:
+            self._insert(conn, [{"name": name} for name in sorted(missing)])
+            added = conn.execute(select(self.table.c.id, self.table.c.name).where(self.table.c.name.in_(missing))).all()
+        # shards get the same ids, so an id means the same name wherever a school lives
+        for shard in database.shard_engines():
+            with shard.begin() as conn:
+                self._insert(conn, [{"id": id, "name": name} for id, name in added])
+        self.reload()
+        return False
+
+    def _insert(self, conn: Connection, rows: list[dict]) -> None:
+        dialect = conn.dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            conn.execute(dialect_insert(self.table).on_conflict_do_nothing(), rows)
+        else:
+            conn.execute(self.table.insert(), rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids, self._names, self._loaded_at = {}, {}, 0.0
+
+
+CACHES: dict[str, LookupCache] = {}
+
+
+def cache(name: str) -> LookupCache:
+    if name not in CACHES:
+        CACHES[name] = LookupCache(name)
+    return CACHES[name]
+
+
+def preload() -> None:
+    """Load the lookup tables of every LookupName column."""
+    for table in database.Base.metadata.tables.values():
+        for _, lookup_table, _ in _columns_of(table):
+            cache(lookup_table).reload()
+
+
+class LookupName(TypeDecorator):
+    """A smallint id column that the application sees as the looked-up name."""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, lookup_table: str):
+        super().__init__()
+        self.lookup_table = lookup_table
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        id = cache(self.lookup_table).id_for(value)
+        # an unknown name binds as an id no row has; writes ensure() their names first
+        return -1 if id is None else id
+
+    def process_literal_param(self, value, dialect):
+        return str(self.process_bind_param(value, dialect))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else cache(self.lookup_table).name_for(value)
+
+
+_lookup_columns: dict = {}
+
+
+def _columns_of(table) -> list[tuple[str, str, Optional[str]]]:
+    # (column key, lookup table, default name) for every LookupName column;
+    # the key is also the mapped attribute's name
+    if table not in _lookup_columns:
+        _lookup_columns[table] = [
+            (col.key, col.type.lookup_table, col.default.arg if col.default is not None and col.default.is_scalar else None)
+            for col in table.columns
+            if isinstance(col.type, LookupName)
+        ]
+    return _lookup_columns[table]
+
+
+@event.listens_for(Session, "before_flush")
+def _ensure_flushed_names(session: Session, flush_context, instances) -> None:
+    wanted = defaultdict(set)
+    for obj in chain(session.new, session.dirty):
+        state = inspect(obj)
+        for key, lookup_table, default in _columns_of(state.mapper.local_table):
+            wanted[lookup_table].update(state.attrs[key].history.added)
+            if default is not None and obj in session.new:
+                wanted[lookup_table].add(default)
+    for lookup_table, names in wanted.items():
+        if cache(lookup_table).ensure(names, connection=session.connection()):
+            session.info["lookup_names_added"] = True
+
+
+def ensure_rows(table, rows: list[dict]) -> None:
+    """ensure() the names in dict rows keyed by column key, for Core inserts that skip the flush hook."""
+    for key, lookup_table, default in _columns_of(table):
+        cache(lookup_table).ensure({row.get(key) for row in rows} | {default})
+
+
+def copy_values(table, row: dict) -> dict:
+    """
+    A row keyed by column key as one keyed by column name with ids for names,
+    for COPY, which bypasses column types. The names must have been ensured.
+    """
+    values = {}
+    for key, value in row.items():
+        col = table.c[key]
+        if isinstance(col.type, LookupName) and value is not None:
+            value = cache(col.type.lookup_table).id_for(value)
+        values[col.name] = value
+    return values
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_names(session: Session) -> None:
+    if session.info.pop("lookup_names_added", False):
+        for lookup in CACHES.values():
+            lookup.clear()
+
+
+def canonical(options: type[Enum], value: Optional[str]) -> Optional[str]:
+    """The label of `options` matching `value` in any case; "" and None mean unset."""
+    if value is None or not str(value).strip():
+        return None
+    wanted = str(value).strip().lower()
+    for option in options:
+        if option.value.lower() == wanted:
+            return option.value
+    raise ValueError(f"must be one of: {', '.join(option.value for option in options)}")
@@ -0,0 +1,183 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+
+# Request timing and SQL instrumentation.
+#
+# MetricsMiddleware times every HTTP request and labels it with the matched
+# route template (/requests/{request_id}/, not the raw path). Cursor events on
+# the engines count the queries each request runs and the time spent in the
+# database; a statement repeated N1_THRESHOLD times within one request is
+# reported as a likely N+1. Everything is kept in process memory and rendered
+# in the Prometheus text format by GET /metrics, so with several workers each
+# one reports its own numbers. SERVER_TIMING=1 also adds a Server-Timing
+# header with the app and db durations, visible in browser dev tools.
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+N1_THRESHOLD = int(os.getenv("N1_THRESHOLD", "10"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    """SQL activity of the request currently being served."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)  # (method, route, status) -> count
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))  # (method, route)
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))  # (method, route)
+        self.db_seconds = defaultdict(float)  # (method, route)
+        self.n_plus_one = defaultdict(int)  # (method, route)
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats: RequestStats, suspects: int) -> None:
+        key = (method, route)
+        with self.lock:
+            self.requests[(method, route, status)] += 1
+            self.latency[key].observe(seconds)
+            self.queries[key].observe(stats.queries)
+            self.db_seconds[key] += stats.db_seconds
+            if suspects:
+                self.n_plus_one[key] += suspects
+
+    def render(self, extra: dict[str, tuple[str, float]]) -> str:
+        """Prometheus text format; `extra` maps more metric names to (type, value)."""
+        lines = []
+
+        def labels(method, route, **more):
+            pairs = {"method": method, "route": route, **more}
+            return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs.items()) + "}"
+
+        def histogram(name, help_text, series):
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} histogram"])
+            for (method, route), hist in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{labels(method, route, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{labels(method, route)} {hist.sum}")
+                lines.append(f"{name}_count{labels(method, route)} {cumulative}")
+
+        with self.lock:
+            lines.extend(["# HELP http_requests_total Requests served.", "# TYPE http_requests_total counter"])
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{labels(method, route, status=status)} {count}")
+            histogram("http_request_duration_seconds", "Time to serve a request.", self.latency)
+            histogram("db_queries_per_request", "SQL statements executed per request.", self.queries)
+            lines.extend(["# HELP db_query_seconds_total Time spent in SQL statements.", "# TYPE db_query_seconds_total counter"])
+            for (method, route), seconds in sorted(self.db_seconds.items()):
+                lines.append(f"db_query_seconds_total{labels(method, route)} {seconds}")
+            lines.extend([
+                "# HELP db_n_plus_one_total Statements repeated at least N1_THRESHOLD times in one request.",
+                "# TYPE db_n_plus_one_total counter",
+            ])
+            for (method, route), count in sorted(self.n_plus_one.items()):
+                lines.append(f"db_n_plus_one_total{labels(method, route)} {count}")
+        for name, (kind, value) in extra.items():
+            lines.extend([f"# TYPE {name} {kind}", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("query_started")
+    if started:
+        stats.db_seconds += time.perf_counter() - started.pop()
+    stats.queries += 1
+    stats.statements[statement] += 1
+
+
+def instrument(*engines) -> None:
+    """Attach the query hooks to sync engines (pass async_engine.sync_engine for async ones)."""
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _suspects(method: str, route: str, stats: RequestStats) -> int:
+    suspects = 0
+    for statement, count in stats.statements.items():
+        if count >= N1_THRESHOLD:
+            suspects += 1
+            logger.warning("possible N+1 on %s %s: %d x %s", method, route, count, " ".join(statement.split())[:200])
+    return suspects
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    # streamed bodies are still being produced here, so this covers time to first byte
+                    elapsed = (time.perf_counter() - started) * 1000
+                    value = f'app;dur={elapsed:.1f}, db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", value.encode()),
+                        (b"timing-allow-origin", b"*"),  # let the cross-origin frontend read it
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            # the router fills in scope["route"] once a route matches
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            registry.record(method, route, status, time.perf_counter() - started, stats, _suspects(method, route, stats))
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, func
+from sqlalchemy import BigInteger, Column, DateTime, Enum, ForeignKey, Identity, Index, Integer, PrimaryKeyConstraint, SmallInteger, String, func, text
 from database import Base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
+from lookups import LookupName, canonical
 import enum
 
 class StatusOptions(enum.Enum):
@@ -8,25 +9,99 @@ class StatusOptions(enum.Enum):
     checked_out = "Checked Out"
     under_repair = "Under Repair"
     retired = "Retired"
+    lost = "Lost"
+
+class ConditionOptions(enum.Enum):
+    new = "New"
+    good = "Good"
+    fair = "Fair"
+    poor = "Poor"
+    broken = "Broken"
+
+def label_enum(options: type[enum.Enum], name: str) -> Enum:
+    # native PostgreSQL ENUM of the labels; the attribute holds the label string
+    return Enum(*[option.value for option in options], name=name, validate_strings=True)
+
+# SQLite only autoincrements an INTEGER PRIMARY KEY
+SmallId = SmallInteger().with_variant(Integer, "sqlite")
+
+# the school rows written before multi-school tenancy belong to
+DEFAULT_SCHOOL_ID = 1
+
+def school_column(foreign_key: bool = True, **kwargs) -> Column:
+    # the tenant key; every query through a session is filtered on it (see tenancy.py)
+    args = (ForeignKey("schools.id"),) if foreign_key else ()
+    return Column("school_id", Integer, *args, server_default=str(DEFAULT_SCHOOL_ID), nullable=False, **kwargs)
+
+class School(Base):
+    __tablename__ = "schools"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class ItemType(Base):
+    __tablename__ = "item_types"
+    id = Column(SmallId, Identity(), primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+class Location(Base):
+    __tablename__ = "locations"
+    id = Column(SmallId, Identity(), primary_key=True)
+    name = Column(String, unique=True, nullable=False)
 
 class User(Base):
     __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True, nullable=False)
-    email = Column(String, unique=True, index=True, nullable=False)
+    # tenant-scoped indexes lead with school_id, so one school's queries never walk another's rows
+    __table_args__ = (
+        Index("ix_users_school_id_username", "school_id", "username", unique=True),
+        Index("ix_users_school_id_email", "school_id", "email", unique=True),
+        Index("ix_users_school_id_version_id", "school_id", "version", "id"),
+    )
+    id = Column(Integer, primary_key=True)
+    school_id = school_column()
+    username = Column(String, nullable=False)
+    email = Column(String, nullable=False)
     password = Column(String, nullable=False)
     role = Column(String, default="user", nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    # table version of the last write to this row, GET /changes pages on it (see sync.py)
+    version = Column(BigInteger, server_default="0", nullable=False)
     
 class Item(Base):
     __tablename__ = "items"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True, nullable=True)
-    type = Column(String,  index=True, nullable=True)
-    serial_number = Column(String, default="0000",  index=True, nullable=True)
-    condition = Column(String, default="New",  index=True, nullable=True)
-    status = Column(String, default="Available",  index=True, nullable=True)
-    location = Column(String, default="School",  index=True, nullable=True)
-    photo_url = Column(String,default="/",  index=True, nullable=True)
+    # filtered listings page on id, so each filter column is indexed together with it;
+    # name/serial_number searches use the indexes created in search.py
+    __table_args__ = (
+        Index("ix_items_school_id_id", "school_id", "id"),
+        Index("ix_items_school_id_type_id", "school_id", "type", "id"),
+        Index("ix_items_school_id_status_id", "school_id", "status", "id"),
+        Index("ix_items_school_id_location_id", "school_id", "location", "id"),
+        Index("ix_items_school_id_condition_id", "school_id", "condition", "id"),
+        Index("ix_items_school_id_version_id", "school_id", "version", "id"),
+    )
+    # fetch server-generated values (updated_at) with RETURNING on every write
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(Integer, primary_key=True)
+    school_id = school_column()
+    name = Column(String, nullable=True)
+    # type and location are ids into item_types/locations, read and written as names (see lookups.py)
+    type = Column("type_id", LookupName("item_types"), ForeignKey("item_types.id"), key="type", nullable=True)
+    serial_number = Column(String, default="0000", nullable=True)
+    condition = Column(label_enum(ConditionOptions, "item_condition"), default="New", nullable=True)
+    status = Column(label_enum(StatusOptions, "item_status"), default="Available", nullable=True)
+    location = Column("location_id", LookupName("locations"), ForeignKey("locations.id"), key="location", default="School", nullable=True)
+    photo_url = Column(String,default="/", nullable=True)
+    thumbnail_url = Column(String, nullable=True)  # set with photo_url by POST /items/{id}/photo
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    version = Column(BigInteger, server_default="0", nullable=False)
+
+    @validates("status")
+    def _canonical_status(self, key, value):
+        return canonical(StatusOptions, value)
+
+    @validates("condition")
+    def _canonical_condition(self, key, value):
+        return canonical(ConditionOptions, value)
     
     
 class RequestStatus(enum.Enum):
@@ -36,12 +111,116 @@ class RequestStatus(enum.Enum):
 
 class Request(Base):
     __tablename__ = "requests"
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_requests_user_id_requested_at", "user_id", text("requested_at DESC")),
+        Index("ix_requests_item_id_status", "item_id", "status"),
+        Index("ix_requests_school_id_requested_at", "school_id", text("requested_at DESC"), text("id DESC")),
+        Index("ix_requests_school_id_status_requested_at", "school_id", "status", "requested_at"),
+        Index("ix_requests_school_id_version_id", "school_id", "version", "id"),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+    id = Column(Integer, primary_key=True)
+    school_id = school_column()
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
-    status = Column(String, default=RequestStatus.pending.value, nullable=False, index=True)
+    status = Column(label_enum(RequestStatus, "request_status"), default=RequestStatus.pending.value, nullable=False)
     requested_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     reviewed_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    version = Column(BigInteger, server_default="0", nullable=False)
 
     user = relationship("User", foreign_keys=[user_id])
-    item = relationship("Item")
\ No newline at end of file
+    item = relationship("Item")
+
+    @validates("status")
+    def _canonical_status(self, key, value):
+        return canonical(RequestStatus, value)
+
+class TableVersion(Base):
+    """Change counter per table, bumped in the same transaction as every write (see versioning.py)."""
+    __tablename__ = "table_versions"
+    school_id = school_column(primary_key=True)  # per school, so schools never wait on each other's counters
+    table_name = Column(String, primary_key=True)
+    version = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class Tombstone(Base):
+    """One row per deleted user, item or request, so GET /changes can report deletions (see sync.py)."""
+    __tablename__ = "tombstones"
+    __table_args__ = (
+        Index("ix_tombstones_school_id_table_name_version", "school_id", "table_name", "version", "row_id"),
+    )
+    table_name = Column(String, primary_key=True)
+    row_id = Column(Integer, primary_key=True)
+    school_id = school_column()
+    version = Column(BigInteger, nullable=False)  # table version of the delete
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class ReportJob(Base):
+    """A queued report and, once a worker has run it, where its output is (see reports.py)."""
+    __tablename__ = "report_jobs"
+    __table_args__ = (
+        # workers claim the oldest queued job; finished jobs stay out of the index
+        Index("ix_report_jobs_queued", "id", postgresql_where=text("status = 'queued'")),
+        Index("ix_report_jobs_status_heartbeat_at", "status", "heartbeat_at"),
+    )
+    id = Column(Integer, primary_key=True)
+    school_id = school_column()
+    kind = Column(String, nullable=False)  # a key of reports.REPORTS
+    params = Column(String, nullable=False, default="{}")  # JSON
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    requested_by = Column(Integer, nullable=True)  # user id; no foreign key, the job outlives the user
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # refreshed while running
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker = Column(String, nullable=True)  # host:pid that claimed it last
+    rows = Column(Integer, nullable=True)
+    file_name = Column(String, nullable=True)  # under REPORTS_DIR, gzip-compressed CSV
+    file_bytes = Column(BigInteger, nullable=True)
+    summary = Column(String, nullable=True)  # JSON totals shown without downloading the file
+    error = Column(String, nullable=True)
+
+class StatCounter(Base):
+    """Row counts per table and per status/location value, kept current by every write (see counters.py)."""
+    __tablename__ = "stat_counters"
+    school_id = school_column(primary_key=True)
+    name = Column(String, primary_key=True)  # "items", "items.status", "requests.status", ...
+    key = Column(String, primary_key=True)  # column value, "" for table totals
+    count = Column(BigInteger, default=0, nullable=False)
+
+class ItemEvent(Base):
+    """Append-only item history, partitioned by month on PostgreSQL (see ledger.py)."""
+    __tablename__ = "item_events"
+    __table_args__ = (
+        # a partitioned table's keys must include the partition column
+        PrimaryKeyConstraint("id", "occurred_at"),
+        # newest-first pages for one item come straight off this index
+        Index("ix_item_events_item_id_occurred_at", "item_id", text("occurred_at DESC"), text("id DESC")),
+        Index("ix_item_events_occurred_at", "occurred_at", postgresql_using="brin"),
+        Index("ix_item_events_school_id_occurred_at", "school_id", text("occurred_at DESC"), text("id DESC")),
+        {"postgresql_partition_by": "RANGE (occurred_at)"},
+    )
+    id = Column(BigInteger, Identity())
+    occurred_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # no foreign keys: history outlives the items, requests and users it mentions
+    school_id = school_column(foreign_key=False)
+    item_id = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)  # created, updated, checked_out, denied, deleted
+    status = Column(String, nullable=True)  # item status after the event
+    previous_status = Column(String, nullable=True)
+    location = Column(String, nullable=True)
+    request_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=True)
+
+class IdempotencyKey(Base):
+    """Outcome of a POST /batch operation, replayed when its key is sent again (see batch.py)."""
+    __tablename__ = "idempotency_keys"
+    user_id = Column(Integer, primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)  # hash of the operation, a reused key must match it
+    status_code = Column(Integer, nullable=True)
+    response = Column(String, nullable=True)  # JSON body
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
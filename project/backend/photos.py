@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from PIL import Image, ImageOps  # optional; only needed for photo uploads
+except ImportError:
+    Image = ImageOps = None
+
+# Item photos.
+#
+# POST /items/{id}/photo streams the request body to disk while hashing it,
+# so a photo is never held in memory, and stores it under its SHA-256:
+#
+#     MEDIA_DIR/ab/ab12...ef.jpg            the original
+#     MEDIA_DIR/ab/ab12...ef-320.webp       thumbnail, WebP
+#     MEDIA_DIR/ab/ab12...ef-320.jpg        thumbnail, JPEG for older browsers
+#     MEDIA_DIR/ab/ab12...ef-1280.webp/.jpg large variant for detail views
+#
+# Identical uploads share one file and a file never changes once written, so
+# GET /media/... can be cached by browsers and proxies for a year. Variants
+# are made by a small process pool after the upload returns; a variant asked
+# for before it exists (or after a restart, or by another worker) is made on
+# demand first. In production a proxy can serve MEDIA_DIR directly and only
+# send misses to the app.
+#
+# Files are not deleted when an item's photo changes; other items may share
+# them.
+
+MEDIA_DIR = Path(os.getenv("MEDIA_DIR", Path(__file__).resolve().parent / "media"))
+MEDIA_URL = "/media/"
+MAX_PHOTO_BYTES = int(os.getenv("MAX_PHOTO_BYTES", str(15 * 2**20)))
+MAX_PHOTO_PIXELS = int(os.getenv("MAX_PHOTO_PIXELS", str(50_000_000)))  # decompression bomb guard
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+THUMBNAIL_SIZE = 320  # longest edge in px; catalogue cards
+VARIANT_SIZES = (THUMBNAIL_SIZE, 1280)
+VARIANT_FORMATS = {
+    ".webp": ("WEBP", {"quality": 80, "method": 4}),
+    ".jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# leading bytes -> extension; the client's Content-Type is not trusted
+SIGNATURES = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+MEDIA_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".gif": "image/gif", ".webp": "image/webp"}
+MEDIA_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})(?:-(?P<size>\d+))?(?P<ext>\.(?:jpg|png|gif|webp))$")
+
+if Image is not None:
+    Image.MAX_IMAGE_PIXELS = MAX_PHOTO_PIXELS
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pending: dict[str, asyncio.Future] = {}
+
+
+def sniff(head: bytes) -> Optional[str]:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+def media_path(name: str) -> Path:
+    return MEDIA_DIR / name[:2] / name
+
+
+def media_url(name: str) -> str:
+    return f"{MEDIA_URL}{name[:2]}/{name}"
+
+
+def variant_name(digest: str, size: int, ext: str = ".webp") -> str:
+    return f"{digest}-{size}{ext}"
+
+
+async def save_upload(chunks: AsyncIterator[bytes]) -> str:
+    """Write an uploaded image to its content address; returns the file name."""
+    if Image is None:
+        raise HTTPException(status_code=503, detail="Photo uploads are not available (Pillow is not installed)")
+    MEDIA_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    ext = None
+    head = b""
+    fd, tmp = tempfile.mkstemp(dir=MEDIA_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                if ext is None:
+                    head += chunk
+                    if len(head) < 12:
+                        continue
+                    ext = sniff(head)
+                    if ext is None:
+                        raise HTTPException(status_code=415, detail="Upload a JPEG, PNG, GIF or WebP image")
+                    chunk, head = head, b""
+                size += len(chunk)
+                if size > MAX_PHOTO_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Photos are limited to {MAX_PHOTO_BYTES // 2**20} MB")
+                digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+        if ext is None:
+            raise HTTPException(status_code=415, detail="Upload a JPEG, PNG, GIF or WebP image")
+        name = digest.hexdigest() + ext
+        await run_in_threadpool(_check_image, tmp)
+        target = media_path(name)
+        target.parent.mkdir(exist_ok=True)
+        os.replace(tmp, target)  # the same content may already be there; same bytes either way
+        return name
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def _check_image(path: str) -> None:
+    # reads the header only; the pixels are decoded later, in the pool
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        raise HTTPException(status_code=415, detail="The file is not a readable image")
+    if width * height > MAX_PHOTO_PIXELS:
+        raise HTTPException(status_code=413, detail="Image dimensions are too large")
+
+
+def make_variants(name: str, sizes=VARIANT_SIZES) -> list[str]:
+    """Write the resized variants of the original `name`; runs in the pool."""
+    source = media_path(name)
+    digest = name.split(".")[0]
+    with Image.open(source) as image:
+        if image.format == "JPEG":
+            # decode at a reduced scale straight away, much cheaper for big photos
+            image.draft("RGB", (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        written = []
+        for size in sorted(sizes, reverse=True):
+            image.thumbnail((size, size), Image.LANCZOS)  # never enlarges
+            for ext, (kind, options) in VARIANT_FORMATS.items():
+                out = image
+                if kind == "JPEG" and image.mode == "RGBA":
+                    out = Image.new("RGB", image.size, "white")
+                    out.paste(image, mask=image.getchannel("A"))
+                target = media_path(variant_name(digest, size, ext))
+                tmp = target.with_name(f".{target.name}.{os.getpid()}")
+                out.save(tmp, kind, **options)
+                os.replace(tmp, target)
+                written.append(target.name)
+    return written
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PHOTO_WORKERS)
+    return _pool
+
+
+def generate(name: str) -> asyncio.Future:
+    """Start making the variants of `name` unless that is already under way."""
+    future = _pending.get(name)
+    if future is None:
+        future = asyncio.get_running_loop().run_in_executor(_get_pool(), make_variants, name)
+        _pending[name] = future
+        future.add_done_callback(lambda done: _finished(name, done))
+    return future
+
+
+def _finished(name: str, future: asyncio.Future) -> None:
+    _pending.pop(name, None)
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("could not make variants of %s: %s", name, future.exception())
+
+
+async def ensure(name: str) -> Optional[Path]:
+    """Path of the media file `name`, making it first if it is a missing variant."""
+    match = MEDIA_NAME.match(name)
+    if match is None:
+        return None
+    path = media_path(name)
+    if path.exists():
+        return path
+    size = match["size"]
+    if size is None or int(size) not in VARIANT_SIZES or match["ext"] not in VARIANT_FORMATS:
+        return None
+    original = next(
+        (f"{match['digest']}{ext}" for ext in MEDIA_TYPES if media_path(match["digest"] + ext).exists()), None
+    )
+    if original is None or Image is None:
+        return None
+    try:
+        await generate(original)
+    except Exception:
+        return None  # logged by _finished
+    return path if path.exists() else None
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
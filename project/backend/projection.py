@@ -0,0 +1,47 @@
+import json
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import orjson  # optional; several times faster than json on large lists
+except ImportError:
+    orjson = None
+
+# Column projections for the list endpoints.
+#
+# GET /items/ and GET /users/ accept ?fields=name,status to return only those
+# columns. Only the selected columns are read (a Core select into tuples, no
+# ORM objects), and since the rows come straight from our own tables they are
+# serialised as they are instead of being validated one by one through the
+# response schema. id is always included, the item cursor is built from it.
+
+
+def schema_fields(schema) -> list[str]:
+    return list(getattr(schema, "model_fields", None) or schema.__fields__)
+
+
+def select_columns(model, schema, fields: Optional[str]) -> list:
+    """
+    Columns of `model` for the comma-separated `fields`, in schema order, or
+    every field of `schema` when no fields are given.
+    """
+    allowed = schema_fields(schema)
+    if not fields:
+        return [getattr(model, name) for name in allowed]
+    wanted = {part.strip() for part in fields.split(",") if part.strip()}
+    unknown = wanted - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [getattr(model, name) for name in allowed if name in wanted or name == "id"]
+
+
+def rows_as_dicts(result, columns) -> list[dict]:
+    names = [column.key for column in columns]
+    return [dict(zip(names, row)) for row in result]
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(jsonable_encoder(data), separators=(",", ":")).encode()
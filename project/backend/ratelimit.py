@@ -0,0 +1,271 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from fastapi import HTTPException
+from auth import decode_access_token
+
+# Token-bucket rate limiting for the write and login routes.
+#
+# Each (route, client) pair gets a bucket holding up to `burst` tokens that
+# refills at `rate` tokens per second; a request takes one token or is
+# answered 429 with Retry-After. Clients are identified by the user_id claim
+# of a valid bearer token, otherwise by IP address (the first
+# X-Forwarded-For hop when RATE_LIMIT_TRUST_FORWARDED=1, for deployments
+# behind a proxy). Only routes listed in the limits are looked at; everything
+# else passes through after one dict lookup.
+#
+# A whole school often reaches the API from one NAT address, so an address
+# alone is too coarse for the routes people use before they have a token:
+# login buckets are per address and username (read from the JSON body), so
+# guessing at one account slows down that account only, not everyone behind
+# the address, and registration allows a class signing up together. Each
+# login also takes a token from a looser per-address bucket
+# (DEFAULT_ADDRESS_LIMITS), so rotating usernames from one address is still
+# capped. Raise RATE_LIMITS and RATE_LIMITS_PER_ADDRESS for larger sites
+# behind a single address. Only MAX_BODY bytes of a login body are read,
+# longer ones are answered 413.
+#
+# Backends:
+#   memory - buckets in this process (default); each worker limits on its own
+#   redis  - one Lua script call per limited request, shared by every worker;
+#            the client is redis.asyncio, so the call never blocks the loop
+#   off    - no limiting
+#
+# Limits are "count/period" (second, minute, hour, day) per route, e.g.
+# RATE_LIMITS="POST /login/=10/minute,POST /batch=30/minute" adds to or
+# overrides DEFAULT_LIMITS; RATE_LIMITS_PER_ADDRESS does the same for
+# DEFAULT_ADDRESS_LIMITS.
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", os.getenv("CACHE_URL", "redis://localhost:6379/0"))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "0") == "1"
+RATE_LIMIT_MAXSIZE = int(os.getenv("RATE_LIMIT_MAXSIZE", "100000"))  # buckets, memory backend only
+
+DEFAULT_LIMITS = {
+    "POST /login/": "10/minute",
+    "POST /register/": "60/hour",
+    "POST /requests/": "30/minute",
+    "POST /batch": "30/minute",
+    "POST /reports": "10/minute",
+}
+DEFAULT_ADDRESS_LIMITS = {
+    "POST /login/": "100/minute",
+}
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+# route -> JSON body field that is part of the bucket key
+BODY_FIELDS = {"POST /login/": "username"}
+MAX_BODY = 4096  # bytes read to find that field; a login body is a few dozen
+
+logger = logging.getLogger(__name__)
+
+
+class Limit:
+    def __init__(self, count: int, period: float):
+        self.burst = count
+        self.rate = count / period  # tokens per second
+
+    @classmethod
+    def parse(cls, spec: str) -> "Limit":
+        count, _, period = spec.strip().partition("/")
+        if period not in PERIODS:
+            raise ValueError(f"bad rate limit {spec!r}, expected e.g. 10/minute")
+        return cls(int(count), PERIODS[period])
+
+
+def parse_limits(value: str) -> dict[str, Limit]:
+    limits = {}
+    for part in value.split(","):
+        if part.strip():
+            route, _, spec = part.rpartition("=")
+            limits[" ".join(route.split())] = Limit.parse(spec)
+    return limits
+
+
+class MemoryBuckets:
+    name = "memory"
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAXSIZE):
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, limit: Limit) -> float:
+        """Take a token; returns 0 when allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - stamp) * limit.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # an evicted bucket comes back full, so only the least recently seen clients are forgotten
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+# tokens and last refill time in a hash; the server clock is used so every
+# worker agrees on it
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    name = "redis"
+
+    def __init__(self, client=None, url: str = RATE_LIMIT_URL, prefix: str = "sims:ratelimit:"):
+        if client is None:
+            import redis.asyncio  # optional dependency, only needed for RATE_LIMIT_BACKEND=redis
+            client = redis.asyncio.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(TAKE_SCRIPT)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        try:
+            return float(await self.script(keys=[self.prefix + key], args=[limit.rate, limit.burst]))
+        except Exception:
+            # an unreachable limiter should not take the API down with it
+            logger.exception("rate limit backend unavailable, letting the request through")
+            return 0.0
+
+
+def create_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBuckets()
+    if RATE_LIMIT_BACKEND == "off":
+        return None
+    return MemoryBuckets()
+
+
+def client_key(scope) -> str:
+    headers = dict(scope["headers"])
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if authorization[:7].lower() == "bearer ":
+        try:
+            return f"user:{decode_access_token(authorization[7:])['user_id']}"
+        except HTTPException:
+            pass  # bad token: the route rejects it, count it against the address
+    if RATE_LIMIT_TRUST_FORWARDED and b"x-forwarded-for" in headers:
+        return "ip:" + headers[b"x-forwarded-for"].decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def read_body(receive, limit: int = MAX_BODY) -> tuple[Optional[bytes], object]:
+    """
+    Read the whole request body; returns it and a receive() that replays it
+    to the app, or None for the body once it grows past `limit` bytes.
+    """
+    chunks = []
+    size = 0
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        size += len(chunks[-1])
+        if size > limit:
+            return None, receive
+        more = message.get("more_body", False)
+    body = b"".join(chunks)
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if replayed:
+            return await receive()
+        replayed = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return body, replay
+
+
+def body_field(body: bytes, field: str) -> str:
+    try:
+        value = json.loads(body).get(field)
+    except (ValueError, AttributeError):
+        return ""
+    return value if isinstance(value, str) else ""
+
+
+def configured_limits(defaults: dict[str, str], variable: str) -> dict[str, Limit]:
+    limits = parse_limits(",".join(f"{route}={spec}" for route, spec in defaults.items()))
+    limits.update(parse_limits(os.getenv(variable, "")))
+    return limits
+
+
+async def respond(send, status: int, detail: str, headers: tuple = ()) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), *headers],
+    })
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+
+class RateLimitMiddleware:
+    def __init__(
+        self,
+        app,
+        limits: Optional[dict[str, Limit]] = None,
+        backend="default",
+        address_limits: Optional[dict[str, Limit]] = None,
+    ):
+        self.app = app
+        self.limits = configured_limits(DEFAULT_LIMITS, "RATE_LIMITS") if limits is None else limits
+        if address_limits is None:
+            address_limits = configured_limits(DEFAULT_ADDRESS_LIMITS, "RATE_LIMITS_PER_ADDRESS")
+        self.address_limits = address_limits
+        self.backend = create_backend() if backend == "default" else backend
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.backend is None:
+            return await self.app(scope, receive, send)
+        route = f"{scope['method']} {scope['path']}"
+        limit = self.limits.get(route)
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        key = address_key = f"{route}|{client_key(scope)}"
+        field = BODY_FIELDS.get(route)
+        if field:
+            body, receive = await read_body(receive)
+            if body is None:
+                return await respond(send, 413, "Request body too large")
+            key += f"|{body_field(body, field)}"
+        wait = await self.backend.take(key, limit)
+        address_limit = self.address_limits.get(route)
+        if address_limit is not None:
+            # both buckets are charged, either one running dry rejects
+            wait = max(wait, await self.backend.take(address_key, address_limit))
+        if not wait:
+            return await self.app(scope, receive, send)
+        await respond(send, 429, "Too many requests", ((b"retry-after", str(math.ceil(wait)).encode()),))
@@ -0,0 +1,426 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import socket
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Optional
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+import database
+from models import Item, ReportJob, Request, RequestStatus, User
+import tenancy
+
+# Report jobs behind POST /reports and GET /reports/{id}.
+#
+# Term-end reports read every item and request, which takes far longer than
+# a request should hold a connection and a threadpool slot. POST /reports
+# only inserts a row into report_jobs; worker processes claim queued rows
+# with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them (in any
+# number of web workers or hosts) share the queue without a broker and never
+# run a job twice at once. A worker reads in one REPEATABLE READ transaction,
+# in chunks of REPORT_CHUNK_ROWS (keyset ranges, or a server-side cursor for
+# the per-request rows), so memory stays flat however big the tables are,
+# and writes a gzip-compressed CSV under REPORTS_DIR. The client polls
+# GET /reports/{id} until the job is done and downloads the file.
+#
+# Every web process runs REPORT_WORKERS of them in a process pool (0 turns
+# that off); a dedicated host can run them on their own instead:
+#
+#     python reports.py --workers 4
+#     python reports.py --prune-days 7     # drop old jobs and their files
+#
+# A running job refreshes heartbeat_at every HEARTBEAT_SECONDS. A job whose
+# worker died (crash, restart, OOM) goes stale and is queued again, at most
+# MAX_ATTEMPTS times in all. On SQLite, which has one writer at a time, the
+# claim is a plain UPDATE.
+#
+# The queue is shared by every school and lives in the main database, which
+# is where the routes, claim() and the workers all read and write it; only a
+# job's data query goes to the database of the school that asked for it
+# (see database.py), and it reads only that school's rows.
+
+REPORTS_DIR = Path(os.getenv("REPORTS_DIR", Path(__file__).resolve().parent / "report_files"))
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "1"))  # per web process
+CHUNK_ROWS = int(os.getenv("REPORT_CHUNK_ROWS", "5000"))
+POLL_SECONDS = float(os.getenv("REPORT_POLL_SECONDS", "2"))
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = int(os.getenv("REPORT_STALE_SECONDS", "120"))
+MAX_ATTEMPTS = 3
+KEEP_DAYS = int(os.getenv("REPORT_KEEP_DAYS", "7"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_tasks: list[asyncio.Task] = []
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_wakeup: Optional[asyncio.Event] = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _hours(start: Optional[datetime], end: Optional[datetime]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds() / 3600, 2)
+
+
+def _window(params: dict) -> list:
+    # the term: requests made in [since, until)
+    conditions = []
+    if params.get("since"):
+        conditions.append(Request.requested_at >= datetime.fromisoformat(params["since"]))
+    if params.get("until"):
+        conditions.append(Request.requested_at < datetime.fromisoformat(params["until"]))
+    return conditions
+
+
+def _percentile(ordered: list[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+
+# A report is (connection, school, params, csv writer, tick) -> (rows written,
+# summary); tick() is called after every chunk and keeps the heartbeat going.
+
+
+def checkouts_report(conn: Connection, school_id: int, params: dict, writer, tick: Callable[[], None]) -> tuple[int, dict]:
+    """Per item: how often it was requested, checked out (approved) and denied."""
+    writer.writerow([
+        "item_id", "name", "type", "serial_number", "location", "status", "condition",
+        "requests", "checkouts", "denied", "last_checkout",
+    ])
+    approved, denied = RequestStatus.approved.value, RequestStatus.denied.value
+    window = _window(params)
+    written = requests = checkouts = never = 0
+    last_id = 0
+    while True:
+        # a keyset page of the school's items off ix_items_school_id_id, then the
+        # counts for just that id range off ix_requests_item_id_status
+        items = conn.execute(
+            select(Item.id, Item.name, Item.type, Item.serial_number, Item.location, Item.status, Item.condition)
+            .where(Item.school_id == school_id, Item.id > last_id).order_by(Item.id).limit(CHUNK_ROWS)
+        ).all()
+        if not items:
+            break
+        counts = {
+            row.item_id: row
+            for row in conn.execute(
+                select(
+                    Request.item_id,
+                    func.count().label("requests"),
+                    func.count().filter(Request.status == approved).label("checkouts"),
+                    func.count().filter(Request.status == denied).label("denied"),
+                    func.max(Request.reviewed_at).filter(Request.status == approved).label("last_checkout"),
+                )
+                .where(Request.item_id.between(items[0].id, items[-1].id), Request.school_id == school_id, *window)
+                .group_by(Request.item_id)
+            )
+        }
+        for item in items:
+            count = counts.get(item.id)
+            writer.writerow([
+                item.id, item.name, item.type, item.serial_number, item.location, item.status, item.condition,
+                count.requests if count else 0,
+                count.checkouts if count else 0,
+                count.denied if count else 0,
+                count.last_checkout.isoformat() if count and count.last_checkout else "",
+            ])
+            requests += count.requests if count else 0
+            checkouts += count.checkouts if count else 0
+            never += not (count and count.checkouts)
+        written += len(items)
+        last_id = items[-1].id
+        tick()
+    return written, {"items": written, "requests": requests, "checkouts": checkouts, "never_checked_out": never}
+
+
+def approval_times_report(conn: Connection, school_id: int, params: dict, writer, tick: Callable[[], None]) -> tuple[int, dict]:
+    """Per request: who asked for what, and how many hours it waited for a review."""
+    writer.writerow([
+        "request_id", "item_id", "item_name", "user_id", "username", "status",
+        "requested_at", "reviewed_at", "hours_to_review",
+    ])
+    result = conn.execution_options(yield_per=CHUNK_ROWS).execute(
+        select(
+            Request.id, Request.item_id, Item.name, Request.user_id, User.username,
+            Request.status, Request.requested_at, Request.reviewed_at,
+        )
+        .join(Item, Item.id == Request.item_id)
+        .join(User, User.id == Request.user_id)
+        .where(Request.school_id == school_id, *_window(params))
+        .order_by(Request.id)
+    )
+    written = 0
+    by_status = dict.fromkeys((status.value for status in RequestStatus), 0)
+    approval_hours = array("d")  # 8 bytes a request, the only thing kept for the whole run
+    for chunk in result.partitions():
+        for row in chunk:
+            hours = _hours(row.requested_at, row.reviewed_at)
+            writer.writerow([
+                row.id, row.item_id, row.name, row.user_id, row.username, row.status,
+                row.requested_at.isoformat(), row.reviewed_at.isoformat() if row.reviewed_at else "",
+                "" if hours is None else hours,
+            ])
+            by_status[row.status] = by_status.get(row.status, 0) + 1
+            if row.status == RequestStatus.approved.value and hours is not None:
+                approval_hours.append(hours)
+        written += len(chunk)
+        tick()
+    ordered = sorted(approval_hours)
+    return written, {
+        "requests": written,
+        **{status.lower(): count for status, count in by_status.items()},
+        "hours_to_approval": {
+            "mean": round(sum(ordered) / len(ordered), 2) if ordered else None,
+            "median": _percentile(ordered, 0.5),
+            "p90": _percentile(ordered, 0.9),
+            "max": ordered[-1] if ordered else None,
+        },
+    }
+
+
+REPORTS = {
+    "checkouts": checkouts_report,
+    "approval_times": approval_times_report,
+}
+
+
+def enqueue(db: Session, kind: str, params: dict, requested_by: Optional[int]) -> ReportJob:
+    """Queue a report, or return the same report if it is already queued or running."""
+    encoded = json.dumps(params, sort_keys=True)
+    job = db.execute(
+        select(ReportJob)
+        .where(ReportJob.kind == kind, ReportJob.params == encoded, ReportJob.status.in_((QUEUED, RUNNING)))
+        .order_by(ReportJob.id).limit(1)
+    ).scalar()
+    if job is None:
+        job = ReportJob(kind=kind, params=encoded, status=QUEUED, requested_by=requested_by)
+        db.add(job)
+        db.flush()
+    return job
+
+
+def describe(job: ReportJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "params": json.loads(job.params),
+        "status": job.status,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "attempts": job.attempts,
+        "rows": job.rows,
+        "file_bytes": job.file_bytes,
+        "summary": json.loads(job.summary) if job.summary else None,
+        "error": job.error,
+        "download_url": f"/reports/{job.id}/download" if job.status == DONE else None,
+    }
+
+
+def file_path(job: ReportJob) -> Optional[Path]:
+    return REPORTS_DIR / job.file_name if job.file_name else None
+
+
+def requeue_stale(conn: Connection) -> int:
+    """Queue again (or fail, after MAX_ATTEMPTS) running jobs whose worker stopped beating."""
+    stale = [ReportJob.status == RUNNING, ReportJob.heartbeat_at < _now() - timedelta(seconds=STALE_SECONDS)]
+    failed = conn.execute(
+        update(ReportJob).where(*stale, ReportJob.attempts >= MAX_ATTEMPTS)
+        .values(status=FAILED, finished_at=_now(), error="the worker running it stopped responding")
+    ).rowcount
+    queued = conn.execute(update(ReportJob).where(*stale).values(status=QUEUED, worker=None)).rowcount
+    return failed + queued
+
+
+def claim(worker: str) -> Optional[ReportJob]:
+    with database.engine.begin() as conn:
+        requeue_stale(conn)
+        # rows other workers have locked are skipped rather than waited for
+        job_id = conn.execute(
+            select(ReportJob.id).where(ReportJob.status == QUEUED)
+            .order_by(ReportJob.id).limit(1).with_for_update(skip_locked=True)
+        ).scalar()
+        if job_id is None:
+            return None
+        now = _now()
+        conn.execute(
+            update(ReportJob).where(ReportJob.id == job_id)
+            .values(status=RUNNING, worker=worker, started_at=now, heartbeat_at=now, attempts=ReportJob.attempts + 1)
+        )
+    with Session(database.engine) as db:
+        return db.get(ReportJob, job_id)
+
+
+def _finish(job: ReportJob, worker: str, **values) -> None:
+    # only while it is still ours; a job reclaimed after going stale belongs to its new worker
+    with database.engine.begin() as conn:
+        conn.execute(
+            update(ReportJob)
+            .where(ReportJob.id == job.id, ReportJob.worker == worker, ReportJob.status == RUNNING)
+            .values(finished_at=_now(), **values)
+        )
+
+
+def run_job(job: ReportJob, worker: str) -> None:
+    report = REPORTS.get(job.kind)
+    if report is None:
+        _finish(job, worker, status=FAILED, error=f"unknown report {job.kind!r}")
+        return
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    name = f"{job.kind}-{job.id}.csv.gz"
+    tmp = REPORTS_DIR / f".{name}.{os.getpid()}"
+    beat = time.monotonic()
+
+    def tick() -> None:
+        nonlocal beat
+        if time.monotonic() - beat >= HEARTBEAT_SECONDS:
+            beat = time.monotonic()
+            with database.engine.begin() as conn:
+                conn.execute(update(ReportJob).where(ReportJob.id == job.id).values(heartbeat_at=_now()))
+
+    try:
+        with database.engine_for(job.school_id).connect() as conn:
+            if conn.dialect.name == "postgresql":
+                # every chunk reads the same snapshot
+                conn = conn.execution_options(isolation_level="REPEATABLE READ")
+            with conn.begin(), gzip.open(tmp, "wt", newline="", encoding="utf-8", compresslevel=6) as out:
+                if tenancy.TENANT_RLS:
+                    tenancy.apply_rls_setting(conn, job.school_id)
+                rows, summary = report(conn, job.school_id, json.loads(job.params), csv.writer(out), tick)
+        os.replace(tmp, REPORTS_DIR / name)
+        _finish(
+            job, worker, status=DONE, rows=rows, file_name=name,
+            file_bytes=(REPORTS_DIR / name).stat().st_size, summary=json.dumps(summary),
+        )
+    except Exception as e:
+        logger.exception("report job %s failed", job.id)
+        _finish(job, worker, status=FAILED, error=str(e)[:500])
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def work_once() -> bool:
+    """Claim and run one job; False when the queue was empty. Runs in a worker process."""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    job = claim(worker)
+    if job is None:
+        return False
+    run_job(job, worker)
+    return True
+
+
+def prune(days: int = KEEP_DAYS) -> int:
+    """Delete finished jobs older than `days`, and their files."""
+    cutoff = _now() - timedelta(days=days)
+    with Session(database.engine) as db, db.begin():
+        jobs = db.execute(
+            select(ReportJob).where(ReportJob.status.in_((DONE, FAILED)), ReportJob.finished_at < cutoff)
+        ).scalars().all()
+        for job in jobs:
+            path = file_path(job)
+            if path is not None:
+                path.unlink(missing_ok=True)
+        db.execute(delete(ReportJob).where(ReportJob.id.in_([job.id for job in jobs])))
+    return len(jobs)
+
+
+def _init_process() -> None:
+    # connections inherited from the parent must not be shared
+    database.dispose_all(close=False)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_process)
+    return _pool
+
+
+async def _dispatch(workers: int) -> None:
+    global _pool
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            busy = await loop.run_in_executor(_get_pool(workers), work_once)
+        except BrokenProcessPool:
+            # a worker process died; its job goes stale and is queued again
+            logger.error("report worker process died, starting a new pool")
+            _pool = None
+            busy = False
+        except Exception:
+            logger.exception("report worker failed")
+            busy = False
+        if not busy:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+
+
+async def start(workers: int = REPORT_WORKERS) -> None:
+    global _loop, _wakeup
+    if workers <= 0 or _tasks:
+        return
+    _loop, _wakeup = asyncio.get_running_loop(), asyncio.Event()
+    _tasks.extend(asyncio.create_task(_dispatch(workers)) for _ in range(workers))
+
+
+def notify() -> None:
+    """Wake this process's idle workers after queueing a job; safe from any thread."""
+    if _loop is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+async def stop() -> None:
+    global _pool, _loop
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    if _pool is not None:
+        # a report can take minutes; stop it, it is queued again once stale
+        for process in list(_pool._processes.values()):
+            process.terminate()
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+    _loop = None
+
+
+async def serve(workers: int) -> None:
+    await start(workers)
+    try:
+        await asyncio.gather(*_tasks)
+    finally:
+        await stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run report jobs, or prune old ones")
+    parser.add_argument("--workers", type=int, default=max(1, REPORT_WORKERS), help="worker processes")
+    parser.add_argument("--prune-days", type=int, help="delete jobs finished more than this many days ago, then exit")
+    args = parser.parse_args()
+    logging.basicConfig(level="INFO", format="%(asctime)s %(name)s %(message)s")
+    if args.prune_days is not None:
+        print(f"deleted {prune(args.prune_days)} report jobs")
+    else:
+        try:
+            asyncio.run(serve(args.workers))
+        except KeyboardInterrupt:
+            pass
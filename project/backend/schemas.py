@@ -1,6 +1,8 @@
 import datetime
-from typing import Optional
-from pydantic import BaseModel
+from typing import Any, Optional
+from pydantic import BaseModel, validator
+from lookups import canonical
+from models import ConditionOptions, StatusOptions
 
 class UserCreate(BaseModel):
     username: str
@@ -17,7 +19,6 @@ class UserOut(BaseModel):
     id: int
     username: str
     email: str
-    password: str
     role: str
 
     class Config:
@@ -33,6 +34,15 @@ class ItemCreate(BaseModel):
     condition: str
     status: str
     location: str
+
+    # any capitalisation is accepted and stored as the label, e.g. "checked out" -> "Checked Out"
+    @validator("condition")
+    def _condition(cls, value):
+        return canonical(ConditionOptions, value)
+
+    @validator("status")
+    def _status(cls, value):
+        return canonical(StatusOptions, value)
   
 
 class ItemOut(BaseModel):
@@ -43,6 +53,8 @@ class ItemOut(BaseModel):
     condition: Optional[str]
     status: Optional[str]
     location: Optional[str]
+    photo_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
 
     
     class Config:
@@ -52,6 +64,10 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+class RequestReview(BaseModel):
+    request_ids: list[int]
+    decision: str  # "approve" or "deny"
+
 class RequestCreate(BaseModel):
     item_id: int
     user_id: int
@@ -66,4 +82,95 @@ class RequestOut(BaseModel):
     reviewed_at: Optional[datetime.datetime]
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class ItemSummary(BaseModel):
+    id: int
+    name: Optional[str]
+    type: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+class UserSummary(BaseModel):
+    id: int
+    username: str
+    email: str
+
+    class Config:
+        orm_mode = True
+
+class RequestExpandedOut(RequestOut):
+    # only present when asked for with ?expand=item,user
+    item: Optional[ItemSummary] = None
+    user: Optional[UserSummary] = None
+
+class ItemCounts(BaseModel):
+    total: int
+    by_status: dict[str, int]
+    by_location: dict[str, int]
+
+class RequestCounts(BaseModel):
+    total: int
+    by_status: dict[str, int]
+
+class UserCounts(BaseModel):
+    total: int
+
+class StatsSummary(BaseModel):
+    items: ItemCounts
+    requests: RequestCounts
+    users: UserCounts
+
+class ItemEventOut(BaseModel):
+    id: int
+    occurred_at: datetime.datetime
+    item_id: int
+    kind: str
+    status: Optional[str]
+    previous_status: Optional[str]
+    location: Optional[str]
+    request_id: Optional[int]
+    user_id: Optional[int]
+
+    class Config:
+        orm_mode = True
+
+class BatchOperation(BaseModel):
+    key: str  # idempotency key, unique per user
+    op: str  # create_item, update_item, create_request, delete_request
+    id: Optional[int] = None  # target item or request
+    data: dict = {}
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation]
+
+class BatchResult(BaseModel):
+    key: str
+    op: str
+    status: int
+    body: Optional[Any] = None
+    replayed: bool = False
+
+class BatchResponse(BaseModel):
+    results: list[BatchResult]
+
+class ReportCreate(BaseModel):
+    kind: str  # checkouts, approval_times
+    since: Optional[datetime.datetime] = None  # only requests made in [since, until)
+    until: Optional[datetime.datetime] = None
+
+class ReportJobOut(BaseModel):
+    id: int
+    kind: str
+    params: dict
+    status: str  # queued, running, done, failed
+    created_at: Optional[datetime.datetime]
+    started_at: Optional[datetime.datetime]
+    finished_at: Optional[datetime.datetime]
+    attempts: int
+    rows: Optional[int]
+    file_bytes: Optional[int]
+    summary: Optional[dict]
+    error: Optional[str]
+    download_url: Optional[str]
@@ -0,0 +1,124 @@
+import re
+from sqlalchemy import DDL, Float, Integer, event, func, literal_column, or_, text
+from sqlalchemy.orm import Session
+from models import Item
+
+# Full-text search over items.
+#
+# PostgreSQL: a tsvector column (items.search_vector) with a GIN index, plus
+# a text_pattern_ops btree on serial_number for prefix lookups. The vector
+# includes the type and location names, which live in lookup tables, so it is
+# kept current by a trigger rather than being a generated column. The same
+# objects are created by the 9b1e5c7d2a40 and e5a1c7b3d920 Alembic revisions;
+# the DDL below only runs when the table itself is created through create_all.
+#
+# SQLite: a contentless FTS5 table kept in sync by triggers, so the
+# endpoint can be exercised locally without PostgreSQL.
+
+PG_SEARCH_VECTOR_FUNCTION = """
+    CREATE OR REPLACE FUNCTION items_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := to_tsvector('simple',
+            coalesce(NEW.name, '') || ' ' ||
+            coalesce((SELECT name FROM item_types WHERE id = NEW.type_id), '') || ' ' ||
+            coalesce(NEW.serial_number, '') || ' ' ||
+            coalesce((SELECT name FROM locations WHERE id = NEW.location_id), ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+PG_SEARCH_DDL = [
+    "ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    PG_SEARCH_VECTOR_FUNCTION,
+    """
+    CREATE TRIGGER items_search_vector BEFORE INSERT OR UPDATE OF name, type_id, serial_number, location_id
+    ON items FOR EACH ROW EXECUTE FUNCTION items_search_vector()
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_items_search_vector ON items USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_items_serial_number_prefix ON items (serial_number text_pattern_ops)",
+]
+
+# the FTS table indexes names; type and location are looked up from their ids
+_SQLITE_NEW = "new.id, new.name, (SELECT name FROM item_types WHERE id = new.type_id), new.serial_number, (SELECT name FROM locations WHERE id = new.location_id)"
+_SQLITE_OLD = "old.id, old.name, (SELECT name FROM item_types WHERE id = old.type_id), old.serial_number, (SELECT name FROM locations WHERE id = old.location_id)"
+
+SQLITE_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+        name, type, serial_number, location, content=''
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN
+        INSERT INTO items_fts(rowid, name, type, serial_number, location)
+        VALUES ({_SQLITE_NEW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, name, type, serial_number, location)
+        VALUES ('delete', {_SQLITE_OLD});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE ON items BEGIN
+        INSERT INTO items_fts(items_fts, rowid, name, type, serial_number, location)
+        VALUES ('delete', {_SQLITE_OLD});
+        INSERT INTO items_fts(rowid, name, type, serial_number, location)
+        VALUES ({_SQLITE_NEW});
+    END
+    """,
+]
+
+for statement in PG_SEARCH_DDL:
+    event.listen(Item.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Item.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+
+def _tokens(q: str) -> list[str]:
+    return re.findall(r"\w+", q.lower())
+
+
+def _like_prefix(q: str) -> str:
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def search_items(db: Session, q: str, limit: int) -> list[Item]:
+    """
+    Return up to `limit` items matching `q`, best match first. Every word in
+    the query is matched as a prefix, so "lap del" finds "Laptop Dell 5420".
+    On PostgreSQL serial numbers that start with the raw query rank first.
+    """
+    tokens = _tokens(q)
+    if not tokens:
+        return []
+
+    if db.get_bind().dialect.name == "sqlite":
+        match = " AND ".join(f'"{token}"*' for token in tokens)
+        hits = (
+            text("SELECT rowid AS id, bm25(items_fts) AS rank FROM items_fts WHERE items_fts MATCH :match")
+            .bindparams(match=match)
+            .columns(id=Integer, rank=Float)
+            .subquery()
+        )
+        return (
+            db.query(Item)
+            .join(hits, hits.c.id == Item.id)
+            .order_by(hits.c.rank, Item.id)
+            .limit(limit)
+            .all()
+        )
+
+    tsquery = func.to_tsquery("simple", " & ".join(f"{token}:*" for token in tokens))
+    vector = literal_column("items.search_vector")
+    serial_hit = Item.serial_number.like(_like_prefix(q.strip()), escape="\\")
+    return (
+        db.query(Item)
+        .filter(or_(vector.op("@@")(tsquery), serial_hit))
+        .order_by(serial_hit.desc(), func.ts_rank(vector, tsquery).desc(), Item.id)
+        .limit(limit)
+        .all()
+    )
@@ -0,0 +1,164 @@
+import argparse
+import logging
+import os
+import time
+
+# Production entry point.
+#
+#     python serve.py --workers 4 --bind 0.0.0.0:8000
+#
+# 1. Sizes each worker's connection pools so that all workers together stay
+#    within --db-connections (DB_POOL_SIZE / DB_MAX_OVERFLOW win if set).
+# 2. Bootstraps the database once, here, before any worker exists (see
+#    bootstrap.py) and tells the workers not to repeat it.
+# 3. Runs gunicorn with uvicorn workers and the app preloaded: it is imported
+#    once in the master and the workers are forked from it, so adding
+#    workers costs a fork rather than another import. Connections the master
+#    opened are dropped before forking and each worker opens its own.
+# 4. Refuses more than one worker while state that has to be shared is kept
+#    per process: set RATE_LIMIT_BACKEND=redis (or off, behind a limiting
+#    proxy) and EVENTS_BACKEND=postgres. CACHE_BACKEND=memory is fine, its
+#    keys are the database table versions, so each worker's copy is only
+#    duplicated, never stale; redis shares one copy. Without --workers (or
+#    WEB_CONCURRENCY) it starts one worker per CPU once those are set, and a
+#    single worker until then.
+#
+# Without gunicorn (Windows, minimal installs) uvicorn's own process manager
+# is used; its workers import the app themselves.
+#
+# --graceful-timeout bounds shutdown: open /events streams never finish on
+# their own, so workers are stopped after that many seconds regardless.
+
+started = time.perf_counter()
+logger = logging.getLogger("serve")
+
+
+def size_pools(workers: int, budget: int) -> None:
+    # every worker has a sync and an async engine
+    per_engine = max(2, budget // (workers * 2))
+    os.environ.setdefault("DB_POOL_SIZE", str(per_engine))
+    os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+
+
+def per_process_state() -> list[str]:
+    """Settings that only hold within one process and break with several workers."""
+    # read from the environment: importing ratelimit/events would create the
+    # engines before size_pools has run (defaults as in those modules)
+    found = []
+    if os.getenv("RATE_LIMIT_BACKEND", "memory") == "memory":
+        found.append("RATE_LIMIT_BACKEND=memory: every worker would allow the full limit")
+    if os.getenv("EVENTS_BACKEND", "memory") == "memory":
+        found.append("EVENTS_BACKEND=memory: /events would only see the changes of its own worker")
+    return found
+
+
+def default_workers() -> int:
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    if per_process_state():
+        logger.info("starting one worker, state is kept per process (see serve.py)")
+        return 1
+    return os.cpu_count() or 1
+
+
+def post_fork(server, worker) -> None:
+    import database
+
+    # sockets inherited from the master must not be shared; start with empty pools
+    database.dispose_all(close=False)
+
+
+def when_ready(server) -> None:
+    logger.info("listening after %.2fs", time.perf_counter() - started)
+
+
+def run_gunicorn(args) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    try:
+        import uvicorn_worker  # noqa: F401
+        worker_class = "uvicorn_worker.UvicornWorker"
+    except ImportError:
+        worker_class = "uvicorn.workers.UvicornWorker"
+
+    class Server(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": args.bind,
+                "workers": args.workers,
+                "worker_class": worker_class,
+                "preload_app": args.preload,
+                "graceful_timeout": args.graceful_timeout,
+                "timeout": args.timeout,
+                "keepalive": 5,
+                "post_fork": post_fork,
+                "when_ready": when_ready,
+                "loglevel": args.log_level,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+
+            return app
+
+    Server().run()
+
+
+def run_uvicorn(args) -> None:
+    import uvicorn
+
+    bind = {"uds": args.bind[5:]} if args.bind.startswith("unix:") else {
+        "host": args.bind.rpartition(":")[0] or "0.0.0.0",
+        "port": int(args.bind.rpartition(":")[2]),
+    }
+    uvicorn.run(
+        "app:app",
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        **bind,
+    )
+
+
+def main(args) -> None:
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(message)s")
+    if args.workers is None:
+        args.workers = default_workers()
+    size_pools(args.workers, args.db_connections)
+    problems = per_process_state() if args.workers > 1 else []
+    if problems:
+        raise SystemExit(f"refusing to start {args.workers} workers:\n  " + "\n  ".join(problems))
+
+    import bootstrap
+    import database
+
+    bootstrap.run()
+    os.environ[bootstrap.BOOTSTRAPPED_ENV] = "1"
+    database.dispose_all()
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+    if gunicorn is None or args.server == "uvicorn":
+        run_uvicorn(args)
+    else:
+        run_gunicorn(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--bind", default=os.getenv("BIND", "0.0.0.0:8000"), help="host:port or unix:/path/to.sock")
+    parser.add_argument("--workers", type=int, help="default: WEB_CONCURRENCY, else one per CPU if nothing is kept per process, else one")
+    parser.add_argument(
+        "--db-connections", type=int, default=int(os.getenv("DB_MAX_CONNECTIONS", "90")),
+        help="connections all workers may hold together; keep below PostgreSQL's max_connections",
+    )
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn"], default="gunicorn")
+    parser.add_argument("--no-preload", dest="preload", action="store_false", help="import the app in every worker instead")
+    parser.add_argument("--graceful-timeout", type=int, default=10, help="seconds a stopping worker may spend on open requests")
+    parser.add_argument("--timeout", type=int, default=60, help="seconds before an unresponsive worker is restarted")
+    parser.add_argument("--log-level", default="info")
+    main(parser.parse_args())
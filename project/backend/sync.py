@@ -0,0 +1,165 @@
+import argparse
+import base64
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import DEFAULT_SCHOOL_ID, Item, Request, TableVersion, Tombstone, User
+from projection import rows_as_dicts, select_columns
+from schemas import ItemOut, RequestOut, UserOut
+import tenancy
+
+# Incremental sync behind GET /changes.
+#
+# Every write stamps the rows it inserts or updates with its table version
+# and leaves a tombstone per deleted row (see versioning.py). Writers of a
+# table take turns on its table_versions row until they commit, so reading
+# "everything above version N" never misses a row committed later with a
+# smaller version.
+#
+# A client keeps the cursor from its last response and asks for what
+# changed since. Per table, rows and tombstones are read in (version, id)
+# order and merged, so a page never reports an older change after a newer
+# one, and more: true means another page is waiting. Without a cursor the
+# tables are sent whole, paged the same way. The cursor is opaque to
+# clients: per table the last row and tombstone position delivered, the
+# school, and when it was issued. Versions are counted per school (the
+# session filter keeps every read here to the current one), so a cursor is
+# only good for the school it was issued for; any other gets reset.
+#
+# Tombstones are pruned after TOMBSTONE_DAYS by
+#
+#     python sync.py --days 30
+#
+# and a cursor about that old (or from a recreated database) gets reset:
+# true with the start of a fresh snapshot, and the client drops its copy.
+
+TOMBSTONE_DAYS = int(os.getenv("TOMBSTONE_DAYS", "30"))
+PAGE_SIZE = 2000
+MAX_PAGE_SIZE = 10000
+
+SYNCED = {
+    "items": (Item, ItemOut),
+    "requests": (Request, RequestOut),
+    "users": (User, UserOut),
+}
+
+
+def encode_cursor(positions: dict[str, list[int]], school_id: int) -> str:
+    data = {"t": int(time.time()), "s": school_id, **positions}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, int, dict[str, list[int]]]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        issued = int(data.pop("t"))
+        school_id = int(data.pop("s", DEFAULT_SCHOOL_ID))
+        positions = {table: [int(n) for n in data[table]] for table in data if table in SYNCED}
+        if any(len(position) != 4 for position in positions.values()):
+            raise ValueError
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor; start again without one")
+    return issued, school_id, positions
+
+
+def _expired(issued: int) -> bool:
+    # a day of slack for deletes whose transaction started before the cursor was issued
+    return issued < time.time() - (TOMBSTONE_DAYS - 1) * 86400
+
+
+async def read_changes(db: AsyncSession, tables: list[str], cursor: Optional[str], limit: int) -> dict:
+    positions, reset = {}, False
+    school = tenancy.current()
+    if cursor:
+        issued, cursor_school, positions = decode_cursor(cursor)
+        reset = _expired(issued) or cursor_school != school
+    result = await db.execute(select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(tables)))
+    current = dict(result.all())
+    # a cursor ahead of the counters is from a database that has been recreated since
+    if any(max(position[0], position[2]) > current.get(table, 0) for table, position in positions.items() if table in tables):
+        reset = True
+    if reset:
+        positions = {}
+
+    body = {"entities": {}, "more": False, "reset": reset}
+    for table in tables:
+        # a snapshot starts with every row and only the deletes that happen from now on
+        position = positions.get(table) or [-1, 0, current.get(table, 0), 0]
+        changes, position, more = await _read_table(db, table, position, limit)
+        body["entities"][table] = changes
+        positions[table] = position
+        body["more"] = body["more"] or more
+    body["cursor"] = encode_cursor(positions, school)
+    return body
+
+
+async def _read_table(db: AsyncSession, table: str, position: list[int], limit: int) -> tuple[dict, list[int], bool]:
+    model, schema = SYNCED[table]
+    row_version, row_id, tomb_version, tomb_id = position
+    columns = select_columns(model, schema, None)
+    result = await db.execute(
+        select(model.version, *columns)
+        .where(tuple_(model.version, model.id) > tuple_(row_version, row_id))
+        .order_by(model.version, model.id)
+        .limit(limit + 1)
+    )
+    rows = rows_as_dicts(result, [model.version, *columns])
+    result = await db.execute(
+        select(Tombstone.version, Tombstone.row_id)
+        .where(Tombstone.table_name == table)
+        .where(tuple_(Tombstone.version, Tombstone.row_id) > tuple_(tomb_version, tomb_id))
+        .order_by(Tombstone.version, Tombstone.row_id)
+        .limit(limit + 1)
+    )
+    tombstones = result.all()
+
+    merged = sorted(
+        [(row["version"], row["id"], 0, row) for row in rows]
+        + [(version, row_id, 1, None) for version, row_id in tombstones],
+        key=lambda change: change[:3],
+    )
+    more = len(merged) > limit
+    # the latest change to an id within the page wins
+    latest = {}
+    for version, id, is_tombstone, row in merged[:limit]:
+        latest[id] = row
+        if is_tombstone:
+            tomb_version, tomb_id = version, id
+        else:
+            row_version, row_id = version, id
+    upserted = []
+    for row in latest.values():
+        if row is not None:
+            row.pop("version")
+            upserted.append(row)
+    deleted = [id for id, row in latest.items() if row is None]
+    return {"upserted": upserted, "deleted": deleted}, [row_version, row_id, tomb_version, tomb_id], more
+
+
+def prune_tombstones(connection: Connection, days: int = TOMBSTONE_DAYS) -> int:
+    """Delete tombstones older than `days`; returns how many."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    return connection.execute(delete(Tombstone).where(Tombstone.deleted_at < cutoff)).rowcount
+
+
+def main(args) -> None:
+    import database
+
+    pruned = 0
+    # every school's, in the main database and in each shard
+    for engine in [database.engine, *database.shard_engines()]:
+        with engine.begin() as conn:
+            pruned += prune_tombstones(conn, args.days)
+    print(f"pruned {pruned} tombstone(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete tombstones clients no longer need")
+    parser.add_argument("--days", type=int, default=TOMBSTONE_DAYS, help="days of deletes to keep for GET /changes")
+    main(parser.parse_args())
@@ -0,0 +1,273 @@
+import argparse
+import getpass
+import json
+import os
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Optional
+from urllib.parse import parse_qs
+from fastapi import HTTPException
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import ORMExecuteState, Session, with_loader_criteria
+from starlette.concurrency import run_in_threadpool
+from auth import decode_access_token, get_password_hash
+import database
+from database import current_school
+from models import (
+    DEFAULT_SCHOOL_ID, Item, ItemEvent, ReportJob, Request, School, StatCounter, TableVersion, Tombstone, User,
+)
+
+# Multi-school tenancy.
+#
+# Every tenant table carries school_id, and every request works for exactly
+# one school. TenantMiddleware resolves it - the school_id claim of a valid
+# bearer token, otherwise the default school - and keeps it in
+# database.current_school for the rest of the request. Only login and
+# registration, whose callers have no token yet, may name a school with the
+# X-School-Id header; anywhere else the header is refused rather than
+# trusted. EventSource cannot send headers, so GET /events takes the token
+# as ?access_token= (keep it out of access logs).
+#
+# With a school set, every ORM select, update and delete a session runs is
+# filtered on it (with_loader_criteria, which also reaches joins, lazy loads
+# and db.get), and new rows are written with it, so routes never mention
+# school_id. Core statements (bulk import, counters, /changes, reports) pass
+# the school themselves. Scripts and background jobs run with no school set
+# and see every school; school_scope() narrows them to one.
+#
+# TENANT_RLS=1 adds PostgreSQL row-level security underneath as a second
+# line of defence: each transaction sets app.school_id and a policy on the
+# tenant tables only shows and accepts that school's rows. The policies bind
+# roles other than the table owner, so run the API as its own role and
+# migrations and maintenance as the owner. report_jobs is left out: the
+# report workers claim jobs of every school.
+
+SCHOOL_HEADER = "X-School-Id"
+SCHOOL_HEADER_ROUTES = {"POST /login/", "POST /register/"}
+QUERY_TOKEN_ROUTES = {"GET /events"}
+TENANT_RLS = os.getenv("TENANT_RLS", "0") == "1"
+
+TENANT_MODELS = (User, Item, Request, ItemEvent, ReportJob, TableVersion, Tombstone, StatCounter)
+RLS_TABLES = ("users", "items", "requests", "item_events", "table_versions", "tombstones", "stat_counters")
+RLS_POLICY = "school_isolation"
+
+_known_schools: set[int] = set()
+
+
+class OtherSchoolReference(LookupError):
+    """A request written for one school names an item or user of another; to that school they do not exist."""
+
+
+def current() -> int:
+    """The school of this request, or the default one outside any."""
+    school = current_school.get()
+    return DEFAULT_SCHOOL_ID if school is None else school
+
+
+@contextmanager
+def school_scope(school_id: Optional[int]) -> Iterator[None]:
+    token = current_school.set(school_id)
+    try:
+        yield
+    finally:
+        current_school.reset(token)
+
+
+def known_school(school_id: int) -> bool:
+    if school_id not in _known_schools:
+        # schools are only ever added, so a miss is the one case that reads the table
+        with Session(database.engine) as db:
+            _known_schools.update(db.scalars(select(School.id)))
+    return school_id in _known_schools
+
+
+def bearer_token(scope, headers: dict, route: str) -> Optional[str]:
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if authorization[:7].lower() == "bearer ":
+        return authorization[7:]
+    if route in QUERY_TOKEN_ROUTES:
+        values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("access_token")
+        return values[0] if values else None
+    return None
+
+
+def requested_school(scope) -> Optional[str]:
+    headers = dict(scope["headers"])
+    route = f"{scope.get('method', 'GET')} {scope['path']}"
+    token = bearer_token(scope, headers, route)
+    if token:
+        try:
+            return str(decode_access_token(token).get("school_id", DEFAULT_SCHOOL_ID))
+        except HTTPException:
+            pass  # bad token: the route rejects it, if it needs one
+    value = headers.get(SCHOOL_HEADER.lower().encode())
+    if value is None:
+        return None
+    if route not in SCHOOL_HEADER_ROUTES:
+        raise HTTPException(status_code=401, detail=f"{SCHOOL_HEADER} is only accepted by login and registration, send a bearer token")
+    return value.decode("latin-1")
+
+
+class TenantMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+        try:
+            value = requested_school(scope)
+        except HTTPException as e:
+            return await self.reject(send, e.detail, e.status_code)
+        school = DEFAULT_SCHOOL_ID
+        if value is not None:
+            try:
+                school = int(value)
+            except ValueError:
+                school = None
+            if school is None or not await run_in_threadpool(known_school, school):
+                return await self.reject(send, f"Unknown school {value!r}")
+        token = current_school.set(school)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_school.reset(token)
+
+    @staticmethod
+    async def reject(send, detail: str, status: int = 400) -> None:
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+
+@lru_cache(maxsize=1024)
+def _criteria(school: int) -> tuple:
+    return tuple(
+        with_loader_criteria(model, lambda cls: cls.school_id == school, include_aliases=True)
+        for model in TENANT_MODELS
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _filter_on_school(state: ORMExecuteState) -> None:
+    school = current_school.get()
+    if school is None or state.is_column_load or state.is_relationship_load:
+        # lazy loads carry the criteria of the statement that loaded the parent
+        return
+    if not (state.is_select or state.is_update or state.is_delete) or state.execution_options.get("all_schools"):
+        return
+    state.statement = state.statement.options(*_criteria(school))
+
+
+# inserted ahead of versioning's before_flush, which reads the school of each new row
+@event.listens_for(Session, "before_flush", insert=True)
+def _stamp_school(session: Session, flush_context, instances) -> None:
+    school = current_school.get()
+    for obj in session.new:
+        if isinstance(obj, TENANT_MODELS):
+            if school is not None:
+                obj.school_id = school
+            elif obj.school_id is None:
+                obj.school_id = DEFAULT_SCHOOL_ID
+    if school is not None:
+        _check_references(session, school)
+
+
+def _check_references(session: Session, school: int) -> None:
+    # the foreign keys accept any school's ids; a request may only name its own school's
+    requests = [obj for obj in session.new if isinstance(obj, Request)] + [
+        obj for obj in session.dirty
+        if isinstance(obj, Request) and any(inspect(obj).attrs[key].history.has_changes() for key in ("item_id", "user_id"))
+    ]
+    if not requests:
+        return
+    for model, ids in ((Item, {obj.item_id for obj in requests}), (User, {obj.user_id for obj in requests})):
+        ids.discard(None)
+        with session.no_autoflush:
+            found = set(session.scalars(select(model.id).where(model.school_id == school, model.id.in_(ids))))
+        if ids - found:
+            raise OtherSchoolReference(f"{model.__name__} {', '.join(map(str, sorted(ids - found)))} not found")
+
+
+def apply_rls_setting(connection: Connection, school_id: Optional[int]) -> None:
+    """Scope the row-level security policies to `school_id` until the transaction ends."""
+    if connection.dialect.name == "postgresql" and school_id is not None:
+        connection.execute(text("SELECT set_config('app.school_id', :school, true)"), {"school": str(school_id)})
+
+
+if TENANT_RLS:
+    @event.listens_for(Session, "after_begin")
+    def _set_rls_school(session: Session, transaction, connection: Connection) -> None:
+        apply_rls_setting(connection, current_school.get())
+
+
+def enable_rls(connection: Connection) -> None:
+    # tables that already have the policy are left alone, so startup takes no locks on them
+    existing = set(connection.execute(
+        text("SELECT tablename FROM pg_policies WHERE policyname = :policy"), {"policy": RLS_POLICY}
+    ).scalars())
+    for table in RLS_TABLES:
+        if table in existing:
+            continue
+        connection.execute(text(f"ALTER TABLE {table} ENABLE ROW LEVEL SECURITY"))
+        connection.execute(text(
+            f"CREATE POLICY {RLS_POLICY} ON {table} "
+            "USING (school_id = NULLIF(current_setting('app.school_id', true), '')::int) "
+            "WITH CHECK (school_id = NULLIF(current_setting('app.school_id', true), '')::int)"
+        ))
+
+
+def disable_rls(connection: Connection) -> None:
+    for table in RLS_TABLES:
+        connection.execute(text(f"DROP POLICY IF EXISTS {RLS_POLICY} ON {table}"))
+        connection.execute(text(f"ALTER TABLE {table} DISABLE ROW LEVEL SECURITY"))
+
+
+def _add_admin(db: Session, school_id: int, username: str, password: str, email: Optional[str]) -> None:
+    db.add(User(
+        school_id=school_id,
+        username=username,
+        email=email or f"{username}@example.com",
+        password=get_password_hash(password),
+        role="admin",
+    ))
+
+
+def add_school(name: str, admin_username: str, admin_password: str, admin_email: Optional[str] = None) -> int:
+    """Create a school with its first admin account; returns the school id."""
+    with Session(database.engine) as db, db.begin():
+        school = School(name=name)
+        db.add(school)
+        db.flush()
+        school_id = school.id
+        routed = database.engine_for(school_id) is not database.engine
+        if not routed:
+            # in the same transaction, so a school never exists without its admin
+            _add_admin(db, school_id, admin_username, admin_password, admin_email)
+    # shards hold their own copy of the table, their school_id columns refer to it
+    for shard in database.shard_engines():
+        with shard.begin() as conn:
+            if conn.scalar(select(School.id).where(School.id == school_id)) is None:
+                conn.execute(School.__table__.insert().values(id=school_id, name=name))
+    if routed:
+        with Session(database.engine_for(school_id)) as db, db.begin():
+            _add_admin(db, school_id, admin_username, admin_password, admin_email)
+    return school_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage schools and row-level security")
+    parser.add_argument("--add-school", metavar="NAME", help="create a school and print its id")
+    parser.add_argument("--admin-username", help="first admin of the new school (with --add-school)")
+    parser.add_argument("--admin-email", help="defaults to <username>@example.com")
+    parser.add_argument("--rls", choices=["on", "off"], help="create or drop the row-level security policies")
+    args = parser.parse_args()
+    if args.add_school:
+        if not args.admin_username:
+            parser.error("--add-school needs --admin-username")
+        # asked for rather than taken as an argument, which would end up in the shell history
+        password = getpass.getpass(f"password for {args.admin_username}: ")
+        print(add_school(args.add_school, args.admin_username, password, args.admin_email))
+    if args.rls:
+        with database.engine.begin() as conn:
+            (enable_rls if args.rls == "on" else disable_rls)(conn)
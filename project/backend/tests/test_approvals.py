@@ -0,0 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from benchmarks.approval_race import approve, cleanup, seed
+from models import Item, Request, RequestStatus, StatusOptions
+
+
+def test_concurrent_approvals_check_out_the_item_once(database):
+    user_id, item_id, request_ids = seed(2)
+    try:
+        barrier = Barrier(len(request_ids))
+        with ThreadPoolExecutor(max_workers=len(request_ids)) as pool:
+            reviewed = [request_id for ids in pool.map(lambda request_id: approve([request_id], barrier), request_ids) for request_id in ids]
+        with database.SessionLocal() as db:
+            statuses = dict(db.query(Request.id, Request.status).filter(Request.item_id == item_id))
+            item_status = db.get(Item, item_id).status
+    finally:
+        cleanup(user_id, item_id)
+
+    assert len(reviewed) == 1
+    assert statuses[reviewed[0]] == RequestStatus.approved.value
+    assert list(statuses.values()).count(RequestStatus.approved.value) == 1
+    assert item_status == StatusOptions.checked_out.value
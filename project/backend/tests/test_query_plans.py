@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import pytest
+from sqlalchemy import event, select, text
+from benchmarks.common import asgi_client
+
+# Query-plan regressions: the route queries must keep using their indexes.
+#
+# The database is topped up with TEST_PLAN_ROWS items and requests from
+# benchmarks.seed, spread over PLAN_SCHOOLS schools so the default one holds
+# only its share as it would in a shared deployment (appended once, later
+# runs reuse them) and analysed. Each case then calls a route as the default
+# school's admin, captures the statements it sends and EXPLAINs them with the
+# planner's normal settings. A case fails when its index is missing from
+# every plan, e.g. because the query no longer matches it or a sequential
+# scan became cheaper.
+
+PLAN_ROWS = int(os.getenv("TEST_PLAN_ROWS", "50000"))
+PLAN_SCHOOLS = 20
+
+CASES = [
+    # method, path, params or JSON body, table, index
+    ("GET", "/items/", {"cursor": 100, "limit": 50}, "items", "ix_items_school_id_id"),
+    ("GET", "/items/", {"status": "Available", "limit": 50}, "items", "ix_items_school_id_status_id"),
+    ("GET", "/items/", {"type": "Laptop", "limit": 50}, "items", "ix_items_school_id_type_id"),
+    ("GET", "/items/", {"location": "Room 7", "limit": 50}, "items", "ix_items_school_id_location_id"),
+    ("GET", "/items/", {"condition": "Fair", "limit": 50}, "items", "ix_items_school_id_condition_id"),
+    ("GET", "/items/search", {"q": "thinkpad"}, "items", "ix_items_search_vector"),
+    ("GET", "/items/search", {"q": "SN-0000012"}, "items", "ix_items_serial_number_prefix"),
+    ("GET", "/requests/", {"user_id": 2}, "requests", "ix_requests_user_id_requested_at"),
+    ("GET", "/requests/", {"status": "Pending", "user_id": 2}, "requests", "ix_requests_user_id_requested_at"),
+    ("GET", "/requests/", {"item_id": 3}, "requests", "ix_requests_item_id_status"),
+    ("GET", "/requests/", {"item_id": 3, "status": "Approved", "expand": "item,user"}, "requests", "ix_requests_item_id_status"),
+    ("POST", "/requests/approve", {"request_ids": [1, 2, 3], "decision": "deny"}, "requests", "requests_pkey"),
+    ("GET", "/items/3/history", {}, "item_events", "item_id_occurred_at"),
+    ("GET", "/item-events/", {}, "item_events", "school_id_occurred_at"),
+]
+
+
+@pytest.fixture(scope="module")
+def seeded(database):
+    import tenancy
+    from benchmarks.seed import fill
+    from models import School
+
+    with database.engine.connect() as conn:
+        schools = list(conn.scalars(select(School.id).order_by(School.id)))
+        counts = dict(conn.execute(text("SELECT school_id, count(*) FROM items GROUP BY school_id")).all())
+    while len(schools) < PLAN_SCHOOLS:
+        schools.append(tenancy.add_school(f"Plan school {len(schools) + 1}", "admin", "admin"))
+
+    async def fill_schools():
+        try:
+            for school in schools[:PLAN_SCHOOLS]:
+                missing = PLAN_ROWS // PLAN_SCHOOLS - counts.get(school, 0)
+                if missing > 0:
+                    await fill(users=max(missing // 20, 1), items=missing, requests=missing, school=school)
+        finally:
+            await database.async_engine.dispose()
+
+    asyncio.run(fill_schools())
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # also flushes the GIN pending list so plans reflect a settled table
+        conn.execute(text("VACUUM ANALYZE"))
+    return database
+
+
+def index_names(plan: dict) -> set[str]:
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        names |= index_names(child)
+    return names
+
+
+async def explain(engine, statement: str, parameters) -> dict:
+    sql = "EXPLAIN (FORMAT JSON) " + statement
+    if hasattr(engine, "sync_engine"):
+        async with engine.connect() as conn:
+            plan = (await conn.exec_driver_sql(sql, parameters)).scalar()
+    else:
+        with engine.connect() as conn:
+            plan = conn.exec_driver_sql(sql, parameters).scalar()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+
+async def indexes_used(database, method: str, path: str, params: dict, table: str) -> set[str]:
+    """Call the route and return the indexes the plans of its statements on `table` use."""
+    from app import app
+
+    captured = []
+
+    def recorder(engine):
+        def record(conn, cursor, statement, parameters, context, executemany):
+            flat = " ".join(statement.split())
+            if flat.upper().startswith(("SELECT", "UPDATE", "WITH")) and f"FROM {table}" in flat:
+                captured.append((engine, statement, parameters))
+        return record
+
+    listeners = [(database.engine, recorder(database.engine)), (database.async_engine.sync_engine, recorder(database.async_engine))]
+    async with asgi_client(app) as client:
+        token = (await client.post("/login/", json={"username": "admin", "password": "admin"})).json()["access_token"]
+        auth = {"Authorization": f"Bearer {token}"}
+        for target, record in listeners:
+            event.listen(target, "before_cursor_execute", record)
+        try:
+            if method == "GET":
+                response = await client.get(path, params=params, headers=auth)
+            else:
+                response = await client.request(method, path, json=params, headers=auth)
+        finally:
+            for target, record in listeners:
+                event.remove(target, "before_cursor_execute", record)
+        assert response.status_code == 200, response.text
+
+    assert captured, f"{path} sent no query on {table}"
+    used = set()
+    for engine, statement, parameters in captured:
+        used |= index_names(await explain(engine, statement, parameters))
+    return used
+
+
+async def run(database, *args) -> set[str]:
+    try:
+        return await indexes_used(database, *args)
+    finally:
+        # each test runs its own event loop, the pooled asyncpg connections belong to this one
+        await database.async_engine.dispose()
+
+
+@pytest.mark.parametrize("method, path, params, table, index", CASES)
+def test_route_queries_use_their_indexes(seeded, method, path, params, table, index):
+    used = asyncio.run(run(seeded, method, path, params, table))
+    assert any(index in name for name in used), f"{method} {path} {params} used {sorted(used) or 'no index'}"
@@ -0,0 +1,161 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from itertools import chain
+from typing import Iterable, Optional
+from fastapi import Response
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import DEFAULT_SCHOOL_ID, TableVersion, Tombstone
+import tenancy
+
+# Per-table change counters used for ETag / Last-Modified validators.
+#
+# Every ORM flush that inserts, updates or deletes rows of a tracked table
+# bumps that table's row in table_versions inside the same transaction, so a
+# rolled back write never changes the validator. Core statements that bypass
+# the ORM (bulk import) call bump() themselves.
+#
+# The flush also stamps the new version on the rows it writes (their version
+# column) and leaves a tombstone for the rows it deletes, which is what
+# GET /changes reads (see sync.py). The bump happens before the rows are
+# written and the counter row stays locked until commit, so a table's writes
+# commit in version order.
+#
+# Counters are kept per school: a school's writes only ever lock its own
+# counter rows, and its validators and change cursors only move when its own
+# rows change.
+
+TRACKED_TABLES = {"users", "items", "requests"}
+
+def bump(connection: Connection, tables: Iterable[str], school_id: int = DEFAULT_SCHOOL_ID) -> dict[str, int]:
+    """Increment the counters of `tables` for one school and return their new versions."""
+    versions = TableVersion.__table__
+    bumped = {}
+    # fixed order so concurrent writers lock the counter rows consistently
+    for table in sorted(tables):
+        if connection.dialect.name in ("postgresql", "sqlite"):
+            # one statement, so two first writers of a counter row can't both insert it
+            dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+            stmt = dialect_insert(versions).values(school_id=school_id, table_name=table, version=1, updated_at=func.now())
+            version = connection.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["school_id", "table_name"],
+                    set_={"version": versions.c.version + 1, "updated_at": func.now()},
+                ).returning(versions.c.version)
+            ).scalar()
+            bumped[table] = version
+            continue
+        version = connection.execute(
+            update(versions)
+            .where(versions.c.school_id == school_id, versions.c.table_name == table)
+            .values(version=versions.c.version + 1, updated_at=func.now())
+            .returning(versions.c.version)
+        ).scalar()
+        if version is None:
+            connection.execute(
+                insert(versions).values(school_id=school_id, table_name=table, version=1, updated_at=func.now())
+            )
+            version = 1
+        bumped[table] = version
+    return bumped
+
+def _tracked(objects) -> list:
+    return [obj for obj in objects if getattr(obj, "__tablename__", None) in TRACKED_TABLES]
+
+@event.listens_for(Session, "before_flush")
+def _bump_flushed_tables(session: Session, flush_context, instances) -> None:
+    written = _tracked(chain(session.new, (obj for obj in session.dirty if session.is_modified(obj, include_collections=False))))
+    deleted = _tracked(session.deleted)
+    changed = defaultdict(set)
+    for obj in chain(written, deleted):
+        # new rows have their school by now, tenancy's before_flush hook runs first
+        changed[obj.school_id].add(obj.__tablename__)
+    if not changed:
+        return
+    connection = session.connection()
+    versions = {school: bump(connection, tables, school) for school, tables in sorted(changed.items())}
+    # kept for the rest of the transaction, change events carry these versions
+    for school, bumped in versions.items():
+        session.info.setdefault("table_versions", {}).setdefault(school, {}).update(bumped)
+    for obj in written:
+        obj.version = versions[obj.school_id][obj.__tablename__]
+    if deleted:
+        record_deletes(connection, [
+            (obj.__tablename__, obj.id, versions[obj.school_id][obj.__tablename__], obj.school_id) for obj in deleted
+        ])
+
+def record_deletes(connection: Connection, rows: Iterable[tuple[str, int, int, int]]) -> None:
+    """Tombstones for deleted (table, id, version, school) rows; Core deletes call this themselves."""
+    tombstones = Tombstone.__table__
+    for table, row_id, version, school_id in rows:
+        # SQLite can hand the highest id out again, so it may have been deleted before
+        updated = connection.execute(
+            update(tombstones)
+            .where(tombstones.c.table_name == table, tombstones.c.row_id == row_id)
+            .values(version=version, school_id=school_id, deleted_at=func.now())
+        ).rowcount
+        if not updated:
+            connection.execute(
+                insert(tombstones).values(table_name=table, row_id=row_id, version=version, school_id=school_id)
+            )
+
+
+class Validators:
+    def __init__(self, versions: dict[str, tuple[int, Optional[datetime]]], school_id: int = DEFAULT_SCHOOL_ID):
+        self.versions = versions
+        self.school_id = school_id
+
+    @property
+    def etag(self) -> str:
+        # versions are per school, so the school is part of the tag
+        tag = "-".join(f"{table}.{version}" for table, (version, _) in self.versions.items())
+        return f'W/"s{self.school_id}-{tag}"'
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        stamps = [stamp for _, stamp in self.versions.values() if stamp is not None]
+        if not stamps:
+            return None
+        latest = max(stamp if stamp.tzinfo else stamp.replace(tzinfo=timezone.utc) for stamp in stamps)
+        return format_datetime(latest.astimezone(timezone.utc), usegmt=True)
+
+    def headers(self) -> dict[str, str]:
+        # no-cache: clients may store the response but must revalidate it with If-None-Match
+        headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+        if self.last_modified:
+            headers["Last-Modified"] = self.last_modified
+        return headers
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or self.etag.removeprefix("W/") in candidates
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers=self.headers())
+
+    def apply(self, response: Response) -> Response:
+        response.headers.update(self.headers())
+        return response
+
+
+def _versions_query(tables: tuple[str, ...]):
+    return select(TableVersion.table_name, TableVersion.version, TableVersion.updated_at).where(
+        TableVersion.school_id == tenancy.current(), TableVersion.table_name.in_(tables)
+    )
+
+def _validators(tables: tuple[str, ...], rows) -> Validators:
+    found = {name: (version, stamp) for name, version, stamp in rows}
+    return Validators({table: found.get(table, (0, None)) for table in tables}, tenancy.current())
+
+def read_validators(db: Session, tables: tuple[str, ...]) -> Validators:
+    return _validators(tables, db.execute(_versions_query(tables)).all())
+
+async def read_validators_async(db: AsyncSession, tables: tuple[str, ...]) -> Validators:
+    result = await db.execute(_versions_query(tables))
+    return _validators(tables, result.all())
@@ -0,0 +1,20 @@
+// Live change feed from GET /events (server-sent events).
+// onChange receives { entity, id, op, fields, version } records; op is
+// 'created', 'updated', 'deleted', or 'bulk' / 'resync' when the caller
+// should reload instead. A reconnect after an error is reported as 'resync'
+// too, since changes may have been missed while disconnected.
+export function subscribeChanges(entities, onChange) {
+  const params = new URLSearchParams({ entities: entities.join(',') })
+  // EventSource cannot send headers, so the token goes in the URL; it picks the school
+  const token = localStorage.getItem('access_token')
+  if (token) params.set('access_token', token)
+  const source = new EventSource(`http://45.137.220.25:8000/events?${params}`)
+  let dropped = false
+  source.addEventListener('change', (e) => onChange(JSON.parse(e.data)))
+  source.onerror = () => { dropped = true }
+  source.onopen = () => {
+    if (dropped) onChange({ entity: '*', op: 'resync' })
+    dropped = false
+  }
+  return () => source.close()
+}
@@ -0,0 +1,210 @@
+// Shared client-side copy of items, users and requests.
+//
+// Each table is a Map by id kept in IndexedDB, so switching views or
+// reloading the page does not download it again. sync() asks
+// GET /changes?since=<cursor> for what changed since the stored cursor and
+// applies it, rows and cursor in one IndexedDB transaction; a change pushed
+// on /events just triggers another sync(). Views read rows through rows()
+// and byId(), and keep writing through the API, followed by sync().
+//
+// setLocal()/removeLocal() change the in-memory copy only, for optimistic
+// updates: the next sync() brings the server's version, and a reload starts
+// from what IndexedDB holds. Without IndexedDB (private windows in some
+// browsers) the store works in memory and starts empty on every load.
+import { shallowReactive, ref } from 'vue'
+import { subscribeChanges } from './changes'
+
+const API = 'http://45.137.220.25:8000'
+const DB_NAME = 'equipment-store'
+const DB_VERSION = 1
+const TABLES = ['items', 'users', 'requests']
+const PAGE_SIZE = 5000
+
+const tables = Object.fromEntries(TABLES.map(name => [name, new Map()]))
+// bumped on every change to a table; what computed views depend on
+const revisions = shallowReactive(Object.fromEntries(TABLES.map(name => [name, 0])))
+const sortedCache = {}
+
+export const syncing = ref(false)
+export const syncError = ref('')
+
+let dbPromise = null
+let cursor = null
+let started = null
+let running = null
+let again = false
+let unsubscribe = null
+
+function request(req) {
+  return new Promise((resolve, reject) => {
+    req.onsuccess = () => resolve(req.result)
+    req.onerror = () => reject(req.error)
+  })
+}
+
+function done(tx) {
+  return new Promise((resolve, reject) => {
+    tx.oncomplete = () => resolve()
+    tx.onerror = tx.onabort = () => reject(tx.error)
+  })
+}
+
+function openDb() {
+  if (!dbPromise) {
+    if (typeof indexedDB === 'undefined') return (dbPromise = Promise.resolve(null))
+    const open = indexedDB.open(DB_NAME, DB_VERSION)
+    open.onupgradeneeded = () => {
+      for (const name of TABLES) open.result.createObjectStore(name, { keyPath: 'id' })
+      open.result.createObjectStore('meta')
+    }
+    dbPromise = request(open).catch(() => null)
+  }
+  return dbPromise
+}
+
+function touch(name) {
+  revisions[name]++
+}
+
+// load what IndexedDB holds, then follow the server
+async function load() {
+  const db = await openDb()
+  if (db) {
+    const tx = db.transaction([...TABLES, 'meta'], 'readonly')
+    const [stored, ...contents] = await Promise.all([
+      request(tx.objectStore('meta').get('cursor')),
+      ...TABLES.map(name => request(tx.objectStore(name).getAll())),
+    ])
+    TABLES.forEach((name, i) => {
+      for (const row of contents[i]) tables[name].set(row.id, Object.freeze(row))
+      touch(name)
+    })
+    cursor = stored ?? null
+  }
+  // another tab may have written newer rows; a change feed event is only a hint to sync
+  unsubscribe = subscribeChanges(['items', 'requests'], () => sync())
+  await sync()
+}
+
+// idempotent; every view calls it on mount
+export function start() {
+  if (!started) started = load()
+  else sync()
+  return started
+}
+
+export function sync() {
+  if (running) {
+    again = true
+    return running
+  }
+  running = (async () => {
+    syncing.value = true
+    try {
+      do {
+        again = false
+        await pull()
+      } while (again)
+      syncError.value = ''
+    } catch (e) {
+      syncError.value = 'Could not reach the server; showing saved data'
+    } finally {
+      syncing.value = false
+      running = null
+    }
+  })()
+  return running
+}
+
+async function pull() {
+  let more = true
+  while (more) {
+    const params = new URLSearchParams({ limit: String(PAGE_SIZE) })
+    if (cursor) params.set('since', cursor)
+    // the token says which school's rows to send
+    const token = localStorage.getItem('access_token')
+    const res = await fetch(`${API}/changes?${params}`, { headers: token ? { Authorization: `Bearer ${token}` } : {} })
+    if (res.status === 400 && cursor) {
+      // a cursor the server no longer understands: start over
+      await apply({ reset: true, entities: {}, cursor: null })
+      continue
+    }
+    if (!res.ok) throw new Error(`Server returned ${res.status}`)
+    const page = await res.json()
+    await apply(page)
+    more = page.more
+  }
+}
+
+async function apply(page) {
+  const db = await openDb()
+  const tx = db && db.transaction([...TABLES, 'meta'], 'readwrite')
+  if (page.reset) {
+    for (const name of TABLES) {
+      tables[name].clear()
+      if (tx) tx.objectStore(name).clear()
+    }
+  }
+  for (const [name, { upserted = [], deleted = [] } = {}] of Object.entries(page.entities)) {
+    const map = tables[name]
+    const objectStore = tx && tx.objectStore(name)
+    for (const row of upserted) {
+      map.set(row.id, Object.freeze(row))
+      if (objectStore) objectStore.put(row)
+    }
+    for (const id of deleted) {
+      map.delete(id)
+      if (objectStore) objectStore.delete(id)
+    }
+  }
+  cursor = page.cursor
+  if (tx) {
+    tx.objectStore('meta').put(cursor, 'cursor')
+    await done(tx)
+  }
+  for (const name of TABLES) {
+    if (page.reset || page.entities[name]?.upserted.length || page.entities[name]?.deleted.length) touch(name)
+  }
+}
+
+// rows of a table ordered by id; depend on it inside computed()
+export function rows(name) {
+  const revision = revisions[name]
+  const cached = sortedCache[name]
+  if (cached && cached.revision === revision) return cached.rows
+  const sorted = [...tables[name].values()].sort((a, b) => a.id - b.id)
+  sortedCache[name] = { revision, rows: sorted }
+  return sorted
+}
+
+export function byId(name, id) {
+  void revisions[name]
+  return tables[name].get(id)
+}
+
+export function setLocal(name, row) {
+  tables[name].set(row.id, Object.freeze({ ...tables[name].get(row.id), ...row }))
+  touch(name)
+}
+
+export function removeLocal(name, id) {
+  if (tables[name].delete(id)) touch(name)
+}
+
+// on logout: nothing of the previous session stays in the browser
+export async function clear() {
+  if (unsubscribe) unsubscribe()
+  unsubscribe = null
+  started = null
+  cursor = null
+  for (const name of TABLES) {
+    tables[name].clear()
+    touch(name)
+  }
+  const db = await openDb()
+  if (db) {
+    const tx = db.transaction([...TABLES, 'meta'], 'readwrite')
+    for (const name of [...TABLES, 'meta']) tx.objectStore(name).clear()
+    await done(tx)
+  }
+}